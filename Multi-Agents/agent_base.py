@@ -4,15 +4,20 @@
 from typing import Any, Dict, List, Optional, Callable
 from transitions import State
 from transitions.extensions.markup import MarkupMachine as Machine
+from src.core.state_machine import CompiledMachine, STATE_INDEX_ATTR
 from mediator import Mediator, Agent
 from utils.logger import setup_logger, DIALOGUE_LOG_LEVEL
 from utils.chat_session import ChatSession
 from colorama import Fore, Style, init
 from src.config import get_config_manager
+import threading
 import time
 
 init(autoreset=True)
 
+# 提示布局：inline 为模板原样；prefix 把静态指令移到系统消息之后（prompt_prefix_<role>.j2），每次调用只发送可变内容
+PROMPT_LAYOUTS = ("inline", "prefix")
+
 class BaseAgent(Agent):
     """兼容的智能体基类"""
     
@@ -27,6 +32,8 @@ class BaseAgent(Agent):
     MSG_TYPE_DESIGN_REQUEST = "design_request"
     MSG_TYPE_COMPILATION_ERROR = "compilation_error"
     MSG_TYPE_SIMULATION_ERROR = "simulation_error"
+    MSG_TYPE_SIMULATE_CANDIDATES = "simulate_candidates"
+    MSG_TYPE_CANDIDATE_RESULTS = "candidate_results"
     
     def __init__(self, name: str, mediator: Mediator, config: Dict[str, Any], role: str = "agent"):
         """初始化基础智能体"""
@@ -46,11 +53,19 @@ class BaseAgent(Agent):
             f"You are a helpful {name} assistant."
         )
         
+        # prefix 布局下系统消息 + 静态指令构成字节稳定的前缀，可被提供方的提示缓存复用
+        self.prompt_layout = config.experiments.prompt_layout
+        if self.prompt_layout not in PROMPT_LAYOUTS:
+            raise ValueError(f"Unknown prompt layout: {self.prompt_layout}, expected one of {PROMPT_LAYOUTS}")
+        if self.prompt_layout == "prefix":
+            self.system_message = self._build_prompt_prefix(self.system_message)
+        
         # 初始化聊天会话
         self.session = ChatSession(
             config=config, 
             system_message=self.system_message, 
-            role=role
+            role=role,
+            agent=self
         )
         
         # 消息处理器映射
@@ -122,11 +137,21 @@ class BaseAgent(Agent):
         else:
             self._log("warning", f"No handler for message type: {msg_type}")
     
+    def _build_prompt_prefix(self, system_message: str) -> str:
+        """系统消息之后追加该角色的静态指令模板（没有对应模板时保持原样）"""
+        template_name = f"prompt_prefix_{self.role}.j2"
+        if not self.template_engine.template_exists(template_name):
+            return system_message
+        static_instructions = self.template_engine.get_template(template_name).render().strip()
+        return f"{system_message.rstrip()}\n\n{static_instructions}"
+    
     def _render_template(self, template_name: str, **kwargs) -> str:
-        """渲染模板"""
+        """渲染模板（prefix 布局下模板省略已放入系统消息的静态指令）"""
+        kwargs.setdefault("static_prefix", self.prompt_layout == "prefix")
         try:
-            template = self.template_env.get_template(template_name)
+            template = self.template_engine.get_template(template_name)
             rendered = template.render(**kwargs)
+            self.session.prompt_template = template_name
             self._log_dialogue(f"Rendered template {template_name}")
             return rendered
         except Exception as e:
@@ -157,6 +182,10 @@ class BaseAgent(Agent):
             if system_message:
                 self.session.system_message = original_system_message
     
+    def reset_session(self):
+        """重置会话状态（智能体被 AgentPool 复用于下一个实验前调用）"""
+        self.session.reset_session()
+    
     def update_configuration(self):
         """更新智能体配置"""
         self.agent_config = self.config_manager.get_agent_config(self.name)
@@ -167,20 +196,28 @@ class BaseAgent(Agent):
 class StateMachineAgent(BaseAgent):
     """兼容的状态机智能体基类"""
     
+    # 状态进入回调 {状态名: 方法名}，只在共享状态机创建时注册一次
+    state_callbacks: Dict[str, str] = {}
+    
+    # 同一智能体类的所有实例共享一个状态机，各实例作为 model 加入
+    _shared_machines: Dict[type, Any] = {}
+    _shared_machines_lock = threading.Lock()
+    
+    # 状态名 <-> 编号，实例上只保存状态编号（由共享状态机创建时设置）
+    _state_names: tuple = ()
+    _state_ids: Dict[str, int] = {}
+    
     def __init__(self, name: str, mediator: Mediator, config: Dict[str, Any], 
                  states: List[State], transitions: List[Dict[str, Any]], 
                  initial_state: str = 'idle', role: str = "agent"):
         """初始化状态机智能体"""
         super().__init__(name, mediator, config, role)
+        self.initial_state = initial_state
         
         try:
-            self.machine = Machine(
-                model=self, 
-                states=states, 
-                transitions=transitions,
-                initial=initial_state,
-                name=f"{name}SM"
-            )
+            backend = getattr(self.agent_config, 'state_machine', 'compiled')
+            self.machine = self._get_shared_machine(name, states, transitions, initial_state, backend)
+            self.machine.add_model(self, initial=initial_state)
             
             self._log("info", f"Initialized state machine with states: {[s.name for s in states]}")
             self._log("info", f"Current state: {self.state}")
@@ -189,6 +226,64 @@ class StateMachineAgent(BaseAgent):
             self._log("error", f"Failed to initialize state machine: {e}")
             raise
     
+    @property
+    def state(self) -> str:
+        """当前状态名"""
+        return self._state_names[getattr(self, STATE_INDEX_ATTR)]
+    
+    @state.setter
+    def state(self, value: str):
+        setattr(self, STATE_INDEX_ATTR, self._state_ids[value])
+    
+    @classmethod
+    def _get_shared_machine(cls, name: str, states: List[State], 
+                            transitions: List[Dict[str, Any]], initial_state: str,
+                            backend: str = 'compiled'):
+        """
+        获取（或创建）该智能体类的共享状态机。
+        backend 为 'compiled' 时使用查表式 CompiledMachine（触发器定义在类上，markup 按需生成）；
+        为 'markup' 时使用 transitions 的 MarkupMachine。
+        """
+        with cls._shared_machines_lock:
+            machine = cls._shared_machines.get(cls)
+            if machine is None:
+                cls._state_names = tuple(s.name for s in states)
+                cls._state_ids = {state_name: i for i, state_name in enumerate(cls._state_names)}
+                
+                if backend == 'markup':
+                    machine = Machine(
+                        model=None, 
+                        states=states, 
+                        transitions=transitions,
+                        initial=initial_state,
+                        name=f"{name}SM"
+                    )
+                    for state_name, callback in cls.state_callbacks.items():
+                        machine.get_state(state_name).add_callback('enter', callback)
+                elif backend == 'compiled':
+                    machine = CompiledMachine(
+                        cls,
+                        states=states,
+                        transitions=transitions,
+                        initial=initial_state,
+                        name=f"{name}SM",
+                        state_callbacks=cls.state_callbacks
+                    )
+                    machine.install_triggers()
+                else:
+                    raise ValueError(f"Unknown state machine backend: {backend}")
+                cls._shared_machines[cls] = machine
+            return machine
+    
+    def reset_session(self):
+        """重置会话状态并回到初始状态"""
+        super().reset_session()
+        self.machine.set_state(self.initial_state, model=self)
+    
+    def release_machine(self):
+        """从共享状态机中移除该实例（智能体不再使用时调用）"""
+        self.machine.remove_model(self)
+    
     def get_state_info(self) -> Dict[str, Any]:
         """获取状态机信息"""
         available_triggers = []
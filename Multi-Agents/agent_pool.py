@@ -0,0 +1,84 @@
+# agent_pool.py - 可复用的智能体池
+"""按运行复用的智能体集合：每个实验只切换会话，不再重新构建 Mediator 和智能体"""
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+from mediator import Mediator
+from utils.logger import setup_logger
+
+@dataclass
+class AgentSet:
+    """一组协作的智能体及其 Mediator（同一时间只服务一个实验）"""
+    mediator: Mediator
+    agents: Dict[str, Any]
+    experiments_served: int = 0
+
+    def begin_experiment(self, session_id: str, experiment_name: str, rag_tool=None):
+        """为新实验切换会话、重置智能体状态并绑定本次实验的RAG系统"""
+        self.mediator.open_session(session_id)
+        for agent in self.agents.values():
+            agent.reset_session()
+            agent.current_experiment = experiment_name
+            if hasattr(agent, "set_rag_tool"):
+                agent.set_rag_tool(rag_tool)
+        self.experiments_served += 1
+
+    def end_experiment(self):
+        """释放本次实验的会话状态"""
+        self.mediator.close_session()
+
+    def release(self):
+        """智能体集合被丢弃时，从共享状态机中移除各智能体"""
+        for agent in self.agents.values():
+            if hasattr(agent, "release_machine"):
+                agent.release_machine()
+
+class AgentPool:
+    """
+    智能体池：按需通过 factory 创建 AgentSet，实验结束后归还复用。
+    并行运行时每个工作线程占用一个 AgentSet，空闲集合最多保留 max_idle 个。
+    """
+
+    def __init__(self, factory: Callable[[], Dict[str, Any]], max_idle: int = 4):
+        self.factory = factory
+        self.max_idle = max_idle
+        self._idle: List[AgentSet] = []
+        self._lock = threading.Lock()
+        self.logger = setup_logger("AgentPool")
+        self.stats = {"created": 0, "reused": 0, "discarded": 0}
+
+    def acquire(self, session_id: str, experiment_name: str, rag_tool=None) -> AgentSet:
+        """获取一个空闲的 AgentSet（没有则新建），并切换到指定实验的会话"""
+        with self._lock:
+            agent_set = self._idle.pop() if self._idle else None
+            if agent_set is not None:
+                self.stats["reused"] += 1
+
+        if agent_set is None:
+            agents = self.factory()
+            mediator = next(iter(agents.values())).mediator
+            agent_set = AgentSet(mediator=mediator, agents=agents)
+            with self._lock:
+                self.stats["created"] += 1
+            self.logger.debug(f"Created new agent set for {experiment_name}")
+
+        agent_set.begin_experiment(session_id, experiment_name, rag_tool)
+        return agent_set
+
+    def release(self, agent_set: AgentSet):
+        """实验结束后归还 AgentSet"""
+        agent_set.end_experiment()
+        # 超时后仍有处理器在后台执行的集合不能复用，否则会改写下一个实验的状态
+        reusable = not agent_set.mediator.has_running_handlers()
+        with self._lock:
+            if reusable and len(self._idle) < self.max_idle:
+                self._idle.append(agent_set)
+                return
+            self.stats["discarded"] += 1
+        agent_set.release()
+
+    def get_pool_stats(self) -> Dict[str, int]:
+        """获取池统计信息"""
+        with self._lock:
+            return {"idle_sets": len(self._idle), "max_idle": self.max_idle, **self.stats}
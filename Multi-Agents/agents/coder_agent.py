@@ -1,16 +1,19 @@
 # agents/coder_agent_optimized.py - 优化版CoderAgent示例
 """优化的CoderAgent实现"""
 
-import re
 import json
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from transitions import State
 from agent_base import StateMachineAgent
 from mediator import Mediator
-from utils.utils import extract_code_blocks, clean_code_block
-from utils.retry_strategy import get_retry_strategy, RetryErrorType, retry_on_error
+from utils.utils import extract_last_code_block, clean_code_block, read_text_file
+from utils.design_analysis import (
+    DesignAnalysis, DESIGN_ANALYSIS_PROMPT, DESIGN_ANALYSIS_SYSTEM_MESSAGE,
+    design_analysis_key, get_design_analysis_cache
+)
+from utils.verilog_lint import lint_verilog, expected_module_name
 from utils.metrics import get_metrics_collector
-from src.core.exceptions import AgentError, ValidationError, LLMAPIError, handle_errors
+from src.core.exceptions import AgentError, ValidationError, handle_errors
 from src.config import get_config_manager
 
 class CoderAgent(StateMachineAgent):
@@ -42,6 +45,16 @@ class CoderAgent(StateMachineAgent):
         {'trigger': 'stop', 'source': '*', 'dest': 'stopped'}
     ]
 
+    # 状态机钩子
+    state_callbacks = {
+        'generating_code': 'generate_code_action',
+        'handling_error': 'handle_error_action',
+        'reviewing_feedback': 'handle_review_feedback_action',
+        'failure': 'on_enter_failure',
+        'stopped': 'on_enter_stopped',
+        'running_simulation': 'run_simulation_action'
+    }
+
     def __init__(self, name: str, mediator: Mediator, config, rag_tool, dff_file_path: str = './agents/dff.v'):
         super().__init__(
             name=name, 
@@ -57,42 +70,53 @@ class CoderAgent(StateMachineAgent):
         self.config_manager = get_config_manager()
         self.agent_config = self.config_manager.get_agent_config("CoderAgent")
         self.metrics = get_metrics_collector()
-        self.retry_strategy = get_retry_strategy()
-        
-        # 设置状态机钩子
-        self.machine.on_enter_generating_code('generate_code_action')
-        self.machine.on_enter_handling_error('handle_error_action')
-        self.machine.on_enter_reviewing_feedback('handle_review_feedback_action')
-        self.machine.on_enter_failure('on_enter_failure')
-        self.machine.on_enter_stopped('on_enter_stopped')
-        self.machine.on_enter_running_simulation('run_simulation_action')
+        self.analysis_cache = get_design_analysis_cache()
         
         # 注册消息处理器
         self.register_message_handlers()
         
         # 初始化组件
-        self.RAG = rag_tool
-        self.RAG_Enable = config.rag.enabled if rag_tool else False
-        self.retry_count = 0
+        self.set_rag_tool(rag_tool)
         self.max_internal_iterations = self.agent_config.max_retry_attempts
         
         # 加载DFF模块代码
         self.dff_module_code = self._load_dff_module(dff_file_path)
         
+        self._reset_generation_state()
+    
+    def _reset_generation_state(self):
+        """重置与单个实验相关的状态"""
+        self.retry_count = 0
+        self.required_components = []
+        self.pending_candidates = None  # 已交给Executor仿真、等待结果的推测候选
+        
         # 代码生成统计
         self.generation_stats = {
             "total_attempts": 0,
             "successful_generations": 0,
             "dff_analyses_performed": 0,
+            "analysis_cache_hits": 0,
+            "speculative_rounds": 0,
+            "speculative_wins": 0,
+            "lint_rejected_candidates": 0,
             "rag_queries": 0
         }
     
+    def reset_session(self):
+        """复用前重置会话、状态机和生成状态"""
+        super().reset_session()
+        self._reset_generation_state()
+    
+    def set_rag_tool(self, rag_tool):
+        """设置当前实验使用的RAG系统"""
+        self.RAG = rag_tool
+        self.RAG_Enable = self.app_config.rag.enabled if rag_tool else False
+    
     @handle_errors(default_return="")
     def _load_dff_module(self, dff_file_path: str) -> str:
         """加载DFF模块代码"""
         try:
-            with open(dff_file_path, 'r') as f:
-                return f.read()
+            return read_text_file(dff_file_path)
         except FileNotFoundError:
             self._log("warning", f"DFF module file not found: {dff_file_path}")
             return ""
@@ -108,7 +132,8 @@ class CoderAgent(StateMachineAgent):
             self.MSG_TYPE_CODE_FEEDBACK: self._handle_code_feedback,
             self.MSG_TYPE_EXECUTION_SUCCESS: self._handle_execution_success,
             self.MSG_TYPE_SIMULATION_TIMEOUT: self._handle_simulation_timeout,
-            self.MSG_TYPE_STOP_COMMAND: self._handle_stop_command
+            self.MSG_TYPE_STOP_COMMAND: self._handle_stop_command,
+            self.MSG_TYPE_CANDIDATE_RESULTS: self._handle_candidate_results
         }
         
         for msg_type, handler in handlers.items():
@@ -140,20 +165,14 @@ class CoderAgent(StateMachineAgent):
         if not design_requirements:
             raise ValidationError("No design requirements found")
         
-        # 分析DFF需求
+        # 预分析（DFF需求 + 所需组件），每个实验只做一次
         if not self.session.analyzed_dff_need:
-            analysis = self.analyze_design_requirements(design_requirements)
-            self.required_components = self.retrieve_data(design_requirements)
-            self.session.dff_analysis_result = analysis
+            design_analysis = self.analyze_design(design_requirements)
+            self.required_components = design_analysis.required_components
+            self.session.dff_analysis_result = design_analysis.dff_result
             self.session.analyzed_dff_need = True
             self.generation_stats["dff_analyses_performed"] += 1
-        else:
-            analysis = self.session.dff_analysis_result
-
-        # 处理分析结果
-        if isinstance(analysis, list):
-            self._log("warning", f"Analysis returned as list: {analysis}")
-            analysis = analysis[0] if analysis else {"needs_flip_flop": False}
+        analysis = self.session.dff_analysis_result
 
         # RAG检索
         retrieved_results = None
@@ -172,14 +191,14 @@ class CoderAgent(StateMachineAgent):
             retrieved_results=retrieved_results
         )
         
-        # 使用重试策略生成代码
+        # 推测模式：并发生成多个候选并并行仿真，第一个通过的候选胜出
+        candidate_count = self.app_config.experiments.speculative_candidates
+        if candidate_count > 1 and self._generate_speculative(prompt_content, design_requirements, analysis, candidate_count):
+            return
+        
+        # 生成代码（ChatSession 内部已按重试策略重试 LLM 调用）
         try:
-            response_text = self.retry_strategy.execute_with_retry(
-                lambda: self.session.get_response(custom_prompt=prompt_content),
-                RetryErrorType.LLM_API_ERROR,
-                "code_generation",
-                context={"agent": self.name, "retry_count": self.retry_count}
-            )
+            response_text = self.session.get_response(custom_prompt=prompt_content, stop_at_code_block=True)
             
             verilog_code = clean_code_block(self.parse_response(response_text))
             
@@ -285,73 +304,147 @@ class CoderAgent(StateMachineAgent):
         self.send_message(["UserProxy"], {"type": "agent_stopped"})
 
     # 业务逻辑方法
-    @retry_on_error(RetryErrorType.LLM_API_ERROR, "dff_analysis")
-    @handle_errors(default_return={"needs_flip_flop": False, "reason": "Analysis failed"})
-    def analyze_design_requirements(self, design_requirements: str) -> Dict[str, Any]:
-        """分析设计需求以确定是否需要D触发器"""
-        prompt = f"""
-Analyze the following Verilog design requirements and determine if a d flip-flop or register is needed.
-
-Design Requirements:
-{design_requirements}
-
-Respond in JSON format:
-{{"needs_flip_flop": true/false, "reason": "explanation"}}
-"""
+    def analyze_design(self, design_requirements: str) -> DesignAnalysis:
+        """
+        一次结构化调用同时分析DFF需求和所需组件；
+        结果按设计需求内容（提示文件）和模型的哈希缓存，重复运行同一题目时不再调用LLM。
+        """
+        model_name = self.config_manager.get_model_config().name
+        cache_key = design_analysis_key(design_requirements, model_name)
+        cached = self.analysis_cache.get(cache_key)
+        if cached is not None:
+            self._log("debug", f"Design analysis cache hit: {cached}")
+            self.generation_stats["analysis_cache_hits"] += 1
+            return cached
+        
         try:
-            model_config = self.config_manager.get_model_config()
-            
-            response = self.client.chat.completions.create(
-                model=model_config.name,
+            response_text = self.session.get_oneshot_response(
+                DESIGN_ANALYSIS_PROMPT.format(design_requirements=design_requirements),
+                system_message=DESIGN_ANALYSIS_SYSTEM_MESSAGE,
                 response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": "You are an expert hardware design assistant."},
-                    {"role": "user", "content": prompt}
-                ]
+                operation_name="design_analysis"
             )
-            
-            result = json.loads(response.choices[0].message.content.strip())
-            self._log("debug", f"DFF analysis result: {result}")
-            return result
-            
-        except json.JSONDecodeError as e:
-            raise ValidationError(f"Invalid JSON response from LLM: {e}")
-        except Exception as e:
-            raise LLMAPIError(f"Error analyzing design requirements: {e}")
+            analysis = DesignAnalysis.from_response(json.loads(response_text))
+        except (AgentError, ValueError) as e:
+            # 分析失败不缓存，按不需要DFF、无额外组件继续生成
+            self._log("error", f"Design analysis failed: {e}", error_type="analysis_error")
+            return DesignAnalysis(reason="Analysis failed")
+        
+        self._log("debug", f"Design analysis result: {analysis}")
+        self.analysis_cache.put(cache_key, analysis)
+        return analysis
+
+    def analyze_design_requirements(self, design_requirements: str) -> Dict[str, Any]:
+        """分析设计需求以确定是否需要D触发器"""
+        return self.analyze_design(design_requirements).dff_result
 
-    @handle_errors(default_return=[])
     def retrieve_data(self, design_requirements: str) -> List[str]:
         """检索所需组件数据"""
-        prompt = f"""
-Analyze the following digital circuit design requirements and determine which fundamental logic gates or components are needed.
-
-Design Requirements:
-{design_requirements}
-
-Respond in JSON format:
-{{
-"required_components": ["xor", "not", "and", "or", "mux", ...],
-"reason": "Explanation"
-}}
-"""
-        try:
-            model_config = self.config_manager.get_model_config()
-            
-            response = self.client.chat.completions.create(
-                model=model_config.name,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": "You are an expert hardware design assistant."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            result = json.loads(response.choices[0].message.content.strip())
-            return result.get("required_components", [])
-            
-        except Exception as e:
-            self._log("error", f"Error retrieving component data: {e}")
-            return []
+        return self.analyze_design(design_requirements).required_components
+
+    def _generate_speculative(self, prompt_content: str, design_requirements: str,
+                              analysis: Dict[str, Any], candidate_count: int) -> bool:
+        """
+        并发请求多个候选，以消息交给Executor并行仿真，结果由 _handle_candidate_results 处理：
+        有候选通过测试时直接作为已验证代码交给Reviewer，否则选择最有希望的候选（能编译的优先）进入常规审查修复流程。
+        没有得到任何有效候选时返回 False，由调用方回退到单候选生成。
+        """
+        responses = self.session.get_candidate_responses(
+            prompt_content,
+            candidate_count,
+            stop_at_code_block=True,
+            use_n=self.app_config.experiments.speculative_use_n
+        )
+        
+        # 解析并去重
+        candidates = []
+        seen = set()
+        for response_text in responses:
+            code = clean_code_block(self.parse_response(response_text))
+            if code.startswith("// Error") or code in seen:
+                continue
+            seen.add(code)
+            candidates.append((response_text, code))
+        if not candidates:
+            self._log("warning", "No valid candidates generated, falling back to single generation")
+            return False
+        
+        self.generation_stats["speculative_rounds"] += 1
+        
+        # 静态检查预过滤：违反结构化规则的候选不参与仿真；全部违反时选违反项最少的交给Reviewer修复
+        simulate = True
+        if self.app_config.experiments.static_lint:
+            top_module = expected_module_name(design_requirements)
+            issue_counts = [
+                len(lint_verilog(code, needs_flip_flop=bool(analysis.get("needs_flip_flop")), top_module=top_module).issues)
+                for _, code in candidates
+            ]
+            rejected = sum(1 for count in issue_counts if count)
+            self.generation_stats["lint_rejected_candidates"] += rejected
+            if rejected == len(candidates):
+                candidates = [candidates[issue_counts.index(min(issue_counts))]]
+                simulate = False
+            elif rejected:
+                candidates = [candidate for candidate, count in zip(candidates, issue_counts) if not count]
+            if rejected:
+                self._log("info", f"Static check rejected {rejected} candidate(s)")
+        
+        # 与Reviewer发送给Executor的代码一致：需要时附加DFF模块
+        needs_dff = analysis.get("needs_flip_flop") and self.dff_module_code
+        simulation_codes = [
+            code + "\n" + self.dff_module_code if needs_dff and "module d_flip_flop" not in code else code
+            for _, code in candidates
+        ]
+        
+        if simulate and "Executor" in self.mediator.agents:
+            self._log("info", f"Sending {len(candidates)} distinct candidates to Executor for parallel simulation")
+            self.pending_candidates = (candidates, design_requirements)
+            self.send_message(["Executor"], {
+                "type": self.MSG_TYPE_SIMULATE_CANDIDATES,
+                "candidates": simulation_codes
+            })
+        else:
+            self._finish_speculative(candidates, design_requirements, None)
+        return True
+
+    def _handle_candidate_results(self, message, sender=None):
+        """处理Executor返回的候选仿真结果"""
+        if self.pending_candidates is None:
+            self._log("warning", "Received candidate results without pending candidates, ignoring")
+            return
+        candidates, design_requirements = self.pending_candidates
+        self.pending_candidates = None
+        self._finish_speculative(candidates, design_requirements, message.get("outcome"))
+
+    def _finish_speculative(self, candidates: List[Tuple[str, str]], design_requirements: str,
+                            outcome: Optional[Dict[str, Any]]):
+        """按仿真结果选定候选并交给Reviewer（outcome 为 None 表示没有仿真）"""
+        winner = outcome["winner"] if outcome else None
+        chosen = winner if winner is not None else self._pick_fallback_candidate(outcome)
+        response_text, verilog_code = candidates[chosen]
+        
+        self.session.add_message("assistant", response_text)
+        self.session.last_generated_code = verilog_code
+        self.generation_stats["successful_generations"] += 1
+        
+        if winner is not None:
+            self.generation_stats["speculative_wins"] += 1
+            self._log("info", f"Candidate {winner + 1}/{len(candidates)} passed all tests")
+            self.send_code_to_reviewer(verilog_code, design_requirements,
+                                       verified_result=outcome["results"][winner]["output"])
+        else:
+            self._log("info", f"No candidate passed, continuing with candidate {chosen + 1}")
+            self.send_code_to_reviewer(verilog_code, design_requirements)
+
+    @staticmethod
+    def _pick_fallback_candidate(outcome: Optional[Dict[str, Any]]) -> int:
+        """没有候选通过时，优先选择能编译且未超时的候选"""
+        if not outcome:
+            return 0
+        for result in outcome["results"]:
+            if result and not result["is_compilation_error"] and not result["is_timeout"]:
+                return result["index"]
+        return 0
 
     @handle_errors(default_return="")
     def retrieve_rag_information(self, components: List[str]) -> str:
@@ -392,27 +485,29 @@ Respond in JSON format:
     @handle_errors(default_return="// Error: No code found")
     def parse_response(self, response_text: str) -> str:
         """解析LLM响应中的Verilog代码"""
-        code_blocks = extract_code_blocks(response_text)
-        if code_blocks:
-            code = code_blocks[-1].strip()
+        code = extract_last_code_block(response_text)
+        if code:
             self._log("debug", f"Extracted Verilog code: {len(code)} chars")
             return code
         
         self._log("error", "No Verilog code blocks found in response")
         return "// Error: No Verilog code blocks found."
 
-    def send_code_to_reviewer(self, verilog_code: str, design_requirements: str):
-        """发送代码到审查者"""
+    def send_code_to_reviewer(self, verilog_code: str, design_requirements: str, verified_result: str = None):
+        """发送代码到审查者（verified_result 为已通过仿真的代码的执行结果）"""
         dff_analysis = getattr(self.session, 'dff_analysis_result', {"needs_flip_flop": False})
         
         self._log("info", f"Sending code to Reviewer (attempt {self.retry_count + 1})")
-        self.send_message(["Reviewer"], {
+        message = {
             "type": self.MSG_TYPE_VERILOG_CODE,
             "content": verilog_code,
             "attempt_count": self.retry_count,
             "dff_analysis": dff_analysis,
             "design_requirements": design_requirements
-        })
+        }
+        if verified_result is not None:
+            message["verified_execution_result"] = verified_result
+        self.send_message(["Reviewer"], message)
 
     # 消息处理器
     @handle_errors()
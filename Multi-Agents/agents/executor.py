@@ -1,12 +1,17 @@
 # executor.py
 
 import os
-import re
-from subprocess import Popen, PIPE
-from typing import Any, Dict, List, Tuple
+import time
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from subprocess import Popen, PIPE, TimeoutExpired
+from typing import Any, Dict, List, Optional, Tuple
 from agent_base import BaseAgent
 from mediator import Mediator
 from utils.logger import setup_logger, DIALOGUE_LOG_LEVEL
+from utils.utils import extract_module_name, strip_code_fences
+from utils.metrics import get_metrics_collector
 from colorama import Fore, Style, init
 from src.config import get_config_manager
 
@@ -33,21 +38,57 @@ class Executor(BaseAgent):
         self.config_manager = get_config_manager()
         self.agent_config = self.config_manager.get_agent_config("Executor")
         self.app_config = config
+        self.metrics = get_metrics_collector()
         
         # Register message handlers
         self.register_message_handler(self.MSG_TYPE_VERILOG_CODE, self._handle_verilog_code)
+        self.register_message_handler(self.MSG_TYPE_SIMULATE_CANDIDATES, self._handle_simulate_candidates)
         
         # Initialize agent-specific attributes using new config
-        self.retry_count = 0
-        self.expecting_review_feedback = False
-        self.current_code = ""
+        self._reset_execution_state()
         self.max_retry_attempts = self.agent_config.max_retry_attempts
         
         # Get timeout from agent config if available, otherwise use default
         timeout_val = getattr(self.agent_config, 'timeout', 2)
         self.timeout = timeout_val if timeout_val is not None else 2
     
-    def compile_and_simulate(self, verilog_file: str, testbench_file: str, reference_file: str, project_path: str) -> Tuple[bool, str, bool, bool]:
+    def _reset_execution_state(self):
+        """Reset the per-experiment execution state."""
+        self.retry_count = 0
+        self.expecting_review_feedback = False
+        self.current_code = ""
+    
+    def reset_session(self):
+        """Reset the chat session and execution state before reuse."""
+        super().reset_session()
+        self._reset_execution_state()
+    
+    def _run_command(self, cmd: str, cancel_event: Optional[threading.Event] = None) -> Tuple[Optional[int], bytes, bytes]:
+        """
+        Run a shell command and wait for it.
+        If cancel_event is set while the command runs, its whole process group is killed
+        and the return code is None.
+        """
+        proc = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE, start_new_session=cancel_event is not None)
+        if cancel_event is None:
+            out, err = proc.communicate()
+            return proc.returncode, out, err
+        
+        while True:
+            try:
+                out, err = proc.communicate(timeout=0.05)
+                return proc.returncode, out, err
+            except TimeoutExpired:
+                if cancel_event.is_set():
+                    try:
+                        os.killpg(proc.pid, signal.SIGKILL)
+                    except (ProcessLookupError, AttributeError):
+                        proc.kill()
+                    out, err = proc.communicate()
+                    return None, out, err
+    
+    def compile_and_simulate(self, verilog_file: str, testbench_file: str, reference_file: str, project_path: str,
+                             cancel_event: Optional[threading.Event] = None) -> Tuple[bool, str, bool, bool]:
         """
         Compile and simulate Verilog code.
         
@@ -56,6 +97,7 @@ class Executor(BaseAgent):
             testbench_file: Path to the testbench file
             reference_file: Path to the reference file
             project_path: Path to the project directory
+            cancel_event: Optional event; when set, the running compile/simulation is killed
             
         Returns:
             Tuple containing:
@@ -68,40 +110,123 @@ class Executor(BaseAgent):
         compile_cmd = f"iverilog -o {project_path}/output.vvp {verilog_file} {testbench_file} {reference_file}"
         self._log_dialogue(f"Compilation command: {compile_cmd}")
         
-        proc = Popen(compile_cmd, shell=True, stdout=PIPE, stderr=PIPE)
-        out, err = proc.communicate()
+        started = time.perf_counter()
+        returncode, out, err = self._run_command(compile_cmd, cancel_event)
+        if returncode is None:
+            return False, "Cancelled.", False, False
+        self.metrics.record_compilation(self.current_experiment, success=returncode == 0,
+                                        duration=time.perf_counter() - started)
         
-        if proc.returncode != 0:
+        if returncode != 0:
             self._log_dialogue(f"Compilation failed.\nSTDOUT:\n{out.decode()}\nSTDERR:\n{err.decode()}")
             return False, err.decode(), False, True
 
         # Run the simulation with a timeout
         timeout_sec = self.timeout
-        run_cmd = f"timeout {timeout_sec}s vvp {project_path}/output.vvp"
+        # --foreground keeps vvp in our process group so a cancelled run can be killed as a whole
+        foreground = "--foreground " if cancel_event is not None else ""
+        run_cmd = f"timeout {foreground}{timeout_sec}s vvp {project_path}/output.vvp"
         self._log_dialogue(f"Run command (with timeout): {run_cmd}")
         
-        proc2 = Popen(run_cmd, shell=True, stdout=PIPE, stderr=PIPE)
-        out2, err2 = proc2.communicate()
+        started = time.perf_counter()
+        returncode, out2, err2 = self._run_command(run_cmd, cancel_event)
+        if returncode is None:
+            return False, "Cancelled.", False, False
+        self.metrics.record_simulation(self.current_experiment, success=returncode == 0,
+                                       duration=time.perf_counter() - started, timeout=returncode == 124)
 
         stdout_output = out2.decode()
         stderr_output = err2.decode()
 
         # Handle different simulation outcomes
-        if proc2.returncode == 124:  # Timeout code
+        if returncode == 124:  # Timeout code
             error_message = f"Simulation timed out after {timeout_sec} seconds."
             self._log_dialogue(f"{error_message}\nSTDOUT:\n{stdout_output}\nSTDERR:\n{stderr_output}")
             return False, error_message, True, False
-        elif proc2.returncode != 0:
+        elif returncode != 0:
             self._log_dialogue(f"Simulation failed.\nSTDOUT:\n{stdout_output}\nSTDERR:\n{stderr_output}")
             return False, stderr_output, False, False
 
         self._log_dialogue(f"Simulation successful.\nSTDOUT:\n{stdout_output}")
         return True, stdout_output, False, False
     
+    def simulate_candidates(self, codes: List[str]) -> Dict[str, Any]:
+        """
+        Compile and simulate several candidate implementations in parallel.
+        
+        Each candidate runs in its own directory (<verilog_dir>/candidates/candidate_<i>).
+        As soon as one candidate passes all tests the others are cancelled.
+        
+        Args:
+            codes: Candidate Verilog sources
+            
+        Returns:
+            Dict with "winner" (index of the passing candidate or None) and "results",
+            a list of per-candidate dicts (index, success, passed, output, is_timeout,
+            is_compilation_error, cancelled), in candidate order.
+        """
+        project_path = self.app_config.experiments.verilog_dir
+        testbench_file = self.app_config.experiments.testbench_path
+        reference_file = self.app_config.experiments.reference_code_path
+        if not project_path:
+            raise ValueError("Verilog directory not configured")
+        for label, path in (("Testbench", testbench_file), ("Reference Code", reference_file)):
+            if not path or not os.path.exists(path):
+                raise FileNotFoundError(f"{label} file not found: {path}")
+        
+        cancel_event = threading.Event()
+        
+        def run_candidate(index: int, code: str) -> Dict[str, Any]:
+            candidate_dir = os.path.join(project_path, "candidates", f"candidate_{index}")
+            os.makedirs(candidate_dir, exist_ok=True)
+            verilog_file_path = os.path.join(candidate_dir, f"{self.extract_module_name(code)}.v")
+            with open(verilog_file_path, "w") as vf:
+                vf.write(code)
+            
+            success, output, is_timeout, is_compilation_error = self.compile_and_simulate(
+                verilog_file_path, testbench_file, reference_file, candidate_dir, cancel_event
+            )
+            return {
+                "index": index,
+                "success": success,
+                "passed": success and "All tests passed" in output,
+                "output": output,
+                "is_timeout": is_timeout,
+                "is_compilation_error": is_compilation_error,
+                "cancelled": output == "Cancelled." and not success
+            }
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(codes)
+        winner = None
+        with ThreadPoolExecutor(max_workers=max(1, len(codes)), thread_name_prefix="candidate-sim") as pool:
+            futures = [pool.submit(run_candidate, i, code) for i, code in enumerate(codes)]
+            for future in as_completed(futures):
+                result = future.result()
+                results[result["index"]] = result
+                if result["passed"] and winner is None:
+                    winner = result["index"]
+                    cancel_event.set()
+        
+        self._log("info", f"Simulated {len(codes)} candidates, winner: {winner}")
+        return {"winner": winner, "results": results}
+    
+    def _handle_simulate_candidates(self, message, sender=None):
+        """Simulate speculative candidates and send the outcome back to the requesting agent."""
+        codes = message.get("candidates", [])
+        self._log("info", f"Executor simulating {len(codes)} candidates in parallel.")
+        try:
+            outcome = self.simulate_candidates(codes)
+        except (OSError, ValueError) as e:
+            self._log("warning", f"Parallel candidate simulation unavailable: {e}")
+            outcome = None
+        self.send_message([sender or "CoderAgent"], {
+            "type": self.MSG_TYPE_CANDIDATE_RESULTS,
+            "outcome": outcome
+        })
+    
     def extract_module_name(self, code: str) -> str:
         """Extract the module name from Verilog code."""
-        match = re.search(r"module\s+(\w+)", code)
-        return match.group(1) if match else "unknown_module"
+        return extract_module_name(code, default="unknown_module")
     
     def _handle_verilog_code(self, message, sender=None):
         """Handle a Verilog code message."""
@@ -114,7 +239,7 @@ class Executor(BaseAgent):
         # Extract and clean the code
         code = message.get("content", "")
         is_auto_correction = message.get("is_auto_correction", False)
-        code = re.sub(r'^\s*```\s*verilog\s*|^\s*```\s*|^\s*```|```\s*$', '', code, flags=re.MULTILINE).strip()
+        code = strip_code_fences(code)
         self.current_code = code
 
         # Save the Verilog file
@@ -1,12 +1,15 @@
 # reviewer.py
 
-import re
 import json
 from typing import Any, Dict, List, Optional, Tuple
 from transitions import State
 from agent_base import StateMachineAgent
 from mediator import Mediator
-from utils.utils import extract_code_blocks, clean_code_block
+from utils.utils import (
+    extract_last_code_block, extract_json_payload, extract_module_definition,
+    strip_code_fences, clean_code_block, read_text_file
+)
+from utils.verilog_lint import LintReport, lint_verilog, expected_module_name
 from utils.logger import setup_logger, DIALOGUE_LOG_LEVEL
 from colorama import Fore, Style, init
 from src.config import get_config_manager
@@ -46,6 +49,15 @@ class Reviewer(StateMachineAgent):
         {'trigger': 'restart_review', 'source': '*', 'dest': 'idle'}
     ]
     
+    # State machine hooks
+    state_callbacks = {
+        'initializing_review': 'on_enter_initializing_review',
+        'reviewing_code': 'on_enter_reviewing_code',
+        'executing_code': 'on_enter_executing_code',
+        'processing_results': 'on_enter_processing_results',
+        'complete': 'on_enter_complete'
+    }
+    
     def __init__(self, name: str, mediator: Mediator, config, rag_tool, dff_file_path: str = './agents/dff.v'):
         """
         Initialize the Reviewer agent.
@@ -71,21 +83,25 @@ class Reviewer(StateMachineAgent):
         self.config_manager = get_config_manager()
         self.agent_config = self.config_manager.get_agent_config("Reviewer")
         
-        # Set up state machine hooks
-        self.machine.on_enter_initializing_review('on_enter_initializing_review')
-        self.machine.on_enter_reviewing_code('on_enter_reviewing_code')
-        self.machine.on_enter_executing_code('on_enter_executing_code')
-        self.machine.on_enter_processing_results('on_enter_processing_results')
-        self.machine.on_enter_complete('on_enter_complete')
-        
         # Register message handlers
         self.register_message_handlers()
         
         # Initialize agent-specific attributes using new config
-        self.RAG = rag_tool
-        self.RAG_Enable = config.rag.enabled if rag_tool else False
-        self.auto_fix_attempts = 0
+        self.set_rag_tool(rag_tool)
         self.max_auto_fix_attempts = self.agent_config.max_auto_fix_attempts
+        self.static_lint = self.app_config.experiments.static_lint
+        self._reset_review_state()
+        
+        # Load the D flip-flop module code
+        try:
+            self.dff_module_code = read_text_file(dff_file_path)
+        except FileNotFoundError:
+            self._log("warning", f"DFF module file not found: {dff_file_path}")
+            self.dff_module_code = ""
+    
+    def _reset_review_state(self):
+        """Reset the per-experiment review state."""
+        self.auto_fix_attempts = 0
         self.current_code = ""
         self.previous_execution_result = ""
         self.structural_result = None
@@ -98,14 +114,19 @@ class Reviewer(StateMachineAgent):
         self.execution_success = False
         self.execution_code = ""
         self.is_timeout = False
-        
-        # Load the D flip-flop module code
-        try:
-            with open(dff_file_path, 'r') as f:
-                self.dff_module_code = f.read()
-        except FileNotFoundError:
-            self._log("warning", f"DFF module file not found: {dff_file_path}")
-            self.dff_module_code = ""
+        self.initial_code = ""
+        self.formatted_code = ""
+        self.formatted_code_simulated = False
+    
+    def reset_session(self):
+        """Reset the chat session, state machine and review state before reuse."""
+        super().reset_session()
+        self._reset_review_state()
+    
+    def set_rag_tool(self, rag_tool):
+        """Set the RAG system used for the current experiment."""
+        self.RAG = rag_tool
+        self.RAG_Enable = self.app_config.rag.enabled if rag_tool else False
     
     def register_message_handlers(self):
         """Register handlers for different message types."""
@@ -120,10 +141,36 @@ class Reviewer(StateMachineAgent):
     
     # State machine action methods
     def on_enter_initializing_review(self):
-        """Action when entering initializing_review state."""
+        """
+        Action when entering initializing_review state.
+        The received code is sent to the Executor first, so the simulation runs while the
+        LLM format check is in progress; the two results are merged in _merge_initial_results.
+        With static checks enabled, code that passes them skips the format check, and code
+        that violates the rules is not simulated.
+        """
         self._log("info", "Entering initializing_review state.")
-        self.current_code = self._correct_format()
-        self._send_code_to_executor(self.current_code, False, self.needs_review)
+        self.initial_code = self.current_code
+        self.formatted_code_simulated = False
+        
+        report = self._lint_code(self.initial_code)
+        if report is None:
+            self._send_code_to_executor(self.initial_code, False, self.needs_review)
+            self.formatted_code = self._correct_format()
+            return
+        
+        if report.passed:
+            self.formatted_code = self.initial_code
+            self._send_code_to_executor(self.initial_code, False, self.needs_review)
+            return
+        
+        self.formatted_code = self._correct_format(report)
+        self.current_code = self.formatted_code
+        formatted_report = self._lint_code(self.formatted_code)
+        if formatted_report.passed:
+            self.formatted_code_simulated = True
+            self._send_code_to_executor(self.formatted_code, False, self.needs_review)
+        elif self._reject_by_lint(formatted_report):
+            self.init_complete()
         
     def on_enter_reviewing_code(self, attempt_num=None, error_type=None):
         """Action when entering reviewing_code state."""
@@ -131,28 +178,30 @@ class Reviewer(StateMachineAgent):
         attempt_num = attempt_num if attempt_num is not None else self.auto_fix_attempts
         error_type = error_type if error_type is not None else self.error_type
         
-        output_json_format = attempt_num >= self.max_auto_fix_attempts
-        review_result = self._review_code(
-            self.current_code, 
-            self.design_requirements, 
-            attempt_num, 
-            self.previous_execution_result, 
-            error_type, 
-            output_json_format
-        )
-        self._log("debug", f"output_json_format is {output_json_format}")
+        # JSON reviews that still need revision stay in reviewing_code for another attempt
+        while True:
+            output_json_format = attempt_num >= self.max_auto_fix_attempts
+            review_result = self._review_code(
+                self.current_code, 
+                self.design_requirements, 
+                attempt_num, 
+                self.previous_execution_result, 
+                error_type, 
+                output_json_format
+            )
+            self._log("debug", f"output_json_format is {output_json_format}")
 
-        if isinstance(review_result, dict):
-            self.structural_result = review_result
-            self.needs_review = review_result.get("needs_revision", False)
-            self._log("info", f"Review returned json result. Needs revision = {self.needs_review}")
-            
-            if self.needs_review:
-                if self.auto_fix_attempts < self.max_auto_fix_attempts:
-                    # Stay in reviewing_code state for another attempt
+            if isinstance(review_result, dict):
+                self.structural_result = review_result
+                self.needs_review = review_result.get("needs_revision", False)
+                self._log("info", f"Review returned json result. Needs revision = {self.needs_review}")
+                
+                if self.needs_review and self.auto_fix_attempts < self.max_auto_fix_attempts:
                     self.auto_fix_attempts += 1
-                    self.on_enter_reviewing_code(self.auto_fix_attempts, error_type)
-                else:
+                    attempt_num = self.auto_fix_attempts
+                    continue
+                
+                if self.needs_review:
                     self.send_feedback_to_coder(
                         self.structural_result, 
                         self.current_code, 
@@ -161,17 +210,26 @@ class Reviewer(StateMachineAgent):
                         feedback_reason="Max auto-fix attempts reached, sending feedback."
                     )
                     self.finish_review()
-            else:
+                else:
+                    self.previous_state_before_execute = 'reviewing_code'
+                    self.review_complete()
+            elif isinstance(review_result, str):
+                self.current_code = review_result
+                report = self._lint_code(review_result)
+                if report is not None and not report.passed:
+                    # Rule violations are fed back without running the simulation
+                    if self._reject_by_lint(report):
+                        attempt_num = self.auto_fix_attempts
+                        error_type = self.error_type
+                        continue
+                    return
                 self.previous_state_before_execute = 'reviewing_code'
+                self._log("info", "Review returned Verilog code, proceeding to execution.")
                 self.review_complete()
-        elif isinstance(review_result, str):
-            self.current_code = review_result
-            self.previous_state_before_execute = 'reviewing_code'
-            self._log("info", "Review returned Verilog code, proceeding to execution.")
-            self.review_complete()
-        else:
-            self._log("error", f"Unexpected review_code result type: {type(review_result)}")
-            self.finish_review()
+            else:
+                self._log("error", f"Unexpected review_code result type: {type(review_result)}")
+                self.finish_review()
+            return
         
     def on_enter_executing_code(self):
         """Action when entering executing_code state."""
@@ -191,7 +249,7 @@ class Reviewer(StateMachineAgent):
         if is_auto_correction:
             if success and "All tests passed" in execution_result:
                 self._log("info", "Automatic correction successful. Tests passed.")
-                cleaned_code = re.sub(r'^\s*```\s*verilog\s*|^\s*```\s*|^\s*```|```\s*$', '', code, flags=re.MULTILINE).strip()
+                cleaned_code = strip_code_fences(code)
                 self.send_message(["UserProxy"], {"type": "code_generation_successful", "content": cleaned_code})
                 self.finish_review()
             elif self.auto_fix_attempts >= self.max_auto_fix_attempts:
@@ -215,6 +273,75 @@ class Reviewer(StateMachineAgent):
             self._log("info", "Initial execution result processed.")
             self._handle_normal_execution_result(success, execution_result, None)
     
+    def _merge_initial_results(self, passed: bool, execution_result: str, error_type: str = None):
+        """
+        Merge the simulation of the received code with the LLM format check
+        (both finished by the time the Executor's message is handled).
+        """
+        if passed:
+            self.current_code = self.formatted_code if self.formatted_code_simulated else self.initial_code
+            self._log("info", "Code passed simulation.")
+            self._handle_normal_execution_result(True, execution_result, None)
+            return
+        
+        self.previous_execution_result = execution_result
+        self.error_type = error_type
+        
+        # The format check changed the code: simulate the corrected version before asking for fixes
+        formatted = self.formatted_code
+        if formatted and formatted != self.initial_code and not self.formatted_code_simulated:
+            self._log("info", "Received code failed, simulating the format-corrected code.")
+            self.formatted_code_simulated = True
+            self.current_code = formatted
+            self._send_code_to_executor(formatted, False, self.needs_review)
+            return
+        
+        if self.auto_fix_attempts >= self.max_auto_fix_attempts:
+            self._log("info", "Max auto-correction attempts reached. Finishing review.")
+            self.finish_review()
+            return
+        
+        self._log("info", f"Initial execution failed ({error_type}), transitioning to reviewing_code for auto-correction.")
+        self.auto_fix_attempts += 1
+        self.init_complete()
+    
+    def _lint_code(self, code: str) -> Optional[LintReport]:
+        """Run the local structural checks (None when disabled)."""
+        if not self.static_lint or not code:
+            return None
+        report = lint_verilog(
+            clean_code_block(code),
+            needs_flip_flop=self.dff_analysis_result.get('needs_flip_flop', False),
+            top_module=expected_module_name(self.design_requirements)
+        )
+        if not report.passed:
+            self._log("info", f"Static check found {len(report.issues)} issue(s):\n{report.format()}")
+        return report
+    
+    def _reject_by_lint(self, report: LintReport) -> bool:
+        """
+        Record static check violations as the result to fix.
+        Returns True when another auto-fix attempt should be made; otherwise the
+        feedback is sent to the CoderAgent and the review finishes.
+        """
+        self.structural_result = report.to_feedback()
+        self.previous_execution_result = self.structural_result["feedback"]
+        self.error_type = "lint_error"
+        
+        if self.auto_fix_attempts >= self.max_auto_fix_attempts:
+            self.send_feedback_to_coder(
+                self.structural_result, 
+                self.current_code, 
+                {"success": False, "execution_result": self.previous_execution_result}, 
+                needs_revision=True, 
+                feedback_reason="Static check failed, max auto-fix attempts reached."
+            )
+            self.finish_review()
+            return False
+        
+        self.auto_fix_attempts += 1
+        return True
+    
     def on_enter_complete(self):
         """Action when entering complete state."""
         self._log("info", "Review process complete.")
@@ -233,7 +360,7 @@ class Reviewer(StateMachineAgent):
                 feedback_reason="All checks passed."
             )
             self._log("info", "Session passed execution.")
-            cleaned_code = re.sub(r'^\s*```\s*verilog\s*|^\s*```\s*|^\s*```|```\s*$', '', self.current_code, flags=re.MULTILINE).strip()
+            cleaned_code = strip_code_fences(self.current_code)
             self.mediator.store_latest_code("Reviewer", "", cleaned_code)
             
             # Send the execution success message to Summarizer
@@ -268,8 +395,7 @@ class Reviewer(StateMachineAgent):
     def _clean_json_response(self, resp_text: str) -> Dict[str, Any]:
         """Clean and parse JSON response from LLM."""
         try:
-            cleaned_text = re.sub(r'^.*?({.*}).*$', r'\1', resp_text, flags=re.DOTALL).strip()
-            return json.loads(cleaned_text)
+            return json.loads(extract_json_payload(resp_text))
         except json.JSONDecodeError as e:
             self._log("warning", f"Failed to parse JSON response: {resp_text}. Error: {e}")
             return {
@@ -282,13 +408,8 @@ class Reviewer(StateMachineAgent):
             
     def _extract_last_verilog_code(self, resp_text: str) -> str:
         """Extract the last Verilog code block from the response text."""
-        pattern = re.compile(r"```verilog\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
-        matches = pattern.findall(resp_text)
-        
-        if matches:
-            code = matches[-1].strip()  # Extract the last matching code block
-        else:
-            code = ""
+        code = extract_last_code_block(resp_text)
+        if not code:
             self._log("warning", "No Verilog code block found in the input.")
         
         self._log("debug", f"Extracted code block: {code[:50]}...")
@@ -301,7 +422,7 @@ class Reviewer(StateMachineAgent):
             self._log("error", "Invalid or empty Verilog code received. Skipping execution.")
             return
             
-        cleaned_code = re.sub(r'^\s*```\s*verilog\s*|^\s*```\s*|^\s*```|```\s*$', '', code, flags=re.MULTILINE).strip()
+        cleaned_code = strip_code_fences(code)
         
         # Add DFF module if needed and not already present
         if self.dff_analysis_result['needs_flip_flop'] and "module d_flip_flop" not in cleaned_code:
@@ -314,8 +435,8 @@ class Reviewer(StateMachineAgent):
             "needs_revision": needs_revision
         })
         
-    def _correct_format(self) -> str:
-        """Correct the format of the Verilog code."""
+    def _correct_format(self, lint_report: Optional[LintReport] = None) -> str:
+        """Correct the format of the Verilog code (listing static check violations if any)."""
         template_name = "preview.j2" 
         
         # Check if DFF is needed
@@ -324,21 +445,20 @@ class Reviewer(StateMachineAgent):
             needs_flip_flop = self.dff_analysis_result.get('needs_flip_flop', False)
             
         # Extract module definition if it exists in the design requirements
-        module_pattern = re.compile(r"module\s+\w+\s*\([^;]*\);", re.DOTALL)
-        match = module_pattern.search(self.design_requirements)
-        module_definition = match.group(0) if match else ""
+        module_definition = extract_module_definition(self.design_requirements)
         
         # Render the template
         prompt = self._render_template(
             template_name,
             design_requirements=module_definition,
             code=self.current_code if self.current_code else "",
-            dff_module_code="\n" + self.dff_module_code if needs_flip_flop and "module d_flip_flop" not in (self.current_code or "") else None
+            dff_module_code="\n" + self.dff_module_code if needs_flip_flop and "module d_flip_flop" not in (self.current_code or "") else None,
+            static_check_report=lint_report.format() if lint_report and not lint_report.passed else None
         )
         
         self._log_llm_prompt(prompt)
         self.session.add_message("user", prompt)
-        raw = self.session.get_response()
+        raw = self.session.get_response(stop_at_code_block=True)
         self._log_llm_response(raw)
         
         extracted_verilog_code = clean_code_block(self._extract_last_verilog_code(raw))
@@ -393,7 +513,8 @@ class Reviewer(StateMachineAgent):
         review_focus = {
             "compilation_error": "compilation errors and structural Verilog syntax",
             "simulation_error": "simulation errors and functional/logical correctness",
-            "test_failure": "test failures and logical correctness"
+            "test_failure": "test failures and logical correctness",
+            "lint_error": "the structural rule violations reported by the static check"
         }.get(error_type, "general structural Verilog code quality")
         
         # Prepare the template and context
@@ -430,7 +551,7 @@ class Reviewer(StateMachineAgent):
             # Log the prompt and get the response
             self._log_llm_prompt(prompt)
             self.session.add_message("user", prompt)
-            raw = self.session.get_response()
+            raw = self.session.get_response(stop_at_code_block=not output_json_format)
             self._log_llm_response(raw)
             
             # Process the response based on expected format
@@ -484,6 +605,9 @@ class Reviewer(StateMachineAgent):
             "line": structural_result.get("line") if isinstance(structural_result, dict) and structural_result.get("needs_revision") else -1,
         }
         
+        if structural_result and isinstance(structural_result, dict) and structural_result.get("needs_revision"):
+            feedback_message["feedback"] = structural_result.get("feedback")
+            feedback_message["suggestion"] = structural_result.get("suggestion")
         if llm_output:
             feedback_message["llm_output"] = llm_output
         if code:
@@ -544,6 +668,14 @@ class Reviewer(StateMachineAgent):
             
         self.current_code = code
         
+        # Code that already passed simulation (speculative candidates) skips review and re-execution
+        verified_result = message.get("verified_execution_result")
+        if verified_result is not None:
+            self._log("info", "Received code that already passed simulation, finishing review.")
+            self.previous_execution_result = verified_result
+            self._handle_normal_execution_result(True, verified_result, None)
+            return
+        
         # Start the review process
         if self.state == 'idle':
             self.start_review()
@@ -559,6 +691,13 @@ class Reviewer(StateMachineAgent):
         self.is_auto_correction = result.get("is_auto_correction", False)
         self.is_timeout = result.get("is_timeout", False)
         
+        # Result of the initial simulation (ran concurrently with the format check)
+        if self.state == 'initializing_review':
+            passed = self.execution_success and "All tests passed" in self.previous_execution_result
+            self._merge_initial_results(passed, self.previous_execution_result,
+                                        None if passed else "test_failure")
+            return
+        
         # Move to processing results state
         if self.state == 'executing_code':
             self.execution_complete()
@@ -569,6 +708,12 @@ class Reviewer(StateMachineAgent):
         error_message = message.get("content", "")
         
         self._log("info", f"Received {msg_type}: {error_message}")
+        
+        # Failure of the initial simulation (ran concurrently with the format check)
+        if self.state == 'initializing_review':
+            self._merge_initial_results(False, error_message, msg_type)
+            return
+        
         self.previous_execution_result = error_message
         self.error_type = msg_type
         
@@ -597,7 +742,7 @@ class Reviewer(StateMachineAgent):
             # Emergency fallback - try to reset to a known state
             self._log("warning", "Using emergency transition to reviewing_code")
             # Force state change directly if transitions fail
-            self.machine.set_state('reviewing_code')
+            self.machine.set_state('reviewing_code', model=self)
             # Call the enter callback manually
             self.on_enter_reviewing_code()
             # If already in reviewing_code, the state machine will handle it
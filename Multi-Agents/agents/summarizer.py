@@ -3,9 +3,11 @@ import os
 from typing import Any, List, Dict
 from mediator import Mediator, Agent
 from colorama import Fore, Style, init
-from openai import OpenAI
 import json
 from utils.logger import setup_logger
+from utils.utils import extract_module_name
+from utils.kb_store import get_kb_store
+from utils.file_writer import get_file_writer
 from src.config import get_config_manager
 
 init(autoreset=True)
@@ -20,6 +22,7 @@ class Summarizer(Agent):
         self.config_manager = get_config_manager()
         self.agent_config = self.config_manager.get_agent_config("Summarizer")
         self.app_config = config
+        self.file_writer = get_file_writer()
         
         # Get system message from new config system
         system_messages = config.agent_system_messages
@@ -28,25 +31,21 @@ class Summarizer(Agent):
             "You are an experiment summarization assistant responsible for analyzing and summarizing the experimental process."
         )
         
-        # Initialize OpenAI client with current model configuration
-        model_config = self.config_manager.get_model_config()
-        self.client = OpenAI(
-            api_key=model_config.api_key, 
-            base_url=model_config.base_url
-        )
-        
         # Initialize tracking variables
+        self.reset_session()
+
+    def reset_session(self):
+        """Reset the per-experiment tracking state before reuse."""
         self.errors = []
         self.fixes = []
         self.feedbacks = []
         self.all_messages = []  # 用于存储所有消息
+        self.finalized = False
         
-        # Get output file path - use model-specific path
+        # Model-specific knowledge base (SQLite, exported to the legacy JSON when needed)
         model_name = self.config_manager.config.current_model
-        self.output_file = f"./knowledge_base/Model-incrementment/{model_name}.json"
-        
-        # Ensure output directory exists
-        os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
+        self.kb_store = get_kb_store(model_name)
+        self.output_file = self.kb_store.json_path
 
     def _log(self, level: str, message: str):
         getattr(self.logger, level)(message)
@@ -99,17 +98,11 @@ Please summarize this experiment using concise and clear language.
     def append_common_error_fix(self, error_msg: str, fix_msg: str):
         """Record common errors and fixes to a knowledge base file."""
         common_errors_file = "./knowledge_base/common_errors.md"
-        
-        if not os.path.exists(os.path.dirname(common_errors_file)):
-            os.makedirs(os.path.dirname(common_errors_file), exist_ok=True)
-        try:
-            with open(common_errors_file, "a", encoding="utf-8") as f:
-                f.write(f"## Experiment\n")
-                f.write(f"- **Error:** {error_msg}\n")
-                f.write(f"- **Fix:** {fix_msg}\n\n")
-            self._log("info", f"Common error and fix recorded in {common_errors_file}")
-        except Exception as e:
-            self._log("error", f"Failed to write to {common_errors_file}: {e}")
+        record = (f"## Experiment\n"
+                  f"- **Error:** {error_msg}\n"
+                  f"- **Fix:** {fix_msg}\n\n")
+        self.file_writer.append(common_errors_file, record)
+        self._log("info", f"Common error and fix queued for {common_errors_file}")
 
     def write_summary(self):
         """Write summary to the configured summary file."""
@@ -127,12 +120,8 @@ Please summarize this experiment using concise and clear language.
         ] + [f" - {msg}" for msg in self.all_messages]
         summary_str = "\n".join(lines) + "\n\n"
         
-        try:
-            with open(summary_file, "a", encoding='utf-8') as sf:
-                sf.write(summary_str)
-            self._log("info", f"Summarizer has written a brief summary to {summary_file}")
-        except Exception as e:
-            self._log("error", f"Error writing summary.txt: {e}")
+        self.file_writer.append(summary_file, summary_str)
+        self._log("info", f"Summarizer has queued a brief summary for {summary_file}")
 
     def write_llm_summary(self, summary: str):
         """Write LLM-generated summary to file."""
@@ -141,15 +130,9 @@ Please summarize this experiment using concise and clear language.
             self._log("warning", "No summary file configured")
             return
             
-        try:
-            llm_summary_file = os.path.join(os.path.dirname(summary_file), "llm_summary.txt")
-            with open(llm_summary_file, "w", encoding='utf-8') as f:
-                f.write("=== Experiment LLM Summary ===\n")
-                f.write(summary)
-                f.write("\n\n")
-            self._log("info", f"Summarizer has written the LLM summary to {llm_summary_file}")
-        except Exception as e:
-            self._log("error", f"Error writing LLM summary file: {e}")
+        llm_summary_file = os.path.join(os.path.dirname(summary_file), "llm_summary.txt")
+        self.file_writer.write(llm_summary_file, f"=== Experiment LLM Summary ===\n{summary}\n\n")
+        self._log("info", f"Summarizer has queued the LLM summary for {llm_summary_file}")
 
     def update_resolved_issues(self):
         """Update the resolved issues knowledge base."""
@@ -164,13 +147,8 @@ Please summarize this experiment using concise and clear language.
         add_str = "\n".join(lines) + "\n"
         
         kb_path = os.path.join("knowledge_base", "resolved_issues.md")
-        try:
-            os.makedirs(os.path.dirname(kb_path), exist_ok=True)
-            with open(kb_path, "a", encoding='utf-8') as kb:
-                kb.write(add_str)
-            self._log("info", f"Summarizer has appended the error-fix mapping to {kb_path}")
-        except Exception as e:
-            self._log("error", f"Error writing to resolved_issues.md: {e}")
+        self.file_writer.append(kb_path, add_str)
+        self._log("info", f"Summarizer has queued the error-fix mapping for {kb_path}")
 
     def receive_message(self, sender: str, message: Any):
         self._log("debug", f"Received message from {sender}: {message}")
@@ -212,6 +190,8 @@ Please summarize this experiment using concise and clear language.
     def finalize(self, success: bool, code: str, execution_result: str = None, design_requirements: str = "Unknown design requirements"):
         """Finalize the experiment and save results."""
         module_name = self._extract_module_name(code)
+        self.result = "success" if success else "failure"
+        self.final_msg = code
 
         # 构造总结字典
         summary_entry = {
@@ -224,16 +204,20 @@ Please summarize this experiment using concise and clear language.
             "tags": self._generate_tags(code, design_requirements)
         }
 
-        # 保存到 JSON 文件
+        # 保存到知识库
         self._save_to_json(summary_entry)
 
+        # 每个实验只写一次实验总结和错误-修复记录（由后台线程批量写入）
+        if not self.finalized:
+            self.finalized = True
+            self.write_summary()
+            self.update_resolved_issues()
+
         # 输出到控制台
         self._print_summary(success, code, execution_result)
 
     def _extract_module_name(self, code: str) -> str:
-        import re
-        match = re.search(r"module\s+(\w+)", code)
-        return match.group(1) if match else "unknown_module"
+        return extract_module_name(code, default="unknown_module")
 
     def _generate_design_features(self, code: str, design_requirements: str) -> List[str]:
         """Generate design features based on code analysis."""
@@ -264,32 +248,18 @@ Please summarize this experiment using concise and clear language.
         return tags
 
     def _save_to_json(self, entry: dict):
-        # 获取新条目的 module_name
+        """Append the entry to the model knowledge base (skipped if the module_name already exists)."""
         new_module_name = entry.get("module_name", "unknown_module")
+        try:
+            saved = self.kb_store.add(entry)
+        except Exception as e:
+            self._log("error", f"Failed to save module '{new_module_name}' to {self.kb_store.db_path}: {e}")
+            return
 
-        # 检查文件是否存在
-        if os.path.exists(self.output_file):
-            with open(self.output_file, "r") as f:
-                try:
-                    data = json.load(f)
-                    if not isinstance(data, list):
-                        data = [data]  # 如果文件内容不是列表，转换为列表
-                except json.JSONDecodeError:
-                    data = []  # 如果文件为空或格式错误，从空列表开始
+        if saved:
+            self._log("info", f"Summary for module '{new_module_name}' saved to {self.kb_store.db_path}")
         else:
-            data = []
-
-        # 检查是否已存在相同的 module_name
-        for existing_entry in data:
-            if existing_entry.get("module_name") == new_module_name:
-                self._log("info", f"Module '{new_module_name}' already exists in {self.output_file}. Skipping save.")
-                return  # 跳过保存操作
-
-        # 如果没有重复的 module_name，则追加新条目
-        data.append(entry)
-        with open(self.output_file, "w") as f:
-            json.dump(data, f, indent=4)
-        self._log("info", f"Summary for module '{new_module_name}' saved to {self.output_file}")
+            self._log("info", f"Module '{new_module_name}' already exists in {self.kb_store.db_path}. Skipping save.")
 
     def _print_summary(self, success: bool, code: str, execution_result: str):
         result = "success" if success else "failure"
@@ -12,9 +12,11 @@ from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 import argparse
 import time
+import uuid
 
 # 导入优化后的模块
 from mediator import Mediator
+from agent_pool import AgentPool
 from agents.user_proxy import UserProxy
 from agents.coder_agent import CoderAgent
 from agents.reviewer import Reviewer
@@ -23,8 +25,11 @@ from agents.summarizer import Summarizer
 from utils.logger import setup_logger, reset_logging_system
 from utils.RAG import RAGSystem
 from utils.metrics import get_metrics_collector, track_experiment
+from utils.metrics_export import create_exporters
 from utils.retry_strategy import get_retry_strategy
 from utils.llm_client_pool import get_llm_client_pool
+from utils.kb_store import get_kb_store
+from utils.file_writer import get_file_writer
 
 # 导入配置系统
 from src.config import get_config_manager, ConfigValidationError
@@ -42,6 +47,21 @@ class ExperimentRunner:
         self.logger = setup_logger("ExperimentRunner")
         self.shutdown_requested = False
         
+        # 指标后台汇总与导出
+        experiments = config_manager.config.experiments
+        exporters = create_exporters(
+            experiments.metrics_exporters,
+            experiments.metrics_export_dir or os.path.join(experiments.output_base_dir, "metrics"),
+            http_port=experiments.metrics_http_port
+        )
+        self.metrics.start_reporting(exporters, interval=experiments.metrics_aggregation_interval)
+        
+        # 智能体池：智能体按运行复用，每个实验只切换会话
+        self.agent_pool = AgentPool(
+            lambda: self.create_agents(self.config_manager.config, None),
+            max_idle=max_workers
+        )
+        
         # 注册信号处理器
         signal.signal(signal.SIGINT, self._handle_shutdown)
         signal.signal(signal.SIGTERM, self._handle_shutdown)
@@ -127,8 +147,11 @@ class ExperimentRunner:
                 "error_patterns": str(detail_kb_path / "error_patterns.json")
             }
             
-            # 模型数据路径
-            model_datapath = f"./knowledge_base/Model-incrementment/{config.current_model}.json"
+            # 模型数据路径（RAG 读取旧 JSON 格式，先从知识库导出最新条目）
+            kb_store = get_kb_store(config.current_model)
+            if kb_store.count():
+                kb_store.export_json()
+            model_datapath = kb_store.json_path
             
             rag_system = RAGSystem(
                 file_list,
@@ -158,6 +181,7 @@ class ExperimentRunner:
         if self.shutdown_requested:
             raise KeyboardInterrupt("Shutdown requested")
         
+        agent_set = None
         try:
             # 开始指标跟踪
             self.metrics.start_experiment(experiment_name)
@@ -172,8 +196,15 @@ class ExperimentRunner:
             # 初始化RAG
             rag_tool = self.initialize_rag_system()
             
-            # 创建智能体
-            agents = self.create_agents(config, rag_tool)
+            # 从智能体池获取智能体。会话 ID 包含模型名和随机后缀：输出目录名在不同模型之间重复，
+            # 而会话状态的溢写目录是共用的，只用目录名会恢复出别的模型（或上一次运行）的状态
+            session_id = f"{config.current_model}-{os.path.basename(experiment_info['output_dir'])}-{uuid.uuid4().hex[:8]}"
+            agent_set = self.agent_pool.acquire(
+                session_id=session_id,
+                experiment_name=experiment_name,
+                rag_tool=rag_tool
+            )
+            agents = agent_set.agents
             
             # 验证API密钥
             model_config = self.config_manager.get_model_config()
@@ -194,8 +225,9 @@ class ExperimentRunner:
             # 提交设计请求
             agents["user_proxy"].submit_design_request(design_requirements)
             
-            # 等待实验完成（这里可以实现更复杂的协调逻辑）
-            time.sleep(1)  # 简单等待，实际应该基于智能体状态
+            # 处理消息直到所有智能体邮箱为空（实验完成）或超过 run_timeout
+            if not agent_set.mediator.run_until_idle(config.experiments.run_timeout):
+                raise CircuitMindError(f"Experiment timed out after {config.experiments.run_timeout}s")
             
             result = {
                 "experiment_name": experiment_name,
@@ -217,9 +249,12 @@ class ExperimentRunner:
                 "error": str(e),
                 "output_dir": experiment_info.get("output_dir")
             }
+        finally:
+            if agent_set is not None:
+                self.agent_pool.release(agent_set)
     
     def create_agents(self, config, rag_tool) -> Dict[str, Any]:
-        """创建智能体"""
+        """创建智能体（由智能体池调用，每个并行工作线程只创建一次）"""
         # 使用依赖注入模式创建智能体
         mediator = Mediator()
         
@@ -232,8 +267,8 @@ class ExperimentRunner:
         }
         
         # 注册智能体到指标系统
-        for name, agent in agents.items():
-            self.metrics.record_agent_activity(name, "initialized", role=getattr(agent, 'role', 'unknown'))
+        for agent in agents.values():
+            self.metrics.record_agent_activity(agent.name, "initialized", role=getattr(agent, 'role', 'unknown'))
         
         return agents
     
@@ -311,15 +346,41 @@ class ExperimentRunner:
         system_stats = self.metrics.get_system_summary()
         print(f"\nSYSTEM METRICS:")
         print(f"Total LLM calls: {system_stats['total_llm_calls']}")
-        print(f"Total tokens: {system_stats['total_tokens']}")
+        print(f"Total tokens: {system_stats['total_tokens']} "
+              f"(prompt: {system_stats['prompt_tokens']}, completion: {system_stats['completion_tokens']}, "
+              f"cached: {system_stats['cached_tokens']})")
+        print(f"Total cost: ${system_stats['total_cost']:.4f}")
         print(f"Total errors: {system_stats['total_errors']}")
         print(f"Average experiment duration: {system_stats['average_experiment_duration']:.2f}s")
+        for name, latency in system_stats['latency'].items():
+            if latency['count']:
+                print(f"{name} latency p50/p95/p99: {latency['p50']:.2f}s/{latency['p95']:.2f}s/{latency['p99']:.2f}s "
+                      f"({latency['count']} samples)")
+        
+        # 打印各智能体 / 模板的LLM用量
+        llm_usage = self.metrics.get_llm_usage_summary()
+        for dimension in ("agent", "template"):
+            if not llm_usage[dimension]:
+                continue
+            print(f"\nLLM USAGE BY {dimension.upper()}:")
+            for key, usage in sorted(llm_usage[dimension].items(), key=lambda item: -item[1]["total_tokens"]):
+                print(f"{key}: {usage['calls']} calls, {usage['total_tokens']} tokens "
+                      f"(prompt: {usage['prompt_tokens']}, completion: {usage['completion_tokens']}, "
+                      f"cached: {usage['cached_tokens']}), ${usage['cost']:.4f}, "
+                      f"latency p50/p95: {usage['latency']['p50']:.2f}s/{usage['latency']['p95']:.2f}s")
         
         # 打印客户端池统计
         pool_stats = self.client_pool.get_pool_stats()
         print(f"\nLLM CLIENT POOL:")
         print(f"Active clients: {pool_stats['total_clients']}")
         print(f"Total usage: {pool_stats['total_usage']}")
+        print(f"HTTP requests: {pool_stats['http']['requests']} "
+              f"(open connections: {pool_stats['http']['open_connections']}, "
+              f"versions: {pool_stats['http']['http_versions']})")
+        for model_name, cache_stats in pool_stats['prompt_cache'].items():
+            print(f"Prompt cache [{model_name}]: {cache_stats['cached_tokens']}/{cache_stats['prompt_tokens']} "
+                  f"prompt tokens cached ({cache_stats['hit_rate']:.1%}, "
+                  f"{cache_stats['reported']}/{cache_stats['requests']} requests reported)")
         
         # 打印重试统计
         retry_stats = self.retry_strategy.get_strategy_stats()
@@ -327,6 +388,10 @@ class ExperimentRunner:
         print(f"Total retry attempts: {retry_stats['global_stats']['total_attempts']}")
         print(f"Successful retries: {retry_stats['global_stats']['successful_retries']}")
         print(f"Failed retries: {retry_stats['global_stats']['failed_retries']}")
+        print(f"Non-retryable errors: {retry_stats['global_stats']['non_retryable']}, "
+              f"retry budget exhausted: {retry_stats['global_stats']['budget_exhausted']}")
+        print(f"Hedged requests: {retry_stats['global_stats']['hedged_requests']} "
+              f"(won: {retry_stats['global_stats']['hedge_wins']})")
         
         print(f"{'='*60}\n")
 
@@ -343,7 +408,7 @@ async def main():
     """主函数"""
     parser = argparse.ArgumentParser(description="CircuitMind-Lite - Optimized Verilog Code Generation System")
     parser.add_argument("-m", "--model", help="Model name to use", default=None)
-    parser.add_argument("-k", "--key_index", type=int, help="Index of the API key to use", default=0)
+    parser.add_argument("-k", "--key_index", type=int, help="Index of the preferred API key (calls are balanced across all configured keys)", default=0)
     parser.add_argument("-r", "--root", type=str, help="Root directory for experiments", default=None)
     parser.add_argument("-t", "--target", action="append", help="Target experiment paths", default=[])
     parser.add_argument("-e", "--environment", type=str, help="Environment configuration", default="development")
@@ -357,6 +422,7 @@ async def main():
     if args.environment:
         os.environ["ENVIRONMENT"] = args.environment
     
+    runner = None
     try:
         # 初始化配置管理器
         config_manager = get_config_manager()
@@ -426,7 +492,8 @@ async def main():
             for exp_path in target_experiments:
                 env_info = runner.setup_environment(exp_path)
                 if env_info:
-                    result = runner.process_single_experiment(env_info)
+                    # Mediator 在实验线程中创建自己的事件循环，不能直接在 main() 的事件循环中运行
+                    result = await asyncio.to_thread(runner.process_single_experiment, env_info)
                     results.append(result)
         else:
             print(f"Running experiments in parallel with {max_workers} workers...")
@@ -435,6 +502,14 @@ async def main():
         # 打印摘要
         runner.print_summary(results)
         
+        # 写完后台队列中的总结记录
+        get_file_writer().flush()
+        
+        # 导出本次运行后的模型知识库（旧 JSON 格式）
+        kb_store = get_kb_store(config.current_model)
+        if kb_store.count():
+            kb_store.export_json()
+        
         print("All experiments completed successfully.")
         
     except ConfigValidationError as e:
@@ -451,6 +526,10 @@ async def main():
         print(f"Unexpected error: {e}")
         logging.exception("Unexpected error occurred")
         sys.exit(1)
+    finally:
+        # 停止指标汇总线程并写出最后一次快照（出错或中断时也保留已记录的指标）
+        if runner is not None:
+            runner.metrics.stop_reporting()
 
 if __name__ == "__main__":
     try:
@@ -1,52 +1,265 @@
 # mediator.py
-from typing import Any, Dict, List
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import uuid
+from typing import Any, Dict, List, Optional
 from utils.logger import setup_logger
-from openai import OpenAI
-from jinja2 import Environment, FileSystemLoader
 from src.config import get_config_manager
-import os
+from src.core.messaging import MessageBus, Message, MessageType, MessageHandler, LoggingMiddleware
+from utils.session_store import get_session_store
+from utils.llm_client_pool import get_llm_client_pool
+from src.core.template_engine import get_template_engine
+
+class AgentMailbox(MessageHandler):
+    """
+    单个智能体的邮箱：MessageBus 投递的消息进入 asyncio 队列，
+    由 Mediator 的消费任务按顺序逐条交给智能体处理。
+    队列达到 maxsize 时发送方最多等待 put_timeout 秒（背压），仍然没有空位则超额放入并记录告警，
+    两个处理器互相向对方已满的邮箱发送消息时不会死锁。
+    """
+
+    def __init__(self, agent_name: str, maxsize: int, put_timeout: float, logger):
+        self.agent_name = agent_name
+        self.logger = logger
+        self.maxsize = maxsize
+        self.put_timeout = put_timeout
+        self.overflows = 0  # 等待超时后超额放入的消息数
+        self.queue: Optional[asyncio.Queue] = None  # 在 Mediator.run() 所在的事件循环中创建
+        self._space: Optional[asyncio.Event] = None
+
+    def open(self):
+        """在当前事件循环中创建队列（容量由 handle 控制）"""
+        self.queue = asyncio.Queue()
+        self._space = asyncio.Event()
+        self._space.set()
+
+    def notify_space(self):
+        """消费方取出消息后调用，唤醒等待空位的发送方"""
+        if self.queue.qsize() < self.maxsize:
+            self._space.set()
+
+    async def handle(self, message: Message) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.put_timeout
+        while self.queue.qsize() >= self.maxsize:
+            remaining = deadline - loop.time()
+            self._space.clear()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(self._space.wait(), remaining)
+            except asyncio.TimeoutError:
+                self.overflows += 1
+                self.logger.warning(
+                    f"Mailbox of '{self.agent_name}' still full after {self.put_timeout}s, "
+                    f"accepting message from '{message.sender}' over capacity")
+                break
+        self.queue.put_nowait(message)
+        # MessageBus.publish 会吞掉异常，由此标记告诉 Mediator 消息确实进入了邮箱
+        message.metadata["delivered"] = True
 
 class Mediator:
-    def __init__(self):
+    def __init__(self, mailbox_size: Optional[int] = None, session_id: Optional[str] = None):
         self.agents: Dict[str, 'Agent'] = {}
-        self.agent_states: Dict[str, Dict[str, Any]] = {}  # 用于存储代理的状态
         self.logger = setup_logger("Mediator")
-        self.latest_code: Dict[str, Dict[str, str]] = {} # 用于存储每个会话中每个代理的最新代码
-        self.latest_simulation_results: Dict[str, Dict[str, Any]] = {} # 用于存储每个会话的最新仿真结果
         
         # Get configuration manager
         self.config_manager = get_config_manager()
 
+        # 智能体状态、最新代码和仿真结果按会话存放在全局会话存储中（LRU / TTL 上限）
+        self.session_store = get_session_store()
+        self.session_id = session_id or f"session-{uuid.uuid4().hex[:12]}"
+        self.session_store.open_session(self.session_id)
+
+        # 消息总线：每个智能体一个邮箱，消息由 run() 中的消费任务异步处理，不再递归调用
+        self.message_bus = MessageBus()
+        self.message_bus.add_middleware(LoggingMiddleware(self.logger))
+        self.mailboxes: Dict[str, AgentMailbox] = {}
+        self.mailbox_size = mailbox_size or self.config_manager.config.experiments.mailbox_size
+        self.mailbox_put_timeout = self.config_manager.config.experiments.mailbox_put_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Message] = []  # run() 启动前发送的消息
+        self._in_flight = 0  # 已发送但尚未处理完的消息数
+        self._in_flight_lock = threading.Lock()
+        self._idle: Optional[asyncio.Event] = None
+        # run() 超时时仍在执行、被放弃的处理器（线程无法取消，只能等它自行结束）
+        self._abandoned: List[Future] = []
+
     def register_agent(self, agent_name: str, agent: 'Agent'):
         self.agents[agent_name] = agent
-        self.agent_states[agent_name] = {}  
-        self.latest_code[agent_name] = {} 
+        mailbox = AgentMailbox(agent_name, self.mailbox_size, self.mailbox_put_timeout, self.logger)
+        self.mailboxes[agent_name] = mailbox
+        self.message_bus.subscribe(agent_name, mailbox)
         self.logger.debug(f"Agent '{agent_name}' has been registered with the mediator.")
 
     def send_message(self, sender: str, receivers: List[str], message: Any):
         for receiver in receivers:
             self.logger.debug(f"Mediator received a message from '{sender}' to agent '{receiver}'.")
             if receiver in self.agents:
-                self.agents[receiver].receive_message(sender, message)
+                msg_type = message.get("type") if isinstance(message, dict) else None
+                self._post(Message(
+                    type=MessageType.from_value(msg_type),
+                    sender=sender,
+                    receiver=receiver,
+                    content=message
+                ))
             else:
                 self.logger.error(f"Target agent '{receiver}' is not registered.")
 
-    def get_agent_state(self, agent_name: str) -> Dict[str, Any]:
+    def _post(self, message: Message):
+        """将消息投递到接收者邮箱；事件循环未运行时先暂存，由 run() 启动后投递"""
+        with self._in_flight_lock:
+            self._in_flight += 1
+            loop = self._loop
+            if loop is None:
+                self._pending.append(message)
+                return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is loop:
+            loop.create_task(self._deliver(message))
+        else:
+            # 发送方是运行在工作线程中的处理器：等待消息进入邮箱（邮箱满时阻塞，run() 超时后被取消）
+            asyncio.run_coroutine_threadsafe(self._deliver(message), loop).result()
+
+    async def _deliver(self, message: Message):
+        """经 MessageBus 投递到邮箱；消息没有进入邮箱（无订阅者、投递出错或被取消）时撤销它的在途计数"""
+        delivered = False
+        try:
+            await self.message_bus.publish(message)
+            delivered = message.metadata.get("delivered", False)
+        finally:
+            if not delivered:
+                self.logger.error(f"Message from '{message.sender}' to '{message.receiver}' was not delivered.")
+                self._message_done()
+
+    def _message_done(self):
+        with self._in_flight_lock:
+            self._in_flight -= 1
+            idle = self._in_flight == 0
+        if idle and self._idle is not None:
+            self._idle.set()
+
+    async def _consume(self, mailbox: AgentMailbox, executor: ThreadPoolExecutor, running: Dict[Future, str]):
+        """单个智能体的消费任务：同一智能体的消息按到达顺序逐条处理"""
+        agent = self.agents[mailbox.agent_name]
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await mailbox.queue.get()
+            mailbox.notify_space()
+            try:
+                # 智能体处理器是同步的（LLM 调用、仿真），放到专用线程池中执行以免阻塞事件循环；
+                # 不用默认线程池，超时退出时 asyncio.run 不会等待这些线程
+                future = executor.submit(agent.receive_message, message.sender, message.content)
+                running[future] = f"{mailbox.agent_name} <- {message.sender} ({message.type.value})"
+                try:
+                    await asyncio.wrap_future(future, loop=loop)
+                finally:
+                    if future.done():
+                        running.pop(future, None)
+            except Exception as e:
+                self.logger.error(f"Agent '{mailbox.agent_name}' failed to handle message from '{message.sender}': {e}")
+            finally:
+                mailbox.queue.task_done()
+                self._message_done()
+
+    async def run(self, timeout: Optional[float] = None) -> bool:
+        """
+        在当前事件循环上处理消息，直到所有邮箱为空且没有正在处理的消息（或超时）。
+        不同会话的 Mediator 可以在同一个事件循环上并发运行。
+        返回是否在超时前处理完所有消息。
+        """
+        loop = asyncio.get_running_loop()
+        self._idle = asyncio.Event()
+        for mailbox in self.mailboxes.values():
+            mailbox.open()
+        executor = ThreadPoolExecutor(max_workers=max(1, len(self.mailboxes)), thread_name_prefix="agent-handler")
+        running: Dict[Future, str] = {}
+        workers = [loop.create_task(self._consume(mailbox, executor, running)) for mailbox in self.mailboxes.values()]
+
+        with self._in_flight_lock:
+            self._loop = loop
+            pending, self._pending = self._pending, []
+            if self._in_flight == 0:
+                self._idle.set()
+
+        try:
+            await asyncio.wait_for(self._drain(pending), timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Mediator stopped after {timeout}s with {self._in_flight} message(s) still in flight.")
+            return False
+        finally:
+            with self._in_flight_lock:
+                self._loop = None
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # 超时时不等待仍在执行的处理器：未开始的直接取消，正在执行的记为已放弃
+            for future, description in running.items():
+                if not future.done():
+                    self.logger.warning(f"Abandoning handler still running after timeout: {description}")
+                    self._abandoned.append(future)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def has_running_handlers(self) -> bool:
+        """超时被放弃的处理器是否仍在执行（此时智能体状态不可复用）"""
+        self._abandoned = [future for future in self._abandoned if not future.done()]
+        return bool(self._abandoned)
+
+    async def _drain(self, pending: List[Message]):
+        for message in pending:
+            await self._deliver(message)
+        await self._idle.wait()
+
+    def run_until_idle(self, timeout: Optional[float] = None) -> bool:
+        """同步入口：在新的事件循环中运行 run()（供线程池中的实验使用）"""
+        return asyncio.run(self.run(timeout))
+
+    def open_session(self, session_id: str):
+        """
+        Switches the mediator to a new session (e.g. the next experiment of a pooled agent set).
+        The previous session is closed first.
+        """
+        if session_id != self.session_id:
+            self.session_store.close_session(self.session_id)
+            self.session_id = session_id
+        self.session_store.open_session(session_id)
+
+        # 丢弃上一个会话中未投递的消息（例如实验中途出错）
+        with self._in_flight_lock:
+            if self._loop is None:
+                self._pending.clear()
+                self._in_flight = 0
+
+    def close_session(self, session_id: str = None):
+        """
+        Closes a session and releases its state from memory
+        (written to experiments.session_spill_dir if configured).
+        """
+        self.session_store.close_session(session_id or self.session_id)
+
+    def get_agent_state(self, agent_name: str, session_id: str = None) -> Dict[str, Any]:
         """
         Returns the state information of the specified agent.
         """
-        if agent_name in self.agent_states:
-            return self.agent_states[agent_name]
+        if agent_name in self.agents:
+            return self.session_store.get(session_id or self.session_id, f"agent_states:{agent_name}", {})
         else:
             self.logger.error(f"Unable to get state for agent '{agent_name}': agent not registered or state not initialized.")
             return {}
 
-    def update_agent_state(self, agent_name: str, state: Dict[str, Any]):
+    def update_agent_state(self, agent_name: str, state: Dict[str, Any], session_id: str = None):
         """
         Updates the state information of the specified agent.
         """
-        if agent_name in self.agent_states:
-            self.agent_states[agent_name].update(state)
+        if agent_name in self.agents:
+            self.session_store.update(session_id or self.session_id, f"agent_states:{agent_name}", state)
             # self.logger.debug(f"State of agent '{agent_name}' updated: {state}")
         else:
             self.logger.error(f"Unable to update state for agent '{agent_name}': agent not registered.")
@@ -55,8 +268,9 @@ class Mediator:
         """
         Returns the design requirements for a specific session of an agent.
         """
-        if agent_name in self.agent_states and "session_design_requirements" in self.agent_states[agent_name] and session_id in self.agent_states[agent_name]["session_design_requirements"]:
-            return self.agent_states[agent_name]["session_design_requirements"][session_id]
+        design_requirements = self.get_agent_state(agent_name, session_id).get("session_design_requirements")
+        if design_requirements:
+            return design_requirements
         else:
             self.logger.error(f"Unable to get design requirements for agent '{agent_name}', session '{session_id}'.")
             return ""
@@ -78,34 +292,33 @@ class Mediator:
 
     def store_latest_code(self, sender: str, session_id: str, code: str):
         """Stores the latest Verilog code for a given agent and session."""
-        if sender not in self.latest_code:
-            self.latest_code[sender] = {}
-        self.latest_code[sender][session_id] = code
-        self.logger.debug(f"Stored latest code from {sender} for session {session_id}.")
+        self.session_store.update(session_id or self.session_id, "latest_code", {sender: code})
+        self.logger.debug(f"Stored latest code from {sender} for session {session_id or self.session_id}.")
 
     def get_latest_code(self, sender: str, session_id: str) -> str:
         """Retrieves the latest Verilog code for a given agent and session."""
-        if sender in self.latest_code and session_id in self.latest_code[sender]:
-            return self.latest_code[sender][session_id]
+        latest_code = self.session_store.get(session_id or self.session_id, "latest_code", {})
+        if sender in latest_code:
+            return latest_code[sender]
         else:
             self.logger.warning(f"No latest code found for {sender} in session {session_id}.")
             return ""
 
     def store_latest_simulation_result(self, session_id: str, result: Dict[str, Any]):
         """Stores the latest simulation result for a given session."""
-        self.latest_simulation_results[session_id] = result
+        self.session_store.set(session_id or self.session_id, "latest_simulation_result", result)
         self.logger.debug(f"Stored latest simulation result for session {session_id}: {result}")
 
     def get_latest_simulation_result(self, session_id: str) -> Dict[str, Any]:
         """Retrieves the latest simulation result for a given session."""
-        return self.latest_simulation_results.get(session_id, {})
+        return self.session_store.get(session_id or self.session_id, "latest_simulation_result", {})
 
-    def get_agent_states(self, agent_name: str) -> Dict[str, Any]:
+    def get_agent_states(self, agent_name: str, session_id: str = None) -> Dict[str, Any]:
         """
         Returns all state information for the specified agent.
         """
-        if agent_name in self.agent_states:
-            return self.agent_states[agent_name]
+        if agent_name in self.agents:
+            return self.get_agent_state(agent_name, session_id)
         else:
             self.logger.error(f"Unable to get states for agent '{agent_name}': agent not registered.")
             return {}
@@ -117,37 +330,21 @@ class Agent:
         self.logger = setup_logger(self.name)
         self.config = config  # Store the app config
         self.mediator.register_agent(self.name, self)
+        self.current_experiment = "unknown_experiment"
         
         # Get configuration manager and model config
         try:
             self.config_manager = get_config_manager()
             self.model_config = self.config_manager.get_model_config()
             
-            # Initialize OpenAI client with current model configuration
-            self.client = OpenAI(
-                api_key=self.model_config.api_key,
-                base_url=self.model_config.base_url
-            )
+            # Shared OpenAI client from the global client pool
+            self.client = get_llm_client_pool().get_client(self.model_config)
         except Exception as e:
             self.logger.error(f"Failed to initialize configuration for agent {name}: {e}")
-            # Fallback: try to use old-style config access if available
-            if hasattr(config, 'OPENAI_API_KEY') and hasattr(config, 'OPENAI_BASE_URL'):
-                self.logger.warning(f"Using fallback configuration for agent {name}")
-                self.client = OpenAI(
-                    api_key=config.OPENAI_API_KEY,
-                    base_url=config.OPENAI_BASE_URL
-                )
-            else:
-                self.logger.error(f"No valid configuration found for agent {name}")
-                raise
+            raise
         
-        # Initialize Jinja2 template environment
-        template_dir = os.path.join(os.path.dirname(__file__), './agents/prompts')
-        self.template_env = Environment(
-            loader=FileSystemLoader(template_dir),
-            trim_blocks=True,    # 移除块后的第一个换行
-            lstrip_blocks=True   # 移除块前的空白
-        )
+        # Shared template engine (all prompt templates precompiled once per process)
+        self.template_engine = get_template_engine()
 
     def send_message(self, receivers: List[str], message: Any):
         self.logger.debug(f"Agent '{self.name}' is sending a message to {receivers}.")
@@ -156,13 +353,17 @@ class Agent:
     def receive_message(self, sender: str, message: Any):
         raise NotImplementedError("Subclasses must implement the 'receive_message' method.")
 
+    def reset_session(self):
+        """
+        Resets per-experiment state so the agent can be reused by AgentPool.
+        Subclasses that keep experiment state on the instance must override this.
+        """
+        pass
+
     def update_model_config(self):
         """Update model configuration when model is switched."""
         try:
             self.model_config = self.config_manager.get_model_config()
-            self.client = OpenAI(
-                api_key=self.model_config.api_key,
-                base_url=self.model_config.base_url
-            )
+            self.client = get_llm_client_pool().get_client(self.model_config)
         except Exception as e:
-            self.logger.error(f"Failed to update model configuration: {e}")
\ No newline at end of file
+            self.logger.error(f"Failed to update model configuration: {e}")
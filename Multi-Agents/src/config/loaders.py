@@ -81,7 +81,9 @@ class ConfigLoader:
                 api_keys=data.get("api_keys", []),
                 base_url=data.get("base_url", ""),
                 timeout=data.get("timeout", 30),
-                max_retries=data.get("max_retries", 3)
+                max_retries=data.get("max_retries", 3),
+                requests_per_minute=data.get("requests_per_minute"),
+                tokens_per_minute=data.get("tokens_per_minute")
             )
             
             return ModelConfig(
@@ -89,7 +91,8 @@ class ConfigLoader:
                 api_config=api_config,
                 embedding_model=data.get("embedding_model"),
                 max_tokens=data.get("max_tokens"),
-                temperature=data.get("temperature", 0.7)
+                temperature=data.get("temperature", 0.7),
+                pricing=data.get("pricing") or {}
             )
         except Exception as e:
             print(f"Error parsing model config for {name}: {e}")
@@ -12,6 +12,8 @@ class APIConfig:
     timeout: int = 30
     max_retries: int = 3
     current_key_index: int = 0
+    requests_per_minute: Optional[int] = None  # 每个密钥的请求数限额（为空时只按响应头限流）
+    tokens_per_minute: Optional[int] = None  # 每个密钥的 token 限额（为空时只按响应头限流）
     
     def get_current_key(self) -> str:
         """获取当前API密钥"""
@@ -33,6 +35,7 @@ class ModelConfig:
     embedding_model: Optional[str] = None
     max_tokens: Optional[int] = None
     temperature: float = 0.7
+    pricing: Dict[str, float] = field(default_factory=dict)  # 每百万 token 的价格：input / cached_input / output（用于统计调用费用）
     
     @property
     def api_key(self) -> str:
@@ -50,6 +53,7 @@ class AgentConfig:
     template_dir: str = "agents/prompts"
     system_message: Optional[str] = None
     timeout: Optional[int] = None  # 添加 timeout 字段
+    state_machine: str = "compiled"  # 状态机后端：compiled（查表）或 markup（transitions MarkupMachine）
     
 @dataclass
 class RAGConfig:
@@ -74,6 +78,42 @@ class ExperimentConfig:
     testbench_path: Optional[str] = None
     reference_code_path: Optional[str] = None
     summary_file: Optional[str] = None
+    mailbox_size: int = 64  # 每个智能体邮箱的最大消息数（满时发送方等待）
+    mailbox_put_timeout: float = 5.0  # 邮箱已满时发送方最多等待的秒数，超时后超额放入（避免处理器互相等待）
+    run_timeout: Optional[float] = 7200.0  # 单个实验消息处理的最长秒数，超时后停止处理剩余消息（为空则不限制）
+    session_max_count: int = 32  # 内存中保留的会话状态数上限（LRU）
+    session_ttl: int = 3600  # 会话状态未访问超过该秒数后淘汰
+    session_spill_dir: Optional[str] = None  # 关闭 / 淘汰的会话状态写入该目录（为空则直接丢弃）
+    history_strategy: str = "sliding_window"  # 对话历史裁剪策略：full / sliding_window / summary
+    history_token_budget: int = 12000  # 每次 LLM 调用发送的对话历史 token 上限
+    llm_streaming: bool = False  # 以流式方式接收 LLM 响应
+    stream_stop_at_code_block: bool = True  # 流式响应中第一个完整的 Verilog 代码块结束后停止生成
+    llm_max_connections: int = 32  # 共享 HTTP 连接池的最大连接数
+    llm_max_keepalive_connections: int = 16  # 保持空闲（keep-alive）的最大连接数
+    llm_keepalive_expiry: float = 60.0  # 空闲连接保留秒数
+    llm_http2: bool = True  # 服务端支持时使用 HTTP/2（需要安装 h2）
+    retry_budget_ratio: float = 0.2  # 全局重试预算：每个新请求可带来的重试额度
+    retry_budget_min_per_sec: float = 1.0  # 重试预算每秒保底补充的额度
+    llm_hedging: bool = False  # 请求耗时超过历史分位阈值时发出对冲请求，取先返回的结果
+    llm_hedge_percentile: float = 95.0  # 触发对冲请求的耗时分位
+    llm_hedge_min_samples: int = 20  # 积累到该数量的耗时样本后才启用对冲
+    design_analysis_cache: bool = True  # 预分析结果按设计需求哈希写入磁盘，重复运行同一题目时复用
+    design_analysis_cache_dir: Optional[str] = None  # 预分析缓存目录（为空则为 output_base_dir/design_analysis_cache）
+    summary_flush_records: int = 64  # 总结 / 知识库文本文件的后台写入：积累该条数后提交一批
+    summary_flush_interval_ms: int = 200  # 后台写入：最早的记录等待超过该毫秒数后提交
+    summary_fsync: str = "none"  # 后台写入的 fsync 策略：none / batch / always
+    speculative_candidates: int = 1  # CoderAgent 每轮并发生成并并行仿真的候选数（1 为关闭推测模式）
+    speculative_use_n: bool = False  # 用一次请求的 n 参数获取候选（服务端需支持），否则发出多个并行请求
+    static_lint: bool = True  # 审查和仿真之前先用本地静态检查拒绝违反结构化规则（行为级描述、时延、非基本门模块等）的代码
+    template_auto_reload: bool = False  # 渲染提示模板前检查源文件是否修改（开发时编辑模板用），关闭时只使用启动时预编译的模板
+    template_bytecode_cache: bool = True  # 编译后的模板字节码写入磁盘，再次启动时源文件未变则跳过编译
+    template_bytecode_cache_dir: Optional[str] = None  # 模板字节码缓存目录（为空则为 output_base_dir/template_cache）
+    prompt_layout: str = "inline"  # 提示布局：inline（模板原样）/ prefix（静态指令并入系统消息，作为可被提供方缓存的稳定前缀）
+    stream_usage: bool = False  # 流式响应时请求服务端在最后一个数据块返回 usage（stream_options.include_usage）
+    metrics_aggregation_interval: float = 5.0  # 后台汇总线程合并各线程指标分片并调用导出器的周期（秒）
+    metrics_exporters: List[str] = field(default_factory=list)  # 指标导出器：prometheus（文本文件）/ jsonl / http（本机 OpenMetrics 端点）
+    metrics_export_dir: Optional[str] = None  # 指标文件目录（为空则为 output_base_dir/metrics）
+    metrics_http_port: int = 9464  # http 导出器在 127.0.0.1 上监听的端口
     
     def get_output_dir(self, model_name: str) -> str:
         """获取模型特定的输出目录"""
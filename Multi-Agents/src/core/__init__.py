@@ -7,7 +7,8 @@
 
 from .container import Container, ServiceNotFoundError, CircularDependencyError
 from .messaging import MessageBus, Message, MessageType, MessageHandler, MessageMiddleware, LoggingMiddleware
-from .template_engine import TemplateEngine
+from .template_engine import TemplateEngine, get_template_engine
+from .state_machine import CompiledMachine
 from .exceptions import (
     CircuitMindError, ConfigurationError, AgentError, 
     CompilationError, ValidationError, TemplateError, ServiceError
@@ -24,6 +25,8 @@ __all__ = [
     'MessageMiddleware',
     'LoggingMiddleware',
     'TemplateEngine',
+    'get_template_engine',
+    'CompiledMachine',
     'CircuitMindError',
     'ConfigurationError',
     'AgentError',
@@ -58,7 +58,7 @@ class CircuitMindError(Exception):
 class ConfigurationError(CircuitMindError):
     """配置错误"""
     def __init__(self, message: str, config_file: str = None, **kwargs):
-        context = kwargs.get('context', {})
+        context = kwargs.pop('context', None) or {}
         if config_file:
             context['config_file'] = config_file
         
@@ -74,7 +74,7 @@ class ConfigurationError(CircuitMindError):
 class LLMAPIError(CircuitMindError):
     """LLM API 相关错误"""
     def __init__(self, message: str, status_code: int = None, model_name: str = None, **kwargs):
-        context = kwargs.get('context', {})
+        context = kwargs.pop('context', None) or {}
         if status_code:
             context['status_code'] = status_code
         if model_name:
@@ -96,7 +96,7 @@ class LLMAPIError(CircuitMindError):
 class AgentError(CircuitMindError):
     """智能体错误"""
     def __init__(self, message: str, agent_name: str = None, state: str = None, **kwargs):
-        context = kwargs.get('context', {})
+        context = kwargs.pop('context', None) or {}
         if agent_name:
             context['agent_name'] = agent_name
         if state:
@@ -112,7 +112,7 @@ class AgentError(CircuitMindError):
 class CompilationError(CircuitMindError):
     """编译错误"""
     def __init__(self, message: str, code_file: str = None, line_number: int = None, **kwargs):
-        context = kwargs.get('context', {})
+        context = kwargs.pop('context', None) or {}
         if code_file:
             context['code_file'] = code_file
         if line_number:
@@ -130,7 +130,7 @@ class CompilationError(CircuitMindError):
 class SimulationError(CircuitMindError):
     """仿真错误"""
     def __init__(self, message: str, timeout: bool = False, **kwargs):
-        context = kwargs.get('context', {})
+        context = kwargs.pop('context', None) or {}
         context['timeout'] = timeout
         
         super().__init__(
@@ -145,7 +145,7 @@ class SimulationError(CircuitMindError):
 class ValidationError(CircuitMindError):
     """验证错误"""
     def __init__(self, message: str, validation_type: str = None, **kwargs):
-        context = kwargs.get('context', {})
+        context = kwargs.pop('context', None) or {}
         if validation_type:
             context['validation_type'] = validation_type
         
@@ -161,7 +161,7 @@ class ValidationError(CircuitMindError):
 class TemplateError(CircuitMindError):
     """模板错误"""
     def __init__(self, message: str, template_name: str = None, **kwargs):
-        context = kwargs.get('context', {})
+        context = kwargs.pop('context', None) or {}
         if template_name:
             context['template_name'] = template_name
         
@@ -177,7 +177,7 @@ class TemplateError(CircuitMindError):
 class ServiceError(CircuitMindError):
     """服务错误"""
     def __init__(self, message: str, service_name: str = None, **kwargs):
-        context = kwargs.get('context', {})
+        context = kwargs.pop('context', None) or {}
         if service_name:
             context['service_name'] = service_name
         
@@ -19,6 +19,27 @@ class MessageType(Enum):
     TEST_FAILURE = "test_failure"
     STOP_COMMAND = "stop_command"
     AGENT_STOPPED = "agent_stopped"
+    ERROR = "error"
+    SIMULATION_TIMEOUT = "simulation_timeout"
+    EXECUTION_RESULT = "execution_result"
+    EXECUTION_RESULT_AND_CODE = "execution_result_and_code"
+    EXECUTION_FAILED = "execution_failed"
+    CODE_GENERATION_SUCCESSFUL = "code_generation_successful"
+    CODE_GENERATION_FAILED = "code_generation_failed"
+    REVIEW_FEEDBACK = "review_feedback"
+    FIX_INFO = "fix_info"
+    FINAL_FAILURE = "final_failure"
+    SIMULATE_CANDIDATES = "simulate_candidates"
+    CANDIDATE_RESULTS = "candidate_results"
+    UNKNOWN = "unknown"
+
+    @classmethod
+    def from_value(cls, value: Any) -> "MessageType":
+        """将智能体消息中的 type 字符串转换为枚举，未知类型返回 UNKNOWN"""
+        try:
+            return cls(value)
+        except ValueError:
+            return cls.UNKNOWN
 
 @dataclass
 class Message:
@@ -0,0 +1,222 @@
+# src/core/state_machine.py - 查表式状态机
+"""
+编译式（查表）状态机
+
+沿用 transitions 的 states / transitions 声明，创建时把每个触发器预先编译成
+"状态编号 -> 候选转换" 的表，回调解析为类上的函数；运行时只做整数下标查找和直接调用。
+模型（智能体实例）上只保存一个整数状态编号，状态图 markup 仅在需要时通过 transitions 生成。
+"""
+
+import inspect
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from transitions import State, MachineError
+
+logger = logging.getLogger(__name__)
+
+# 模型上保存状态编号的属性名
+STATE_INDEX_ATTR = "_state_index"
+
+Callback = Callable[..., Any]
+
+def _as_list(value) -> list:
+    """把 None / 单个值 / 列表统一转换为列表"""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+@dataclass(frozen=True)
+class CompiledTransition:
+    """编译后的单条转换，回调均为 func(model, *args, **kwargs)"""
+    trigger: str
+    source: int
+    dest: Optional[int]  # None 表示内部转换（不离开当前状态，不执行 enter/exit）
+    prepare: Tuple[Callback, ...] = ()
+    conditions: Tuple[Callback, ...] = ()
+    unless: Tuple[Callback, ...] = ()
+    before: Tuple[Callback, ...] = ()
+    after: Tuple[Callback, ...] = ()
+
+class CompiledMachine:
+    """
+    查表式状态机，与 transitions.Machine 的声明格式和常用接口兼容
+    （add_model / remove_model / set_state / get_triggers），每个模型类只需编译一次。
+
+    与 transitions（queued=False）一致：触发器返回是否发生了转换，
+    当前状态不允许该触发器时抛出 MachineError；回调按 prepare -> conditions/unless ->
+    before -> on_exit -> 切换状态 -> on_enter -> after 的顺序执行，并接收触发器的参数。
+    """
+
+    def __init__(self, model_cls: type, states: Sequence[Union[State, str, Dict[str, Any]]],
+                 transitions: List[Dict[str, Any]], initial: str, name: str = "",
+                 state_callbacks: Optional[Dict[str, Union[str, List[str]]]] = None):
+        self.model_cls = model_cls
+        self.name = name
+        self._markup = None
+
+        # 状态名 <-> 编号
+        declared = [self._normalize_state(s) for s in states]
+        self.state_names: Tuple[str, ...] = tuple(s["name"] for s in declared)
+        self.state_ids: Dict[str, int] = {n: i for i, n in enumerate(self.state_names)}
+        self.initial = self._state_id(initial)
+
+        # 进入 / 离开回调：声明中的回调、state_callbacks、以及 on_enter_<state> / on_exit_<state> 方法
+        state_callbacks = state_callbacks or {}
+        self._enter_names: List[List[Any]] = []
+        self._exit_names: List[List[Any]] = []
+        for state in declared:
+            enter = state["on_enter"] + _as_list(state_callbacks.get(state["name"]))
+            exit_ = list(state["on_exit"])
+            for prefix, names in (("on_enter_", enter), ("on_exit_", exit_)):
+                method = prefix + state["name"]
+                if method not in names and inspect.isfunction(inspect.getattr_static(model_cls, method, None)):
+                    names.append(method)
+            self._enter_names.append(enter)
+            self._exit_names.append(exit_)
+        self._on_enter = tuple(tuple(self._resolve(cb) for cb in names) for names in self._enter_names)
+        self._on_exit = tuple(tuple(self._resolve(cb) for cb in names) for names in self._exit_names)
+
+        # 转换表 {触发器: [每个状态编号对应的候选转换]}
+        self._transition_specs = [dict(t) for t in transitions]
+        self._table: Dict[str, List[Tuple[CompiledTransition, ...]]] = {}
+        for spec in self._transition_specs:
+            self._compile_transition(spec)
+
+    # 编译
+    @staticmethod
+    def _normalize_state(state) -> Dict[str, Any]:
+        if isinstance(state, State):
+            return {"name": state.name, "on_enter": list(state.on_enter), "on_exit": list(state.on_exit)}
+        if isinstance(state, dict):
+            return {"name": state["name"], "on_enter": _as_list(state.get("on_enter")),
+                    "on_exit": _as_list(state.get("on_exit"))}
+        return {"name": str(state), "on_enter": [], "on_exit": []}
+
+    def _state_id(self, state_name: str) -> int:
+        try:
+            return self.state_ids[state_name]
+        except KeyError:
+            raise ValueError(f"State '{state_name}' is not a registered state of {self.name}")
+
+    def _resolve(self, callback) -> Callback:
+        """把回调解析为 func(model, *args, **kwargs)，方法名直接取类上的函数"""
+        if callable(callback):
+            return lambda model, *args, **kwargs: callback(*args, **kwargs)
+        func = inspect.getattr_static(self.model_cls, callback, None)
+        if inspect.isfunction(func):
+            return func
+        # 非普通方法（如实例属性、staticmethod）退化为运行时查找
+        return lambda model, *args, **kwargs: getattr(model, callback)(*args, **kwargs)
+
+    def _compile_transition(self, spec: Dict[str, Any]):
+        trigger = spec["trigger"]
+        sources = spec["source"]
+        if sources == "*":
+            source_ids = range(len(self.state_names))
+        else:
+            source_ids = [self._state_id(s) for s in _as_list(sources)]
+        dest = spec.get("dest")
+
+        row = self._table.setdefault(trigger, [()] * len(self.state_names))
+        for source in source_ids:
+            dest_id = source if dest == "=" else (None if dest is None else self._state_id(dest))
+            compiled = CompiledTransition(
+                trigger=trigger,
+                source=source,
+                dest=dest_id,
+                **{key: tuple(self._resolve(cb) for cb in _as_list(spec.get(key)))
+                   for key in ("prepare", "conditions", "unless", "before", "after")}
+            )
+            row[source] = row[source] + (compiled,)
+
+    def install_triggers(self):
+        """在模型类上定义触发器方法（已存在同名属性时跳过，与 transitions 的行为一致）"""
+        for trigger in self._table:
+            if hasattr(self.model_cls, trigger):
+                logger.warning(f"{self.name}: Skip binding of '{trigger}' to model due to model override policy.")
+                continue
+            setattr(self.model_cls, trigger, self._make_trigger(trigger))
+
+    def _make_trigger(self, trigger: str) -> Callback:
+        machine = self
+
+        def trigger_method(model, *args, **kwargs) -> bool:
+            return machine.fire(model, trigger, *args, **kwargs)
+
+        trigger_method.__name__ = trigger
+        trigger_method.__qualname__ = f"{self.model_cls.__name__}.{trigger}"
+        return trigger_method
+
+    # 运行
+    def fire(self, model, trigger: str, *args, **kwargs) -> bool:
+        """在模型当前状态上触发事件，返回是否发生了转换"""
+        current = getattr(model, STATE_INDEX_ATTR)
+        candidates = self._table[trigger][current]
+        if not candidates:
+            raise MachineError(f"\"Can't trigger event {trigger} from state {self.state_names[current]}!\"")
+
+        for transition in candidates:
+            for callback in transition.prepare:
+                callback(model, *args, **kwargs)
+            if not all(check(model, *args, **kwargs) for check in transition.conditions):
+                continue
+            if any(check(model, *args, **kwargs) for check in transition.unless):
+                continue
+
+            for callback in transition.before:
+                callback(model, *args, **kwargs)
+            if transition.dest is not None:
+                for callback in self._on_exit[current]:
+                    callback(model, *args, **kwargs)
+                setattr(model, STATE_INDEX_ATTR, transition.dest)
+                for callback in self._on_enter[transition.dest]:
+                    callback(model, *args, **kwargs)
+            for callback in transition.after:
+                callback(model, *args, **kwargs)
+            return True
+        return False
+
+    # 与 transitions.Machine 兼容的接口
+    def add_model(self, model, initial: Optional[str] = None):
+        """把模型置于初始状态（不在模型上绑定任何方法）"""
+        setattr(model, STATE_INDEX_ATTR, self.initial if initial is None else self._state_id(initial))
+
+    def remove_model(self, model):
+        """模型上没有绑定任何内容，无需清理"""
+
+    def set_state(self, state: str, model=None):
+        """直接设置模型状态（不执行回调）"""
+        setattr(model, STATE_INDEX_ATTR, self._state_id(state))
+
+    def get_triggers(self, *states: str) -> List[str]:
+        """获取在指定状态下可用的触发器"""
+        state_ids = [self._state_id(s) for s in states]
+        return [trigger for trigger, row in self._table.items() if any(row[i] for i in state_ids)]
+
+    @property
+    def markup(self) -> Dict[str, Any]:
+        """状态图 markup（首次访问时通过 transitions 的 MarkupMachine 生成）"""
+        if self._markup is None:
+            from transitions.extensions.markup import MarkupMachine
+
+            states = [
+                State(name, on_enter=[cb for cb in enter if isinstance(cb, str)],
+                      on_exit=[cb for cb in exit_ if isinstance(cb, str)])
+                for name, enter, exit_ in zip(self.state_names, self._enter_names, self._exit_names)
+            ]
+            markup_machine = MarkupMachine(
+                model=None,
+                states=states,
+                transitions=self._transition_specs,
+                initial=self.state_names[self.initial],
+                name=self.name
+            )
+            self._markup = markup_machine.markup
+        return self._markup
+
+    def get_markup(self) -> Dict[str, Any]:
+        """获取状态图 markup"""
+        return self.markup
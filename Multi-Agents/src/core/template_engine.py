@@ -1,20 +1,30 @@
 
 # src/core/template_engine.py
-from jinja2 import Environment, FileSystemLoader, Template, TemplateError as JinjaTemplateError
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, Template, TemplateError as JinjaTemplateError
 from typing import Dict, Any, Optional
 from pathlib import Path
+import os
 import logging
+import threading
 from src.core.exceptions import TemplateError
+from src.config import get_config_manager
+
+# 智能体提示模板目录（与工作目录无关）
+PROMPT_TEMPLATE_DIR = str(Path(__file__).resolve().parents[2] / "agents" / "prompts")
 
 class TemplateEngine:
     """模板引擎"""
     
-    def __init__(self, template_dirs: list = None):
+    def __init__(self, template_dirs: list = None, auto_reload: bool = True,
+                 bytecode_cache_dir: Optional[str] = None, keep_trailing_newline: bool = True):
         """
         初始化模板引擎
         
         Args:
             template_dirs: 模板目录列表
+            auto_reload: 每次取模板时检查源文件是否修改（为 False 时只使用预编译的模板，不再访问文件）
+            bytecode_cache_dir: 模板字节码的磁盘缓存目录，源文件未变时跳过编译
+            keep_trailing_newline: 保留模板末尾的换行
         """
         if template_dirs is None:
             template_dirs = ["agents/prompts", "templates"]
@@ -32,14 +42,24 @@ class TemplateEngine:
             default_dir.mkdir(exist_ok=True)
             existing_dirs = [str(default_dir)]
         
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+        
+        self.auto_reload = auto_reload
         self.env = Environment(
             loader=FileSystemLoader(existing_dirs),
             trim_blocks=True,
             lstrip_blocks=True,
-            keep_trailing_newline=True
+            keep_trailing_newline=keep_trailing_newline,
+            auto_reload=auto_reload,
+            cache_size=-1,  # 模板数量有限，全部保留
+            bytecode_cache=bytecode_cache
         )
         
         self.logger = logging.getLogger(__name__)
+        self._templates: Dict[str, Template] = {}
         
         # 注册自定义过滤器
         self._register_filters()
@@ -65,6 +85,25 @@ class TemplateEngine:
         self.env.filters['format_code'] = format_code
         self.env.filters['truncate_smart'] = truncate_smart
     
+    def precompile(self, extensions: tuple = (".j2",)) -> int:
+        """编译模板目录中的全部模板（有字节码缓存时直接加载），返回模板数量"""
+        for name in self.env.list_templates(extensions=[ext.lstrip(".") for ext in extensions]):
+            try:
+                self._templates[name] = self.env.get_template(name)
+            except JinjaTemplateError as e:
+                # 有错误的模板在渲染时照常报错
+                self.logger.warning(f"Failed to precompile template {name}: {e}")
+        self.logger.debug(f"Precompiled {len(self._templates)} templates")
+        return len(self._templates)
+    
+    def get_template(self, template_name: str) -> Template:
+        """取编译好的模板：关闭 auto_reload 时直接返回预编译的模板对象"""
+        if not self.auto_reload:
+            template = self._templates.get(template_name)
+            if template is not None:
+                return template
+        return self.env.get_template(template_name)
+    
     def render(self, template_name: str, context: Dict[str, Any] = None) -> str:
         """
         渲染模板
@@ -80,7 +119,7 @@ class TemplateEngine:
             context = {}
         
         try:
-            template = self.env.get_template(template_name)
+            template = self.get_template(template_name)
             result = template.render(context)
             self.logger.debug(f"Rendered template {template_name}")
             return result
@@ -124,7 +163,7 @@ class TemplateEngine:
     def template_exists(self, template_name: str) -> bool:
         """检查模板是否存在"""
         try:
-            self.env.get_template(template_name)
+            self.get_template(template_name)
             return True
         except JinjaTemplateError:
             return False
@@ -133,4 +172,26 @@ class TemplateEngine:
         """列出所有可用的模板"""
         return self.env.list_templates()
 
+# 全局模板引擎（首次使用时按实验配置创建并预编译全部提示模板，所有智能体共享）
+_template_engine: Optional[TemplateEngine] = None
+_template_engine_lock = threading.Lock()
 
+def get_template_engine() -> TemplateEngine:
+    """获取全局提示模板引擎"""
+    global _template_engine
+    with _template_engine_lock:
+        if _template_engine is None:
+            experiments = get_config_manager().config.experiments
+            cache_dir = None
+            if experiments.template_bytecode_cache:
+                cache_dir = experiments.template_bytecode_cache_dir or os.path.join(
+                    experiments.output_base_dir, "template_cache"
+                )
+            _template_engine = TemplateEngine(
+                template_dirs=[PROMPT_TEMPLATE_DIR],
+                auto_reload=experiments.template_auto_reload,
+                bytecode_cache_dir=cache_dir,
+                keep_trailing_newline=False
+            )
+            _template_engine.precompile()
+        return _template_engine
@@ -3,23 +3,32 @@
 
 import re
 import json
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, Optional, List
 from openai import OpenAI, APIStatusError
 from colorama import Fore, Style
 from utils.logger import setup_logger, DIALOGUE_LOG_LEVEL
 from utils.llm_client_pool import get_llm_client_pool
+from utils.context_window import ContextWindow, get_token_counter
+from utils.code_stream import VerilogBlockStream
+from utils.retry_strategy import get_retry_strategy, RetryErrorType, HedgeCancelled, hedge_cancelled
+from utils.metrics import get_metrics_collector, llm_call_cost
+from src.core.exceptions import AgentError
 from src.config import get_config_manager
-import time
 
 class ChatSession:
     """兼容的聊天会话管理类"""
     
-    def __init__(self, config, system_message=None, role=None):
+    def __init__(self, config, system_message=None, role=None, agent=None):
         self.messages = []
         self.system_message = system_message
         self.role = role
         self.app_config = config
+        # 所属智能体：LLM 用量按其名称和当前实验计入指标
+        self.agent = agent
+        self.metrics = get_metrics_collector()
         
         self.logger = setup_logger(f"ChatSession-{role}" if role else "ChatSession")
         
@@ -35,6 +44,23 @@ class ChatSession:
                 "You are a helpful assistant."
             )
         
+        # 按 token 预算裁剪发送的历史
+        experiments = config.experiments
+        self.context = ContextWindow(
+            token_budget=experiments.history_token_budget,
+            strategy=experiments.history_strategy
+        )
+        
+        # 流式响应：代码块结束标记到达后可提前结束生成
+        self.streaming = experiments.llm_streaming
+        self.stream_stop_at_code_block = experiments.stream_stop_at_code_block
+        self.stream_usage = experiments.stream_usage
+        self.stream_early_stops = 0
+        
+        # 重试由全局 RetryStrategy 负责（错误分类、重试预算、Retry-After），可选对冲请求
+        self.retry_strategy = get_retry_strategy()
+        self.hedging = experiments.llm_hedging
+        
         # 初始化会话状态
         self.reset_session_state()
     
@@ -45,6 +71,8 @@ class ChatSession:
         self.dff_analysis_result = {"needs_flip_flop": False}
         self.template_name = "generate_code_generic.j2"
         self.last_feedback_content = {}
+        # 最近一次渲染的提示模板（LLM 用量按模板汇总）
+        self.prompt_template = None
     
     def add_message(self, role: str, content: str):
         """添加消息到对话历史"""
@@ -72,80 +100,273 @@ class ChatSession:
         else:
             return str(content)
     
-    def get_response(self, custom_prompt: str = None, response_format: Dict = None) -> str:
-        """获取LLM响应"""
+    def get_response(self, custom_prompt: str = None, response_format: Dict = None,
+                     stop_at_code_block: bool = False) -> str:
+        """
+        获取LLM响应。
+        stop_at_code_block 为 True 且启用了流式响应时，第一个完整的 ```verilog 代码块
+        结束后立即停止生成并返回（只用于期望代码输出的调用）。
+        """
         try:
-            # 获取当前模型配置
-            model_config = self.config_manager.get_model_config()
-            
-            # 从客户端池获取客户端
-            client = self.client_pool.get_client(model_config)
-            
-            # 准备消息
-            messages_for_llm = self.messages.copy()
-            if custom_prompt:
-                messages_for_llm.append({"role": "user", "content": custom_prompt})
-            
-            # 添加系统消息
-            if self.system_message and not any(msg["role"] == "system" for msg in messages_for_llm):
-                messages_for_llm.insert(0, {"role": "system", "content": self.system_message})
-            
-            # 记录提示
-            self._log_llm_prompt(messages_for_llm)
-            
-            # 准备API参数
-            api_params = {
-                "model": model_config.name,
-                "messages": messages_for_llm
-            }
-            
-            # 添加可选参数
-            if hasattr(model_config, 'temperature') and model_config.temperature is not None:
-                api_params["temperature"] = model_config.temperature
+            model_config, api_params = self._build_request(custom_prompt, response_format)
             
-            if hasattr(model_config, 'max_tokens') and model_config.max_tokens is not None:
-                api_params["max_tokens"] = model_config.max_tokens
+            # 调用LLM（重试次数取模型的 api_config.max_retries）
+            try:
+                response_content = self.retry_strategy.execute_with_retry(
+                    lambda: self._create_completion(model_config, api_params, stop_at_code_block),
+                    RetryErrorType.LLM_API_ERROR,
+                    operation_name=f"llm_call:{model_config.name}",
+                    context={"role": self.role},
+                    max_retries=model_config.api_config.max_retries,
+                    hedge=self.hedging
+                ).strip()
+            except AgentError as e:
+                cause = e.__cause__ or e
+                if isinstance(cause, APIStatusError):
+                    return f"// Error: LLM API Error: {cause.status_code}"
+                return f"// Error: Failed to get LLM response: {str(cause)}"
             
-            if response_format:
-                api_params["response_format"] = response_format
+            # 记录响应
+            self._log_llm_response(response_content)
             
-            # 调用LLM (简化版，无复杂重试)
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    response = client.chat.completions.create(**api_params)
-                    response_content = response.choices[0].message.content.strip()
-                    
-                    # 记录响应
-                    self._log_llm_response(response_content)
-                    
-                    # 添加到对话历史
-                    self.add_message("assistant", response_content)
-                    
-                    return response_content
-                    
-                except APIStatusError as e:
-                    self.logger.warning(f"API error (attempt {attempt + 1}): {e}")
-                    if attempt < max_retries - 1:
-                        time.sleep(2 ** attempt)  # 简单退避
-                        continue
-                    else:
-                        return f"// Error: LLM API Error: {e.status_code}"
-                
-                except Exception as e:
-                    self.logger.error(f"Unexpected error in LLM call: {e}")
-                    if attempt < max_retries - 1:
-                        time.sleep(2)
-                        continue
-                    else:
-                        return f"// Error: Failed to get LLM response: {str(e)}"
+            # 添加到对话历史
+            self.add_message("assistant", response_content)
+            self.context.ledger.record_completion(
+                get_token_counter(model_config.name).count(response_content)
+            )
             
-            return "// Error: Max retries reached"
+            return response_content
             
         except Exception as e:
             self.logger.error(f"Failed to get LLM response: {str(e)}")
             return f"// Error: {str(e)}"
     
+    def _build_request(self, custom_prompt: str = None, response_format: Dict = None):
+        """按当前模型配置组装消息（系统消息在前，历史按 token 预算裁剪）和API参数"""
+        # 获取当前模型配置
+        model_config = self.config_manager.get_model_config()
+        
+        # 准备消息
+        messages_for_llm = self.context.build(
+            self.messages,
+            system_message=self.system_message,
+            extra_prompt=custom_prompt,
+            model_name=model_config.name
+        )
+        
+        # 记录提示
+        self._log_llm_prompt(messages_for_llm)
+        
+        # 准备API参数
+        api_params = {
+            "model": model_config.name,
+            "messages": messages_for_llm
+        }
+        
+        # 添加可选参数
+        if hasattr(model_config, 'temperature') and model_config.temperature is not None:
+            api_params["temperature"] = model_config.temperature
+        
+        if hasattr(model_config, 'max_tokens') and model_config.max_tokens is not None:
+            api_params["max_tokens"] = model_config.max_tokens
+        
+        if response_format:
+            api_params["response_format"] = response_format
+        
+        return model_config, api_params
+    
+    def get_candidate_responses(self, custom_prompt: str, n: int, stop_at_code_block: bool = False,
+                                use_n: bool = False) -> List[str]:
+        """
+        对同一提示并发获取 n 个候选响应（use_n 为 True 时用一次请求的 n 参数，否则发出 n 个并行请求）。
+        候选不写入对话历史，由调用方选定后通过 add_message 记录；全部失败时返回空列表。
+        """
+        model_config, api_params = self._build_request(custom_prompt)
+        retry_kwargs = {
+            "context": {"role": self.role},
+            "max_retries": model_config.api_config.max_retries
+        }
+        
+        candidates: List[str] = []
+        if use_n:
+            params = dict(api_params, n=n)
+            template_name = self.prompt_template
+            
+            def request(lease):
+                started = time.perf_counter()
+                choices = self._request_choices(lease, params)
+                self._record_llm_usage(model_config, lease, params, choices,
+                                       time.perf_counter() - started, template_name)
+                return choices
+            
+            try:
+                candidates = self.retry_strategy.execute_with_retry(
+                    lambda: self.client_pool.call_with_failover(
+                        model_config,
+                        request,
+                        estimated_tokens=self.context.ledger.last_prompt_tokens + n * (api_params.get("max_tokens") or 0)
+                    ),
+                    RetryErrorType.LLM_API_ERROR,
+                    operation_name=f"llm_candidates:{model_config.name}",
+                    **retry_kwargs
+                )
+            except AgentError as e:
+                self.logger.error(f"Failed to get candidate responses: {e.__cause__ or e}")
+        else:
+            with ThreadPoolExecutor(max_workers=n, thread_name_prefix="llm-candidate") as pool:
+                futures = [
+                    pool.submit(
+                        self.retry_strategy.execute_with_retry,
+                        lambda: self._create_completion(model_config, api_params, stop_at_code_block),
+                        RetryErrorType.LLM_API_ERROR,
+                        f"llm_call:{model_config.name}",
+                        hedge=self.hedging,
+                        **retry_kwargs
+                    )
+                    for _ in range(n)
+                ]
+                for future in futures:
+                    try:
+                        candidates.append(future.result())
+                    except AgentError as e:
+                        self.logger.warning(f"Candidate request failed: {e.__cause__ or e}")
+        
+        candidates = [c.strip() for c in candidates if c and c.strip()]
+        counter = get_token_counter(model_config.name)
+        for i, candidate in enumerate(candidates, 1):
+            self.logger.log(DIALOGUE_LOG_LEVEL, f"Candidate {i}/{len(candidates)}:")
+            self._log_llm_response(candidate)
+        self.context.ledger.record_completion(sum(counter.count(c) for c in candidates))
+        return candidates
+    
+    def _request_choices(self, lease, api_params: Dict[str, Any]) -> List[str]:
+        """非流式调用，返回全部 choices 的内容（用于 n > 1）"""
+        raw_response = lease.client.with_options(max_retries=0).chat.completions.with_raw_response.create(**api_params)
+        response = raw_response.parse()
+        lease.record_response(raw_response.headers)
+        lease.record_usage(getattr(response, "usage", None))
+        return [choice.message.content or "" for choice in response.choices]
+    
+    def get_oneshot_response(self, prompt: str, system_message: str = None, response_format: Dict = None,
+                             operation_name: str = "llm_oneshot") -> str:
+        """
+        不使用也不写入对话历史的单次调用（如结构化的预分析），
+        同样经过密钥调度和重试策略；最终失败或响应为空时抛出 AgentError。
+        """
+        model_config = self.config_manager.get_model_config()
+        messages = [
+            {"role": "system", "content": system_message or self.system_message},
+            {"role": "user", "content": prompt}
+        ]
+        api_params = {"model": model_config.name, "messages": messages}
+        if getattr(model_config, 'temperature', None) is not None:
+            api_params["temperature"] = model_config.temperature
+        if response_format:
+            api_params["response_format"] = response_format
+        
+        self._log_llm_prompt(messages)
+        estimated_tokens = get_token_counter(model_config.name).count_messages(messages)
+        response_content = self.retry_strategy.execute_with_retry(
+            lambda: self._create_completion(model_config, api_params, False, estimated_tokens,
+                                            usage_label=operation_name),
+            RetryErrorType.LLM_API_ERROR,
+            operation_name=f"{operation_name}:{model_config.name}",
+            context={"role": self.role},
+            max_retries=model_config.api_config.max_retries
+        )
+        # 内容被过滤或只返回工具调用时 content 为 None
+        response_content = (response_content or "").strip()
+        if not response_content:
+            raise AgentError(f"Empty LLM response for {operation_name}", context={"role": self.role})
+        self._log_llm_response(response_content)
+        return response_content
+    
+    def _create_completion(self, model_config, api_params: Dict[str, Any], stop_at_code_block: bool,
+                           estimated_tokens: Optional[int] = None, usage_label: Optional[str] = None) -> str:
+        """
+        通过客户端池在所有API密钥之间调度本次调用（按密钥限流，429 时换用其他密钥）。
+        成功的调用按 usage_label（默认为最近渲染的提示模板）计入 LLM 用量指标。
+        """
+        if estimated_tokens is None:
+            estimated_tokens = self.context.ledger.last_prompt_tokens
+        estimated_tokens += api_params.get("max_tokens") or 0
+        template_name = usage_label or self.prompt_template
+        
+        def request(lease):
+            started = time.perf_counter()
+            content = self._request_completion(lease, api_params, stop_at_code_block)
+            self._record_llm_usage(model_config, lease, api_params, [content],
+                                   time.perf_counter() - started, template_name)
+            return content
+        
+        return self.client_pool.call_with_failover(model_config, request, estimated_tokens=estimated_tokens)
+    
+    def _record_llm_usage(self, model_config, lease, api_params: Dict[str, Any], outputs: List[str],
+                          latency: float, template_name: Optional[str]):
+        """把一次调用的 token 用量、耗时和费用计入指标（响应中没有 usage 时按本地 token 计数估算）"""
+        estimated = lease.prompt_tokens is None
+        if estimated:
+            counter = get_token_counter(model_config.name)
+            prompt_tokens = counter.count_messages(api_params["messages"])
+            completion_tokens = sum(counter.count(output or "") for output in outputs)
+        else:
+            prompt_tokens = lease.prompt_tokens
+            completion_tokens = lease.completion_tokens or 0
+        cached_tokens = lease.cached_tokens or 0
+        self.metrics.record_llm_call(
+            getattr(self.agent, "current_experiment", "unknown_experiment"),
+            getattr(self.agent, "name", None),
+            model_name=model_config.name,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            latency=latency,
+            cost=llm_call_cost(getattr(model_config, "pricing", None), prompt_tokens, completion_tokens, cached_tokens),
+            template_name=template_name,
+            estimated=estimated
+        )
+    
+    def _request_completion(self, lease, api_params: Dict[str, Any], stop_at_code_block: bool) -> str:
+        """调用LLM；启用流式响应时逐块接收，必要时在代码块结束后取消剩余生成"""
+        # 对冲请求中已落败（例如等待密钥期间另一方已返回）时不再发出请求
+        if hedge_cancelled():
+            raise HedgeCancelled("hedged request lost before it was sent")
+        # 关闭 SDK 内部重试，避免与 RetryStrategy 的重试叠加
+        completions = lease.client.with_options(max_retries=0).chat.completions.with_raw_response
+        if not self.streaming:
+            raw_response = completions.create(**api_params)
+            response = raw_response.parse()
+            lease.record_response(raw_response.headers)
+            lease.record_usage(getattr(response, "usage", None))
+            return response.choices[0].message.content or ""
+        
+        # stream_usage 时服务端在最后一个数据块中返回 usage（提前停止生成时收不到）
+        stream_params = {"stream_options": {"include_usage": True}} if self.stream_usage else {}
+        raw_response = completions.create(stream=True, **stream_params, **api_params)
+        lease.record_response(raw_response.headers)
+        stream = raw_response.parse()
+        parser = VerilogBlockStream()
+        stop_early = stop_at_code_block and self.stream_stop_at_code_block
+        try:
+            for chunk in stream:
+                if hedge_cancelled():
+                    # 对冲请求的另一方已先返回：关闭连接（见 finally），释放密钥租约，不计入用量
+                    raise HedgeCancelled("hedged request lost, stream closed")
+                if getattr(chunk, "usage", None) is not None:
+                    lease.record_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                if parser.feed(chunk.choices[0].delta.content) and stop_early:
+                    self.stream_early_stops += 1
+                    self.logger.debug("Verilog code block complete, cancelling the rest of the generation")
+                    return parser.text_until_block
+        finally:
+            # 关闭连接，服务端随之停止生成
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+        return parser.text
+    
     def _log_llm_prompt(self, messages: List[Dict]):
         """记录LLM提示"""
         formatted_prompt = f"""
@@ -167,6 +388,7 @@ class ChatSession:
     def reset_session(self):
         """重置聊天会话"""
         self.messages.clear()
+        self.context.ledger.reset()
         self.reset_session_state()
         self.logger.info("Chat session reset")
     
@@ -175,11 +397,12 @@ class ChatSession:
         return {
             "message_count": len(self.messages),
             "has_generated_code": bool(self.last_generated_code),
-            "analyzed_dff": self.analyzed_dff_need
+            "analyzed_dff": self.analyzed_dff_need,
+            "history_strategy": self.context.strategy,
+            "stream_early_stops": self.stream_early_stops,
+            "token_ledger": self.context.ledger.get_summary()
         }
     
     def update_model_config(self):
-        """更新模型配置"""
-        # 清除客户端池缓存，确保使用新配置
-        self.client_pool.clear_all()
+        """更新模型配置（每次调用都按当前模型配置取客户端，无需清空客户端池）"""
         self.logger.info("ChatSession model configuration updated")
\ No newline at end of file
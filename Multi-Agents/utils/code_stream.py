@@ -0,0 +1,81 @@
+# utils/code_stream.py - 流式响应中的代码块解析
+"""增量解析流式 LLM 响应，在 ```verilog 代码块的结束标记到达时立即给出完整代码"""
+
+import re
+from typing import List, Optional
+
+_OPEN_FENCE_RE = re.compile(r"```verilog", re.IGNORECASE)
+_OPEN_FENCE_LEN = len("```verilog")
+_FENCE = "```"
+
+_OVERLAP = _OPEN_FENCE_LEN - 1  # 保留的上一段末尾字符数，用于识别跨块断开的标记
+
+class VerilogBlockStream:
+    """
+    逐块接收流式文本，检测第一个完整的 ```verilog ... ``` 代码块。
+    只有包含 endmodule 的代码块才视为完整（跳过示例片段）；
+    文本块存放在列表中，每次只扫描新到达的文本（加上一段末尾的少量字符，跨块断开的代码块标记也能被识别），
+    只在遇到结束标记时才拼接全文，总开销与文本长度成线性。
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._length = 0
+        self._tail = ""  # 已收到文本的最后 _OVERLAP 个字符
+        self._scan_from = 0
+        self._code_start: Optional[int] = None
+        self.block_end: Optional[int] = None  # 代码块结束标记之后的位置
+        self.code: Optional[str] = None
+
+    @property
+    def completed(self) -> bool:
+        """是否已收到完整的代码块"""
+        return self.block_end is not None
+
+    @property
+    def text(self) -> str:
+        """目前收到的全部文本"""
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    @property
+    def text_until_block(self) -> str:
+        """截止到代码块结束标记的文本（尚未完成时为全部文本）"""
+        return self.text if self.block_end is None else self.text[:self.block_end]
+
+    def feed(self, chunk: str) -> bool:
+        """追加一段文本；本次追加使代码块完整时返回 True（只返回一次）"""
+        if not chunk:
+            return False
+        self._chunks.append(chunk)
+        window_start = self._length - len(self._tail)
+        window = self._tail + chunk
+        self._length += len(chunk)
+        self._tail = window[-_OVERLAP:]
+        if self.completed:
+            return False
+
+        # 扫描窗口中的位置 i 对应全文位置 window_start + i
+        while True:
+            if self._code_start is None:
+                match = _OPEN_FENCE_RE.search(window, max(self._scan_from - window_start, 0))
+                if match is None:
+                    return False
+                self._code_start = window_start + match.end()
+                self._scan_from = self._code_start
+
+            close = window.find(_FENCE, max(self._scan_from - window_start, 0))
+            if close == -1:
+                return False
+            close += window_start
+
+            code = self.text[self._code_start:close]
+            if "endmodule" in code:
+                self.code = code.strip()
+                self.block_end = close + len(_FENCE)
+                return True
+
+            # 不完整的代码片段，继续寻找下一个代码块
+            self._code_start = None
+            self._scan_from = close + len(_FENCE)
@@ -0,0 +1,240 @@
+# utils/context_window.py - 对话上下文窗口与 token 预算
+"""按 token 预算裁剪对话历史（滑动窗口 / 摘要压缩），并记录每个会话的 token 账本"""
+
+import re
+import time
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# 每条消息的格式开销（role、分隔符），与 OpenAI chat 格式的计数方式一致
+TOKENS_PER_MESSAGE = 4
+# 回复起始的固定开销
+TOKENS_PER_REPLY = 2
+
+STRATEGIES = ("full", "sliding_window", "summary")
+
+_CODE_BLOCK_RE = re.compile(r"```(?:\w+)?\s*\n.*?```", re.DOTALL)
+_MODULE_RE = re.compile(r"\bmodule\s+(\w+)")
+
+class TokenCounter:
+    """
+    token 计数器：安装了 tiktoken 时按模型对应的编码计数，
+    否则按 UTF-8 字节粗略估算（ASCII 约 4 字符 / token，CJK 约 1 字符 / token）。
+    """
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name
+        self._encoding = self._load_encoding(model_name)
+        self.exact = self._encoding is not None
+        # 同一段文本（例如反复发送的历史消息）只计数一次
+        self.count = lru_cache(maxsize=4096)(self._count)
+
+    @staticmethod
+    def _load_encoding(model_name: Optional[str]):
+        try:
+            import tiktoken
+        except ImportError:
+            return None
+        try:
+            return tiktoken.encoding_for_model(model_name or "")
+        except Exception:
+            try:
+                return tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                return None
+
+    def _count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        extra_bytes = len(text.encode("utf-8")) - len(text)
+        non_ascii = extra_bytes // 2
+        return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        """单条消息的 token 数（含格式开销）"""
+        return TOKENS_PER_MESSAGE + self.count(str(message.get("content", "")))
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        """消息列表的 token 数（含回复起始开销）"""
+        return sum(self.count_message(m) for m in messages) + TOKENS_PER_REPLY
+
+@lru_cache(maxsize=16)
+def get_token_counter(model_name: Optional[str] = None) -> TokenCounter:
+    """按模型名获取共享的 token 计数器"""
+    return TokenCounter(model_name)
+
+@dataclass
+class LedgerEntry:
+    """单次 LLM 调用的 token 记录"""
+    timestamp: float
+    history_tokens: int  # 不裁剪时需要发送的 token 数
+    prompt_tokens: int  # 实际发送的 token 数
+    messages_sent: int
+    messages_dropped: int
+    compacted: bool
+    completion_tokens: int = 0
+
+@dataclass
+class TokenLedger:
+    """会话级 token 账本"""
+    entries: List[LedgerEntry] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_prompt(self, entry: LedgerEntry):
+        with self._lock:
+            self.entries.append(entry)
+
+    def record_completion(self, completion_tokens: int):
+        """把回复的 token 数记到最近一次调用上"""
+        with self._lock:
+            if self.entries:
+                self.entries[-1].completion_tokens = completion_tokens
+
+    def reset(self):
+        with self._lock:
+            self.entries.clear()
+
+    @property
+    def last_prompt_tokens(self) -> int:
+        """最近一次调用发送的 token 数"""
+        with self._lock:
+            return self.entries[-1].prompt_tokens if self.entries else 0
+
+    def get_summary(self) -> Dict[str, Any]:
+        """账本汇总"""
+        with self._lock:
+            history = sum(e.history_tokens for e in self.entries)
+            prompt = sum(e.prompt_tokens for e in self.entries)
+            return {
+                "calls": len(self.entries),
+                "prompt_tokens": prompt,
+                "completion_tokens": sum(e.completion_tokens for e in self.entries),
+                "tokens_saved": history - prompt,
+                "messages_dropped": sum(e.messages_dropped for e in self.entries),
+                "compactions": sum(1 for e in self.entries if e.compacted),
+                "last_prompt_tokens": self.entries[-1].prompt_tokens if self.entries else 0
+            }
+
+class ContextWindow:
+    """
+    对话上下文窗口：在 token 预算内挑选要发送的历史消息。
+
+    始终保留（pin）系统提示、最近一条包含代码的消息以及当前这轮的提示；
+    其余历史按从新到旧填入剩余预算：
+    - full: 不裁剪，发送全部历史
+    - sliding_window: 丢弃放不下的较早消息
+    - summary: 较早的消息压缩成一条摘要（代码块只保留模块名），摘要最多占用 summary_ratio 的预算
+    """
+
+    def __init__(self, token_budget: int = 12000, strategy: str = "sliding_window",
+                 summary_ratio: float = 0.125, summary_line_chars: int = 200):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown history strategy: {strategy}, expected one of {STRATEGIES}")
+        self.token_budget = token_budget
+        self.strategy = strategy
+        self.summary_ratio = summary_ratio
+        self.summary_line_chars = summary_line_chars
+        self.ledger = TokenLedger()
+
+    def build(self, history: List[Dict[str, Any]], system_message: Optional[str] = None,
+              extra_prompt: Optional[str] = None, model_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """组装本次调用要发送的消息，并记入 token 账本"""
+        counter = get_token_counter(model_name)
+        messages = list(history)
+        if extra_prompt:
+            messages.append({"role": "user", "content": extra_prompt})
+
+        system = [m for m in messages if m.get("role") == "system"]
+        if not system and system_message:
+            system = [{"role": "system", "content": system_message}]
+        conversation = [m for m in messages if m.get("role") != "system"]
+
+        full = system + conversation
+        full_tokens = counter.count_messages(full)
+        if self.strategy == "full" or full_tokens <= self.token_budget or not conversation:
+            self._record(full_tokens, full_tokens, len(full), 0, False)
+            return full
+
+        costs = [counter.count_message(m) for m in conversation]
+        pinned = {len(conversation) - 1}
+        code_index = self._latest_code_index(conversation)
+        if code_index is not None:
+            pinned.add(code_index)
+
+        remaining = self.token_budget - counter.count_messages(system) - sum(costs[i] for i in pinned)
+        summary_budget = int(self.token_budget * self.summary_ratio) if self.strategy == "summary" else 0
+        remaining -= summary_budget
+
+        # 从新到旧填充窗口，放不下就停止（保持窗口连续）
+        keep = set(pinned)
+        for i in range(len(conversation) - 1, -1, -1):
+            if i in pinned:
+                continue
+            if costs[i] > remaining:
+                break
+            keep.add(i)
+            remaining -= costs[i]
+
+        dropped = [m for i, m in enumerate(conversation) if i not in keep]
+        selected = [m for i, m in enumerate(conversation) if i in keep]
+
+        compacted = False
+        if dropped and summary_budget > 0:
+            summary = self._summarize(dropped, summary_budget, counter)
+            if summary:
+                selected.insert(0, {"role": "user", "content": summary})
+                compacted = True
+
+        result = system + selected
+        self._record(full_tokens, counter.count_messages(result), len(result), len(dropped), compacted)
+        return result
+
+    def _record(self, history_tokens: int, prompt_tokens: int, sent: int, dropped: int, compacted: bool):
+        self.ledger.record_prompt(LedgerEntry(
+            timestamp=time.time(),
+            history_tokens=history_tokens,
+            prompt_tokens=prompt_tokens,
+            messages_sent=sent,
+            messages_dropped=dropped,
+            compacted=compacted
+        ))
+
+    @staticmethod
+    def _latest_code_index(conversation: List[Dict[str, Any]]) -> Optional[int]:
+        """最近一条包含 Verilog 代码的消息"""
+        for i in range(len(conversation) - 1, -1, -1):
+            content = str(conversation[i].get("content", ""))
+            if "```" in content or ("module" in content and "endmodule" in content):
+                return i
+        return None
+
+    def _summarize(self, dropped: List[Dict[str, Any]], budget: int, counter: TokenCounter) -> str:
+        """把较早的消息压缩为逐条一行的摘要，超出预算时优先丢弃最早的行"""
+        header = "Summary of the earlier conversation (older messages were compacted):"
+        lines = [self._summary_line(m) for m in dropped]
+        line_costs = [counter.count(line) + 1 for line in lines]
+        total = counter.count(header) + TOKENS_PER_MESSAGE + sum(line_costs)
+        start = 0
+        while start < len(lines) and total > budget:
+            total -= line_costs[start]
+            start += 1
+        if start >= len(lines):
+            return ""
+        return "\n".join([header] + lines[start:])
+
+    def _summary_line(self, message: Dict[str, Any]) -> str:
+        content = str(message.get("content", ""))
+
+        def replace_code(match) -> str:
+            module = _MODULE_RE.search(match.group(0))
+            return f"[code: module {module.group(1)}]" if module else "[code]"
+
+        content = _CODE_BLOCK_RE.sub(replace_code, content)
+        content = " ".join(content.split())
+        if len(content) > self.summary_line_chars:
+            content = content[:self.summary_line_chars] + "..."
+        return f"- {message.get('role', 'user')}: {content}"
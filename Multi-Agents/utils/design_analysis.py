@@ -0,0 +1,167 @@
+# utils/design_analysis.py - 设计需求预分析
+"""代码生成前的设计需求预分析（D 触发器需求 + 所需组件），结果按设计需求内容哈希缓存"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional
+
+from src.config import get_config_manager
+
+# 修改提示或输出结构时递增，旧的缓存随之失效
+ANALYSIS_VERSION = 1
+
+DESIGN_ANALYSIS_SYSTEM_MESSAGE = "You are an expert hardware design assistant."
+
+DESIGN_ANALYSIS_PROMPT = """
+Analyze the following Verilog design requirements.
+1. Determine if a d flip-flop or register is needed.
+2. Determine which fundamental logic gates or components are needed.
+
+Design Requirements:
+{design_requirements}
+
+Respond in JSON format:
+{{
+"needs_flip_flop": true/false,
+"reason": "explanation",
+"required_components": ["xor", "not", "and", "or", "mux", ...],
+"components_reason": "explanation"
+}}
+"""
+
+@dataclass
+class DesignAnalysis:
+    """一次预分析的全部结果"""
+    needs_flip_flop: bool = False
+    reason: str = ""
+    required_components: List[str] = field(default_factory=list)
+    components_reason: str = ""
+
+    @classmethod
+    def from_response(cls, data: Any) -> "DesignAnalysis":
+        """从 LLM 返回的 JSON 构建（容忍列表包裹、字符串布尔值等格式偏差）"""
+        if isinstance(data, list):
+            data = data[0] if data else {}
+        if not isinstance(data, dict):
+            raise ValueError(f"Unexpected analysis format: {type(data).__name__}")
+
+        needs_flip_flop = data.get("needs_flip_flop", False)
+        if isinstance(needs_flip_flop, str):
+            needs_flip_flop = needs_flip_flop.strip().lower() in ("true", "yes", "1")
+
+        components = data.get("required_components") or []
+        if isinstance(components, str):
+            components = [c.strip() for c in components.split(",")]
+
+        return cls(
+            needs_flip_flop=bool(needs_flip_flop),
+            reason=str(data.get("reason", "")),
+            required_components=[str(c) for c in components if str(c).strip()],
+            components_reason=str(data.get("components_reason", ""))
+        )
+
+    @property
+    def dff_result(self) -> Dict[str, Any]:
+        """D 触发器分析结果（与 Reviewer 使用的 dff_analysis 格式一致）"""
+        return {"needs_flip_flop": self.needs_flip_flop, "reason": self.reason}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+def design_analysis_key(design_requirements: str, model_name: str) -> str:
+    """缓存键：分析版本 + 模型 + 设计需求（即提示文件内容）的哈希"""
+    digest = hashlib.sha256()
+    for part in (str(ANALYSIS_VERSION), model_name or "", design_requirements):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class DesignAnalysisCache:
+    """
+    预分析结果缓存：内存中按键保存，配置了 cache_dir 时同时写入磁盘（每个键一个 JSON 文件），
+    重复运行同一题目时直接复用，跳过预分析调用。
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self._entries: Dict[str, DesignAnalysis] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[DesignAnalysis]:
+        with self._lock:
+            analysis = self._entries.get(key)
+            if analysis is not None:
+                self.stats["hits"] += 1
+                return analysis
+
+        analysis = self._load(key)
+        with self._lock:
+            if analysis is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries[key] = analysis
+            self.stats["disk_hits"] += 1
+            return analysis
+
+    def put(self, key: str, analysis: DesignAnalysis):
+        with self._lock:
+            self._entries[key] = analysis
+            self.stats["stores"] += 1
+        if not self.cache_dir:
+            return
+        # 先写临时文件再替换，并行运行时不会读到写了一半的文件
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(analysis.to_dict(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(f"Failed to write design analysis cache {path}: {e}")
+
+    def _load(self, key: str) -> Optional[DesignAnalysis]:
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return DesignAnalysis.from_response(json.load(f))
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable design analysis cache {path}: {e}")
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "cache_dir": self.cache_dir, **self.stats}
+
+# 全局预分析缓存实例（首次使用时按实验配置创建）
+_design_analysis_cache: Optional[DesignAnalysisCache] = None
+_design_analysis_cache_lock = threading.Lock()
+
+def get_design_analysis_cache() -> DesignAnalysisCache:
+    """获取全局预分析缓存"""
+    global _design_analysis_cache
+    with _design_analysis_cache_lock:
+        if _design_analysis_cache is None:
+            experiments = get_config_manager().config.experiments
+            cache_dir = None
+            if experiments.design_analysis_cache:
+                cache_dir = experiments.design_analysis_cache_dir or os.path.join(
+                    experiments.output_base_dir, "design_analysis_cache"
+                )
+            _design_analysis_cache = DesignAnalysisCache(cache_dir=cache_dir)
+        return _design_analysis_cache
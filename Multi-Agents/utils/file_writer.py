@@ -0,0 +1,229 @@
+# utils/file_writer.py - 后台批量文件写入
+"""
+后台批量写入文本文件：调用方只把记录放入内存队列，不等待磁盘。
+写入线程按条数或时间间隔成批提交（group commit），每个文件每批只打开一次；
+每条记录用一次 O_APPEND 写入并持有文件锁，多线程 / 多进程并发追加时记录不会交错。
+"""
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.config import get_config_manager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FSYNC_POLICIES = ("none", "batch", "always")
+DEFAULT_FLUSH_TIMEOUT = 30.0  # flush() 默认最多等待的秒数
+
+@dataclass
+class WriteRecord:
+    """一条待写入的记录；truncate 为 True 时覆盖文件（如每个实验一次的 llm_summary.txt）"""
+    path: str
+    text: str
+    truncate: bool = False
+
+class BufferedFileWriter:
+    """
+    后台写入线程：
+    - 队列中积累 flush_records 条记录或最早的记录等待超过 flush_interval_ms 时提交一批
+    - fsync 策略：none（交给操作系统）/ batch（每批每个文件一次）/ always（每条记录一次）
+    - flush() 等待此前放入的记录全部落盘；单条记录写入失败只记录错误，不会终止写入线程
+    """
+
+    def __init__(self, flush_records: int = 64, flush_interval_ms: int = 200, fsync: str = "none"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}, expected one of {FSYNC_POLICIES}")
+        self.flush_records = max(1, flush_records)
+        self.flush_interval = max(0, flush_interval_ms) / 1000.0
+        self.fsync = fsync
+        self.logger = logging.getLogger(__name__)
+        self.stats = {"records": 0, "batches": 0, "bytes": 0, "fsyncs": 0, "errors": 0}
+
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._known_dirs = set()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="file-writer", daemon=True)
+        self._thread.start()
+
+    # 生产者接口（不阻塞）
+    def append(self, path: str, text: str):
+        """追加一条完整记录"""
+        self._put(WriteRecord(path=path, text=text))
+
+    def write(self, path: str, text: str):
+        """覆盖写入整个文件"""
+        self._put(WriteRecord(path=path, text=text, truncate=True))
+
+    def _put(self, record: WriteRecord):
+        if self._closed:
+            # 关闭后的写入直接落盘，避免丢失
+            self._write_batch([record])
+            return
+        self._queue.put(record)
+
+    def flush(self, timeout: Optional[float] = DEFAULT_FLUSH_TIMEOUT) -> bool:
+        """
+        等待此前放入的所有记录写完；超时返回 False。
+        写入线程已退出时抛出 RuntimeError（队列中的记录不会再被写入）。
+        """
+        if self._closed:
+            return True
+        self._check_thread()
+        done = threading.Event()
+        self._queue.put(done)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # 分段等待，等待期间写入线程退出时不会一直阻塞
+        while not done.wait(0.5 if deadline is None else max(0.0, min(0.5, deadline - time.monotonic()))):
+            self._check_thread()
+            if deadline is not None and time.monotonic() >= deadline:
+                self.logger.error(f"File writer flush timed out after {timeout}s "
+                                  f"({self._queue.qsize()} item(s) still queued)")
+                return False
+        return True
+
+    def _check_thread(self):
+        if not self._thread.is_alive():
+            raise RuntimeError(f"File writer thread has exited; {self._queue.qsize()} queued item(s) will not be written")
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """写完剩余记录并停止写入线程"""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # 写入线程
+    def _run(self):
+        try:
+            self._run_loop()
+        except Exception:
+            self.logger.exception("File writer thread crashed")
+            raise
+
+    def _run_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch: List[WriteRecord] = []
+            waiters: List[threading.Event] = []
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                    break  # flush 请求：立即提交
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.flush_records:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            try:
+                if batch:
+                    self._write_batch(batch)
+            finally:
+                # 写入出错也要唤醒等待方，flush() 不会因此一直阻塞
+                for waiter in waiters:
+                    waiter.set()
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[WriteRecord]):
+        """按文件分组写入（保持各文件内记录的顺序），每个文件打开一次"""
+        by_path: "OrderedDict[str, List[WriteRecord]]" = OrderedDict()
+        for record in batch:
+            by_path.setdefault(record.path, []).append(record)
+
+        for path, records in by_path.items():
+            try:
+                self._write_file(path, records)
+            except Exception as e:  # 写入线程不能因单个文件出错而退出
+                self.stats["errors"] += 1
+                self.logger.error(f"Failed to write {len(records)} record(s) to {path}: {e}")
+        self.stats["batches"] += 1
+
+    def _write_file(self, path: str, records: List[WriteRecord]):
+        directory = os.path.dirname(path)
+        if directory and directory not in self._known_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._known_dirs.add(directory)
+
+        # 覆盖写入之前的追加记录已没有意义，只从最后一次覆盖开始写
+        start = max((i for i, r in enumerate(records) if r.truncate), default=None)
+        truncate = start is not None
+        flags = os.O_WRONLY | os.O_CREAT
+        if not truncate:
+            start, flags = 0, flags | os.O_APPEND
+
+        fd = os.open(path, flags, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            # 取得文件锁之后再截断（O_TRUNC 会在加锁前清空另一个进程正在写入的文件）
+            if truncate:
+                os.ftruncate(fd, 0)
+            for record in records[start:]:
+                try:
+                    data = record.text.encode("utf-8")
+                except (AttributeError, UnicodeError) as e:
+                    # 无法编码的记录（如非 str、孤立代理字符）只跳过这一条
+                    self.stats["errors"] += 1
+                    self.logger.error(f"Skipping unwritable record for {path}: {type(e).__name__}: {e}")
+                    continue
+                view = memoryview(data)
+                while view:
+                    written = os.write(fd, view)
+                    view = view[written:]
+                self.stats["records"] += 1
+                self.stats["bytes"] += len(data)
+                if self.fsync == "always":
+                    os.fsync(fd)
+                    self.stats["fsyncs"] += 1
+            if self.fsync == "batch":
+                os.fsync(fd)
+                self.stats["fsyncs"] += 1
+        finally:
+            os.close(fd)  # 关闭时释放文件锁
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats)
+
+# 全局写入实例（首次使用时按实验配置创建，进程退出前写完剩余记录）
+_file_writer: Optional[BufferedFileWriter] = None
+_file_writer_lock = threading.Lock()
+
+def get_file_writer() -> BufferedFileWriter:
+    """获取全局后台文件写入器"""
+    global _file_writer
+    with _file_writer_lock:
+        if _file_writer is None:
+            experiments = get_config_manager().config.experiments
+            _file_writer = BufferedFileWriter(
+                flush_records=experiments.summary_flush_records,
+                flush_interval_ms=experiments.summary_flush_interval_ms,
+                fsync=experiments.summary_fsync
+            )
+            atexit.register(_file_writer.close)
+        return _file_writer
@@ -0,0 +1,183 @@
+# utils/kb_store.py - 模型实验知识库存储
+"""
+Model-incrementment 知识库的 SQLite 存储
+
+每个模型一个数据库文件，module_name 上有唯一索引：写入是单条 INSERT（已存在则忽略），
+不再每次读取并重写整个 JSON 文件；多进程 / 多线程并行写入由 SQLite 的文件锁保证不会丢失条目。
+RAG 等仍读取旧的 JSON 列表格式，需要时通过 export_json 导出。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+KB_DIR = "./knowledge_base/Model-incrementment"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    module_name TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class KnowledgeBaseStore:
+    """
+    按 module_name 去重的知识库条目存储。
+    首次打开时若数据库为空，会导入同名的旧 JSON 文件；export_json 把全部条目按写入顺序
+    以旧格式（JSON 列表）原子地写回，内容未变化时跳过。
+    """
+
+    def __init__(self, db_path: str, json_path: Optional[str] = None, busy_timeout: float = 30.0):
+        self.db_path = db_path
+        self.json_path = json_path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self.logger = logging.getLogger(__name__)
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+        self._import_legacy_json()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程一个连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    def _import_legacy_json(self):
+        """数据库为空时导入旧 JSON 文件（BEGIN IMMEDIATE 保证多个进程只导入一次）"""
+        if not self.json_path or not os.path.exists(self.json_path):
+            return
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM entries LIMIT 1").fetchone():
+                return
+            try:
+                with open(self.json_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                self.logger.warning(f"Skipping import of unreadable knowledge base {self.json_path}: {e}")
+                return
+            if not isinstance(data, list):
+                data = [data]
+            imported = sum(self._insert(conn, entry) for entry in data if isinstance(entry, dict))
+            self._set_meta(conn, "exported_max_id", self._max_id(conn))
+        self.logger.info(f"Imported {imported} entries from {self.json_path} into {self.db_path}")
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, entry: Dict[str, Any]) -> bool:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO entries (module_name, payload, created_at) VALUES (?, ?, ?)",
+            (entry.get("module_name", "unknown_module"), json.dumps(entry, ensure_ascii=False), time.time())
+        )
+        return cursor.rowcount == 1
+
+    @staticmethod
+    def _max_id(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def _set_meta(conn: sqlite3.Connection, key: str, value: Any):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def add(self, entry: Dict[str, Any]) -> bool:
+        """写入一个条目；相同 module_name 已存在时不写入并返回 False"""
+        with self._transaction() as conn:
+            return self._insert(conn, entry)
+
+    def contains(self, module_name: str) -> bool:
+        row = self._connect().execute("SELECT 1 FROM entries WHERE module_name = ?", (module_name,)).fetchone()
+        return row is not None
+
+    def get(self, module_name: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT payload FROM entries WHERE module_name = ?", (module_name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """按写入顺序返回全部条目"""
+        rows = self._connect().execute("SELECT payload FROM entries ORDER BY id").fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def export_json(self, path: Optional[str] = None, force: bool = False) -> bool:
+        """
+        以旧格式（indent=4 的 JSON 列表）导出全部条目，先写临时文件再替换。
+        导出到默认路径且上次导出后没有新条目时跳过；返回是否写了文件。
+        """
+        path = path or self.json_path
+        if not path:
+            raise ValueError("No export path given")
+        default_target = path == self.json_path
+
+        with self._transaction() as conn:
+            max_id = self._max_id(conn)
+            if default_target and not force and os.path.exists(path):
+                row = conn.execute("SELECT value FROM meta WHERE key = 'exported_max_id'").fetchone()
+                if row and int(row[0]) == max_id:
+                    return False
+            rows = conn.execute("SELECT payload FROM entries ORDER BY id").fetchall()
+            data = [json.loads(payload) for (payload,) in rows]
+
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp_path, path)
+            if default_target:
+                self._set_meta(conn, "exported_max_id", max_id)
+
+        self.logger.info(f"Exported {len(data)} knowledge base entries to {path}")
+        return True
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT：写事务一开始就持有数据库写锁，跨进程串行化"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+# 按模型缓存的存储实例
+_kb_stores: Dict[str, KnowledgeBaseStore] = {}
+_kb_stores_lock = threading.Lock()
+
+def get_kb_store(model_name: str) -> KnowledgeBaseStore:
+    """获取模型对应的知识库存储（./knowledge_base/Model-incrementment/{model}.sqlite3，旧格式为 {model}.json）"""
+    with _kb_stores_lock:
+        store = _kb_stores.get(model_name)
+        if store is None:
+            store = KnowledgeBaseStore(
+                db_path=os.path.join(KB_DIR, f"{model_name}.sqlite3"),
+                json_path=os.path.join(KB_DIR, f"{model_name}.json")
+            )
+            _kb_stores[model_name] = store
+        return store
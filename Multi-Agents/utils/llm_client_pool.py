@@ -1,13 +1,16 @@
 # utils/llm_client_pool.py - 简化版LLM客户端池
-"""简化的LLM客户端池化管理系统"""
+"""简化的LLM客户端池化管理系统（所有客户端共享一个 httpx 连接池）"""
 
+import re
 import threading
 import time
-import hashlib
-from typing import Dict, Optional
-from openai import OpenAI
-from dataclasses import dataclass
+import importlib.util
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+import httpx
+from openai import OpenAI, APIStatusError, DefaultHttpxClient
+from dataclasses import dataclass, field
 import logging
+from src.config import get_config_manager
 
 @dataclass
 class ClientInfo:
@@ -16,57 +19,321 @@ class ClientInfo:
     created_at: float
     last_used: float
     usage_count: int = 0
-    
-    def is_expired(self, ttl: int = 3600) -> bool:
-        """检查客户端是否过期"""
-        return time.time() - self.created_at > ttl
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """解析限流响应头中的时长，如 "1s"、"6m0s"、"20ms" 或纯数字秒数"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+def _header(headers: Optional[Mapping[str, str]], name: str) -> Optional[str]:
+    if not headers:
+        return None
+    return headers.get(name)
+
+def cached_prompt_tokens(usage: Any) -> Optional[int]:
+    """
+    响应 usage 中命中提供方提示缓存的 token 数：
+    OpenAI / Gemini 等为 prompt_tokens_details.cached_tokens，DeepSeek 为 prompt_cache_hit_tokens。
+    服务端不报告时返回 None。
+    """
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None:
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    return cached
+
+@dataclass
+class TokenBucket:
+    """
+    令牌桶：容量为每分钟限额，按 capacity / 60 每秒补充。
+    允许透支（实际用量可能超过预估），透支部分需要等待补充后才能继续申请。
+    capacity 为 None 表示不限流（直到响应头给出限额）。
+    """
+    capacity: Optional[float] = None
+    refill_per_sec: float = 0.0
+    available: float = 0.0
+    updated: float = field(default_factory=time.monotonic)
+
+    @classmethod
+    def per_minute(cls, limit: Optional[int]) -> "TokenBucket":
+        if not limit:
+            return cls()
+        return cls(capacity=float(limit), refill_per_sec=limit / 60.0, available=float(limit))
+
+    def _refill(self, now: float):
+        if self.capacity is not None:
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.refill_per_sec)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """申请 amount 需要等待的秒数"""
+        if self.capacity is None or amount <= 0:
+            return 0.0
+        self._refill(now)
+        needed = min(amount, self.capacity) - self.available
+        if needed <= 0:
+            return 0.0
+        return needed / self.refill_per_sec if self.refill_per_sec > 0 else float("inf")
+
+    def consume(self, amount: float, now: float):
+        if self.capacity is None:
+            return
+        self._refill(now)
+        self.available -= amount
+
+    def sync(self, limit: Optional[str], remaining: Optional[str], reset: Optional[str], now: float):
+        """按服务端响应头校准（x-ratelimit-limit / remaining / reset）"""
+        try:
+            limit_value = float(limit) if limit is not None else self.capacity
+            remaining_value = float(remaining) if remaining is not None else None
+        except ValueError:
+            return
+        if not limit_value or remaining_value is None:
+            return
+        reset_seconds = _parse_duration(reset)
+        self.capacity = limit_value
+        self.available = remaining_value
+        if reset_seconds and reset_seconds > 0:
+            self.refill_per_sec = max(limit_value - remaining_value, 1.0) / reset_seconds
+        else:
+            self.refill_per_sec = limit_value / 60.0
+        self.updated = now
+
+@dataclass
+class KeyState:
+    """单个API密钥的限流与调度状态"""
+    index: int
+    api_key: str
+    requests: TokenBucket
+    tokens: TokenBucket
+    in_flight: int = 0
+    cooldown_until: float = 0.0
+    consecutive_rate_limits: int = 0
+    total_requests: int = 0
+    rate_limited: int = 0
+
+    def wait_time(self, estimated_tokens: int, now: float) -> float:
+        return max(
+            self.cooldown_until - now,
+            self.requests.wait_time(1, now),
+            self.tokens.wait_time(estimated_tokens, now),
+            0.0
+        )
+
+@dataclass
+class KeyLease:
+    """一次调用占用的API密钥（调用结束后由 release 归还并记录用量）"""
+    client: OpenAI
+    key_state: KeyState
+    estimated_tokens: int
+    headers: Optional[Mapping[str, str]] = None
+    used_tokens: Optional[int] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+
+    @property
+    def key_index(self) -> int:
+        return self.key_state.index
+
+    def record_response(self, headers: Optional[Mapping[str, str]] = None, used_tokens: Optional[int] = None):
+        """记录响应头和实际 token 用量，用于校准限流"""
+        self.headers = headers
+        self.used_tokens = used_tokens
+
+    def record_usage(self, usage: Any):
+        """记录响应的 usage：总 token 数用于校准限流，提示 token 与缓存命中数计入提示缓存统计，各项用量由 ChatSession 计入指标"""
+        if usage is None:
+            return
+        self.used_tokens = getattr(usage, "total_tokens", None)
+        self.prompt_tokens = getattr(usage, "prompt_tokens", None)
+        self.completion_tokens = getattr(usage, "completion_tokens", None)
+        self.cached_tokens = cached_prompt_tokens(usage)
+
+class KeyScheduler:
+    """
+    同一服务端点的多API密钥调度：每个密钥有请求数 / token 数两个令牌桶，
+    新调用分配给等待时间最短、并发最少（其次累计请求最少）的密钥；被限流（429）的密钥在 Retry-After 内不参与调度。
+    """
+
+    def __init__(self, api_keys: List[str], requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None, preferred_index: int = 0):
+        self.keys = [
+            KeyState(index=i, api_key=key,
+                     requests=TokenBucket.per_minute(requests_per_minute),
+                     tokens=TokenBucket.per_minute(tokens_per_minute))
+            for i, key in enumerate(api_keys)
+        ]
+        self.preferred_index = preferred_index
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens: int = 0, exclude: Optional[set] = None) -> KeyState:
+        """选择密钥并预占额度；所有密钥都需要等待时阻塞到最早可用的时刻"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                candidates = [k for k in self.keys if not exclude or k.index not in exclude] or self.keys
+                best = min(candidates, key=lambda k: (
+                    k.wait_time(estimated_tokens, now),
+                    k.in_flight,
+                    k.total_requests,
+                    (k.index - self.preferred_index) % len(self.keys)
+                ))
+                wait = best.wait_time(estimated_tokens, now)
+                if wait <= 0:
+                    best.requests.consume(1, now)
+                    best.tokens.consume(estimated_tokens, now)
+                    best.in_flight += 1
+                    best.total_requests += 1
+                    return best
+            time.sleep(min(wait, 5.0))
+
+    def release(self, key_state: KeyState, estimated_tokens: int = 0, used_tokens: Optional[int] = None,
+                headers: Optional[Mapping[str, str]] = None):
+        """归还密钥，按实际用量和响应头校准令牌桶"""
+        with self._lock:
+            now = time.monotonic()
+            key_state.in_flight = max(0, key_state.in_flight - 1)
+            key_state.consecutive_rate_limits = 0
+            if used_tokens is not None:
+                key_state.tokens.consume(used_tokens - estimated_tokens, now)
+            key_state.requests.sync(
+                _header(headers, "x-ratelimit-limit-requests"),
+                _header(headers, "x-ratelimit-remaining-requests"),
+                _header(headers, "x-ratelimit-reset-requests"),
+                now
+            )
+            key_state.tokens.sync(
+                _header(headers, "x-ratelimit-limit-tokens"),
+                _header(headers, "x-ratelimit-remaining-tokens"),
+                _header(headers, "x-ratelimit-reset-tokens"),
+                now
+            )
+
+    def mark_rate_limited(self, key_state: KeyState, retry_after: Optional[float] = None) -> float:
+        """密钥被限流：归还并冷却（无 Retry-After 时按连续限流次数指数退避），返回冷却秒数"""
+        with self._lock:
+            key_state.in_flight = max(0, key_state.in_flight - 1)
+            key_state.rate_limited += 1
+            key_state.consecutive_rate_limits += 1
+            if retry_after is None:
+                retry_after = min(2.0 ** (key_state.consecutive_rate_limits - 1), 60.0)
+            key_state.cooldown_until = time.monotonic() + retry_after
+            return retry_after
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            now = time.monotonic()
+            return [{
+                "key_index": k.index,
+                "key_suffix": k.api_key[-4:],
+                "in_flight": k.in_flight,
+                "total_requests": k.total_requests,
+                "rate_limited": k.rate_limited,
+                "cooling_down": k.cooldown_until > now,
+                "requests_available": None if k.requests.capacity is None else int(k.requests.available),
+                "tokens_available": None if k.tokens.capacity is None else int(k.tokens.available)
+            } for k in self.keys]
+
 
 class LLMClientPool:
-    """简化的LLM客户端池"""
+    """
+    LLM客户端池：每个 (base_url, API密钥) 一个 OpenAI 客户端，
+    所有客户端共享同一个 httpx 连接池（keep-alive，可用时启用 HTTP/2），
+    切换模型或密钥不会断开已有连接，并行实验之间复用 TLS 连接。
+    """
     
-    def __init__(self, max_clients: int = 10, client_ttl: int = 3600):
+    def __init__(self, max_clients: int = 10, max_connections: int = 32,
+                 max_keepalive_connections: int = 16, keepalive_expiry: float = 60.0,
+                 http2: bool = True):
         self.max_clients = max_clients
-        self.client_ttl = client_ttl
-        self._clients: Dict[str, ClientInfo] = {}
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self._clients: Dict[Tuple[str, str], ClientInfo] = {}
+        self._schedulers: Dict[str, KeyScheduler] = {}
+        self._http_client: Optional[httpx.Client] = None
+        self._http_stats = {"requests": 0, "responses": 0, "http_versions": {}}
+        self._prompt_cache_stats: Dict[str, Dict[str, int]] = {}
         self._lock = threading.RLock()
         self.logger = logging.getLogger(__name__)
     
-    def _generate_client_key(self, model_config) -> str:
-        """生成客户端缓存键"""
-        key_data = f"{model_config.base_url}:{model_config.api_key}"
-        return hashlib.md5(key_data.encode()).hexdigest()
+    def _get_http_client(self) -> httpx.Client:
+        """获取共享的 httpx 客户端（首次使用时创建）"""
+        with self._lock:
+            if self._http_client is None or self._http_client.is_closed:
+                http2 = self.http2 and importlib.util.find_spec("h2") is not None
+                if self.http2 and not http2:
+                    self.logger.warning("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+                
+                self._http_client = DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_keepalive_connections,
+                        keepalive_expiry=self.keepalive_expiry
+                    ),
+                    http2=http2,
+                    event_hooks={"request": [self._on_request], "response": [self._on_response]}
+                )
+            return self._http_client
+    
+    def _on_request(self, request: httpx.Request):
+        with self._lock:
+            self._http_stats["requests"] += 1
+    
+    def _on_response(self, response: httpx.Response):
+        with self._lock:
+            self._http_stats["responses"] += 1
+            versions = self._http_stats["http_versions"]
+            versions[response.http_version] = versions.get(response.http_version, 0) + 1
     
     def get_client(self, model_config) -> OpenAI:
-        """获取或创建LLM客户端"""
+        """获取或创建LLM客户端（使用当前选中的API密钥）"""
         if not model_config or not model_config.api_key:
             raise ValueError("Invalid model configuration: missing API key")
         
-        client_key = self._generate_client_key(model_config)
+        return self._get_client_for_key(
+            model_config.base_url,
+            model_config.api_key,
+            getattr(model_config.api_config, 'timeout', 30)
+        )
+    
+    def _get_client_for_key(self, base_url: str, api_key: str, timeout: int = 30) -> OpenAI:
+        """获取或创建指定API密钥的客户端"""
+        client_key = (base_url, api_key)
         
         with self._lock:
             # 检查现有客户端
-            if client_key in self._clients:
-                client_info = self._clients[client_key]
-                
-                # 检查是否过期
-                if not client_info.is_expired(self.client_ttl):
-                    client_info.last_used = time.time()
-                    client_info.usage_count += 1
-                    return client_info.client
-                else:
-                    # 移除过期客户端
-                    del self._clients[client_key]
+            client_info = self._clients.get(client_key)
+            if client_info is not None:
+                client_info.last_used = time.time()
+                client_info.usage_count += 1
+                return client_info.client
             
-            # 检查池大小限制
+            # 检查池大小限制（客户端只是连接池之上的薄封装，移除不会断开连接）
             if len(self._clients) >= self.max_clients:
                 self._evict_least_used_client()
             
             # 创建新客户端
             try:
                 client = OpenAI(
-                    api_key=model_config.api_key,
-                    base_url=model_config.base_url,
-                    timeout=getattr(model_config, 'timeout', 30)
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=timeout,
+                    http_client=self._get_http_client()
                 )
                 
                 current_time = time.time()
@@ -83,6 +350,80 @@ class LLMClientPool:
             except Exception as e:
                 raise RuntimeError(f"Failed to create LLM client: {str(e)}")
     
+    def get_scheduler(self, model_config) -> KeyScheduler:
+        """获取模型服务端点对应的多密钥调度器"""
+        api_config = model_config.api_config
+        scheduler_key = f"{api_config.base_url}:" + ",".join(api_config.api_keys)
+        with self._lock:
+            scheduler = self._schedulers.get(scheduler_key)
+            if scheduler is None:
+                scheduler = KeyScheduler(
+                    [key for key in api_config.api_keys if key],
+                    requests_per_minute=api_config.requests_per_minute,
+                    tokens_per_minute=api_config.tokens_per_minute,
+                    preferred_index=api_config.current_key_index
+                )
+                self._schedulers[scheduler_key] = scheduler
+            return scheduler
+    
+    def call_with_failover(self, model_config, request: Callable[[KeyLease], Any], 
+                           estimated_tokens: int = 0) -> Any:
+        """
+        在所有已配置的API密钥之间调度一次调用。
+        request(lease) 使用 lease.client 发起请求，并可通过 lease.record_response 回报响应头和用量；
+        遇到 429 时冷却该密钥并换用其他密钥重试，所有密钥都被限流后抛出最后一次的异常。
+        """
+        scheduler = self.get_scheduler(model_config)
+        if not scheduler.keys:
+            raise ValueError("Invalid model configuration: missing API key")
+        
+        timeout = getattr(model_config.api_config, 'timeout', 30)
+        tried = set()
+        while True:
+            key_state = scheduler.acquire(estimated_tokens, exclude=tried)
+            lease = KeyLease(
+                client=self._get_client_for_key(model_config.base_url, key_state.api_key, timeout),
+                key_state=key_state,
+                estimated_tokens=estimated_tokens
+            )
+            try:
+                result = request(lease)
+            except APIStatusError as e:
+                if e.status_code != 429:
+                    scheduler.release(key_state, estimated_tokens)
+                    raise
+                headers = e.response.headers if e.response is not None else None
+                retry_after = _parse_duration(_header(headers, "retry-after-ms"))
+                retry_after = retry_after / 1000 if retry_after is not None else _parse_duration(_header(headers, "retry-after"))
+                cooldown = scheduler.mark_rate_limited(key_state, retry_after)
+                tried.add(key_state.index)
+                self.logger.warning(f"API key #{key_state.index} rate limited (cooling down {cooldown:.1f}s), "
+                                    f"{len(scheduler.keys) - len(tried)} other key(s) left")
+                if len(tried) >= len(scheduler.keys):
+                    raise
+                continue
+            except BaseException:
+                scheduler.release(key_state, estimated_tokens)
+                raise
+            
+            scheduler.release(key_state, estimated_tokens, lease.used_tokens, lease.headers)
+            self._record_prompt_cache(model_config.name, lease)
+            return result
+    
+    def _record_prompt_cache(self, model_name: str, lease: KeyLease):
+        """按模型累计提示 token 和命中提供方提示缓存的 token"""
+        if lease.prompt_tokens is None:
+            return
+        with self._lock:
+            stats = self._prompt_cache_stats.setdefault(
+                model_name, {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "reported": 0}
+            )
+            stats["requests"] += 1
+            stats["prompt_tokens"] += lease.prompt_tokens
+            if lease.cached_tokens is not None:
+                stats["cached_tokens"] += lease.cached_tokens
+                stats["reported"] += 1
+    
     def _evict_least_used_client(self):
         """移除最少使用的客户端"""
         if not self._clients:
@@ -97,22 +438,63 @@ class LLMClientPool:
         del self._clients[least_used_key]
     
     def clear_all(self):
-        """清空所有客户端"""
+        """清空所有客户端（共享连接池保持不变）"""
         with self._lock:
             self._clients.clear()
     
-    def get_pool_stats(self) -> Dict[str, int]:
+    def close(self):
+        """关闭共享连接池"""
+        with self._lock:
+            self._clients.clear()
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+    
+    def _open_connections(self) -> Optional[int]:
+        """共享连接池中当前的连接数（传输层不提供该信息时返回 None）"""
+        pool = getattr(getattr(self._http_client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        return len(connections) if connections is not None else None
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
         """获取池统计信息"""
         with self._lock:
             return {
                 "total_clients": len(self._clients),
                 "max_clients": self.max_clients,
-                "total_usage": sum(info.usage_count for info in self._clients.values())
+                "total_usage": sum(info.usage_count for info in self._clients.values()),
+                "http": {
+                    "max_connections": self.max_connections,
+                    "max_keepalive_connections": self.max_keepalive_connections,
+                    "open_connections": self._open_connections(),
+                    "requests": self._http_stats["requests"],
+                    "responses": self._http_stats["responses"],
+                    "http_versions": dict(self._http_stats["http_versions"])
+                },
+                "api_keys": [stats for scheduler in self._schedulers.values() for stats in scheduler.get_stats()],
+                "prompt_cache": {
+                    model: {
+                        **stats,
+                        "hit_rate": stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+                    }
+                    for model, stats in self._prompt_cache_stats.items()
+                }
             }
 
-# 全局客户端池实例
-_client_pool = LLMClientPool()
+# 全局客户端池实例（首次使用时按实验配置创建）
+_client_pool: Optional[LLMClientPool] = None
+_client_pool_lock = threading.Lock()
 
 def get_llm_client_pool() -> LLMClientPool:
     """获取全局LLM客户端池"""
-    return _client_pool
\ No newline at end of file
+    global _client_pool
+    with _client_pool_lock:
+        if _client_pool is None:
+            experiments = get_config_manager().config.experiments
+            _client_pool = LLMClientPool(
+                max_connections=experiments.llm_max_connections,
+                max_keepalive_connections=experiments.llm_max_keepalive_connections,
+                keepalive_expiry=experiments.llm_keepalive_expiry,
+                http2=experiments.llm_http2
+            )
+        return _client_pool
@@ -1,10 +1,15 @@
 # utils/metrics.py - 实时监控和指标系统
-"""实时监控和指标收集系统"""
+"""
+实时监控和指标收集系统。
+记录接口只写入调用线程自己的分片（无锁），由后台汇总线程或读取接口按周期合并到全局视图；
+耗时和 token 数使用 HDR 风格直方图统计分位数，快照可交给 utils.metrics_export 中的导出器。
+"""
 
 import time
 import threading
 import json
-from typing import Dict, List, Any, Optional, Callable
+import queue
+from typing import Dict, List, Any, Optional, Callable, Tuple
 from dataclasses import dataclass, field, asdict
 from enum import Enum
 from collections import defaultdict, deque
@@ -29,6 +34,172 @@ class EventType(Enum):
     COMPILATION = "compilation"
     SIMULATION = "simulation"
 
+class HdrHistogram:
+    """
+    HDR 风格的对数-线性直方图：观测值乘以 scale 取整后，每个 2 的幂区间等分为 2^(significant_bits-1) 个子桶，
+    相对误差不超过 2^-(significant_bits-1)，记录为 O(1)。
+    计数稀疏存储；每个实例只由一个线程写入，跨线程的结果通过 merge 合并。
+    """
+    __slots__ = ("scale", "significant_bits", "counts", "count", "sum", "min", "max")
+    
+    def __init__(self, scale: float = 1.0, significant_bits: int = 7):
+        self.scale = scale
+        self.significant_bits = significant_bits
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+    
+    def _index(self, units: int) -> int:
+        bits = self.significant_bits
+        if units < (1 << bits):
+            return units
+        shift = units.bit_length() - bits
+        return (shift << (bits - 1)) + (units >> shift)
+    
+    def _highest_equivalent(self, index: int) -> float:
+        """桶内的最大值（换算回原单位）"""
+        bits = self.significant_bits
+        if index < (1 << bits):
+            return index / self.scale
+        shift = (index >> (bits - 1)) - 1
+        mantissa = index - (shift << (bits - 1))
+        return (((mantissa + 1) << shift) - 1) / self.scale
+    
+    def record(self, value: float):
+        """记录一个观测值（负值按 0 计）"""
+        index = self._index(int(value * self.scale) if value > 0 else 0)
+        counts = self.counts
+        counts[index] = counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+    
+    def merge(self, other: "HdrHistogram"):
+        """合并另一个直方图（两者 scale 和 significant_bits 相同）"""
+        counts = self.counts
+        for index, count in other.counts.copy().items():
+            counts[index] = counts.get(index, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+    
+    def merge_delta(self, counts: Dict[int, int], previous: Dict[int, int], sum_delta: float,
+                    min_value: Optional[float], max_value: Optional[float]):
+        """合并另一个直方图自上次合并以来新增的部分（counts 为其当前计数的副本，previous 为上次合并时的副本）"""
+        own = self.counts
+        for index, count in counts.items():
+            delta = count - previous.get(index, 0)
+            if delta:
+                own[index] = own.get(index, 0) + delta
+                self.count += delta
+        self.sum += sum_delta
+        if min_value is not None and (self.min is None or min_value < self.min):
+            self.min = min_value
+        if max_value is not None and (self.max is None or max_value > self.max):
+            self.max = max_value
+    
+    def percentile(self, q: float) -> float:
+        """第 q 分位数（0-100），取所在桶的上界且不超过观测到的最大值"""
+        total = sum(self.counts.values())
+        if total == 0:
+            return 0.0
+        rank = max(1, -(-q * total // 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """汇总（count / sum / mean / min / max / p50 / p90 / p95 / p99）"""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "min": self.min or 0.0,
+            "max": self.max or 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99)
+        }
+
+# 直方图指标及其整数化比例：耗时按微秒、token 数按个
+HISTOGRAM_SCALES = {
+    "llm_latency_seconds": 1e6,
+    "llm_prompt_tokens": 1,
+    "llm_completion_tokens": 1,
+    "compilation_seconds": 1e6,
+    "simulation_seconds": 1e6
+}
+
+def llm_call_cost(pricing: Optional[Dict[str, float]], prompt_tokens: int, completion_tokens: int,
+                  cached_tokens: int = 0) -> float:
+    """
+    按模型价格表计算一次调用的费用（价格为每百万 token：input、cached_input、output）。
+    未配置 cached_input 时命中缓存的提示 token 按 input 计价；没有价格表时费用为 0。
+    """
+    if not pricing:
+        return 0.0
+    input_price = pricing.get("input", 0.0)
+    cached_price = pricing.get("cached_input", input_price)
+    cached = min(cached_tokens or 0, prompt_tokens)
+    return ((prompt_tokens - cached) * input_price
+            + cached * cached_price
+            + completion_tokens * pricing.get("output", 0.0)) / 1_000_000
+
+@dataclass
+class LLMUsageStats:
+    """一组 LLM 调用的用量、费用与分布（按智能体 / 实验 / 模型 / 模板分别聚合）"""
+    calls: int = 0
+    estimated_calls: int = 0  # 响应中没有 usage、按本地 token 计数估算的调用
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cost: float = 0.0
+    latency: HdrHistogram = field(default_factory=lambda: HdrHistogram(HISTOGRAM_SCALES["llm_latency_seconds"]))
+    prompt_tokens_hist: HdrHistogram = field(default_factory=HdrHistogram)
+    completion_tokens_hist: HdrHistogram = field(default_factory=HdrHistogram)
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "estimated_calls": self.estimated_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "total_tokens": self.total_tokens,
+            "cost": self.cost,
+            "latency": self.latency.to_dict(),
+            "prompt_tokens_hist": self.prompt_tokens_hist.to_dict(),
+            "completion_tokens_hist": self.completion_tokens_hist.to_dict()
+        }
+
+# LLM 用量的聚合维度，分片中对应的计数范围为 llm_usage:<维度>
+USAGE_DIMENSIONS = ("agent", "experiment", "model", "template")
+USAGE_SCOPE_PREFIX = "llm_usage:"
+
+# 智能体活动类型对应的计数字段
+AGENT_ACTIVITY_FIELDS = {
+    "message_sent": "messages_sent",
+    "message_received": "messages_received",
+    "error_handled": "errors_handled",
+    "llm_call": "llm_calls"
+}
+
 @dataclass
 class ExperimentMetrics:
     """实验指标"""
@@ -42,6 +213,10 @@ class ExperimentMetrics:
     simulation_attempts: int = 0
     code_generation_attempts: int = 0
     total_tokens: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cost: float = 0.0
     agent_states: Dict[str, str] = field(default_factory=dict)
     error_types: Dict[str, int] = field(default_factory=dict)
     
@@ -66,6 +241,8 @@ class AgentMetrics:
     messages_received: int = 0
     errors_handled: int = 0
     llm_calls: int = 0
+    total_tokens: int = 0
+    cost: float = 0.0
     state_transitions: int = 0
     current_state: str = "unknown"
     uptime: float = 0.0
@@ -79,6 +256,10 @@ class SystemMetrics:
     failed_experiments: int = 0
     total_llm_calls: int = 0
     total_tokens: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    total_cost: float = 0.0
     total_errors: int = 0
     average_experiment_duration: float = 0.0
     start_time: float = field(default_factory=time.time)
@@ -95,8 +276,40 @@ class SystemMetrics:
         """系统运行时间"""
         return time.time() - self.start_time
 
+class _MetricsShard:
+    """一个线程的指标分片：只由所属线程写入（无需加锁），汇总时读取其副本"""
+    
+    def __init__(self, thread: threading.Thread):
+        self.thread = thread  # 所属线程结束后分片在汇总时并入全局视图并移除
+        # (范围, 名称, 字段) -> 累计值；范围为 experiment / error_type / agent / system / custom 或 llm_usage:<维度>
+        self.counters: Dict[Tuple[str, str, str], float] = {}
+        # (指标, 维度, 键) -> 直方图；维度和键为空表示全局
+        self.histograms: Dict[Tuple[str, str, str], HdrHistogram] = {}
+        self.agent_activity: Dict[str, float] = {}
+        self.agent_states: Dict[str, Tuple[float, str]] = {}
+        self.agent_roles: Dict[str, str] = {}
+        # 已计入全局视图的计数和直方图（记录数、计数副本、总和），只由汇总方在锁内访问
+        self.applied: Dict[Tuple[str, str, str], float] = {}
+        self.applied_histograms: Dict[Tuple[str, str, str], Tuple[int, Dict[int, int], float]] = {}
+    
+    def add(self, key: Tuple[str, str, str], amount: float = 1):
+        counters = self.counters
+        counters[key] = counters.get(key, 0) + amount
+    
+    def observe(self, metric: str, value: float, dimension: str = "", key: str = ""):
+        hist_key = (metric, dimension, key)
+        histogram = self.histograms.get(hist_key)
+        if histogram is None:
+            histogram = self.histograms[hist_key] = HdrHistogram(HISTOGRAM_SCALES[metric])
+        histogram.record(value)
+
 class MetricsCollector:
-    """指标收集器"""
+    """
+    指标收集器。
+    计数和直方图由各线程写入自己的分片，读取接口、snapshot 和后台汇总线程（start_reporting）
+    在锁内把分片的增量合并到实验 / 智能体 / 系统指标；实验开始和结束等低频结构变化直接加锁更新。
+    事件订阅者由后台分发线程异步通知，不阻塞记录方。
+    """
     
     def __init__(self, max_history_size: int = 1000):
         self.max_history_size = max_history_size
@@ -106,9 +319,12 @@ class MetricsCollector:
         # 实验指标
         self.experiments: Dict[str, ExperimentMetrics] = {}
         self.experiment_history: deque = deque(maxlen=max_history_size)
+        self._finished_count = 0
+        self._finished_duration = 0.0
         
-        # 智能体指标
+        # 智能体指标（_state_times 为各智能体当前状态的记录时间）
         self.agents: Dict[str, AgentMetrics] = {}
+        self._state_times: Dict[str, float] = {}
         
         # 系统指标
         self.system_metrics = SystemMetrics()
@@ -119,11 +335,36 @@ class MetricsCollector:
         # 自定义指标
         self.custom_metrics: Dict[str, Dict[str, Any]] = defaultdict(dict)
         
-        # 指标订阅者
+        # LLM 用量：维度 -> 键（智能体名 / 实验名 / 模型名 / 模板名）-> 用量
+        self.llm_usage: Dict[str, Dict[str, LLMUsageStats]] = {dim: {} for dim in USAGE_DIMENSIONS}
+        
+        # 各线程的分片与合并后的直方图；已结束线程的分片中尚未计入的计数（所属实验尚未开始）暂存在 _pending_counters
+        self._local = threading.local()
+        self._shards: List[_MetricsShard] = []
+        self._histograms: Dict[Tuple[str, str, str], HdrHistogram] = {}
+        self._pending_counters: Dict[Tuple[str, str, str], float] = {}
+        
+        # 指标订阅者（由分发线程异步通知）
         self.subscribers: List[Callable] = []
+        self._event_queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._dispatcher: Optional[threading.Thread] = None
+        
+        # 后台汇总与导出
+        self.exporters: List[Any] = []
+        self._reporter: Optional[threading.Thread] = None
+        self._reporter_stop = threading.Event()
         
         self.logger.info("MetricsCollector initialized")
     
+    def _shard(self) -> _MetricsShard:
+        """当前线程的分片（首次使用时注册）"""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _MetricsShard(threading.current_thread())
+            with self.lock:
+                self._shards.append(shard)
+        return shard
+    
     def start_experiment(self, experiment_name: str) -> ExperimentMetrics:
         """开始实验"""
         with self.lock:
@@ -147,6 +388,8 @@ class MetricsCollector:
                 self.logger.warning(f"Experiment {experiment_name} not found")
                 return
             
+            # 先合并各线程中属于该实验的计数
+            self.aggregate()
             metric = self.experiments[experiment_name]
             metric.end_time = time.time()
             metric.success = success
@@ -157,11 +400,10 @@ class MetricsCollector:
             else:
                 self.system_metrics.failed_experiments += 1
             
-            # 计算平均实验时间
-            total_duration = sum(exp.duration for exp in self.experiments.values() if exp.end_time)
-            finished_count = len([exp for exp in self.experiments.values() if exp.end_time])
-            if finished_count > 0:
-                self.system_metrics.average_experiment_duration = total_duration / finished_count
+            # 平均实验时间（增量累计）
+            self._finished_count += 1
+            self._finished_duration += metric.duration
+            self.system_metrics.average_experiment_duration = self._finished_duration / self._finished_count
             
             # 移动到历史记录
             self.experiment_history.append(metric)
@@ -178,138 +420,169 @@ class MetricsCollector:
     def record_agent_activity(self, agent_name: str, activity_type: str, 
                             role: str = None, current_state: str = None):
         """记录智能体活动"""
-        with self.lock:
-            if agent_name not in self.agents:
-                self.agents[agent_name] = AgentMetrics(
-                    agent_name=agent_name,
-                    role=role or "unknown"
-                )
-            
-            agent_metric = self.agents[agent_name]
-            agent_metric.last_activity = time.time()
-            
-            if current_state:
-                if agent_metric.current_state != current_state:
-                    agent_metric.state_transitions += 1
-                agent_metric.current_state = current_state
-            
-            # 根据活动类型更新计数
-            if activity_type == "message_sent":
-                agent_metric.messages_sent += 1
-            elif activity_type == "message_received":
-                agent_metric.messages_received += 1
-            elif activity_type == "error_handled":
-                agent_metric.errors_handled += 1
-            elif activity_type == "llm_call":
-                agent_metric.llm_calls += 1
-                self.system_metrics.total_llm_calls += 1
-            
-            self._emit_event(EventType.AGENT_ACTION, {
-                "agent_name": agent_name,
-                "activity_type": activity_type,
-                "current_state": current_state
-            })
+        now = time.time()
+        shard = self._shard()
+        shard.agent_activity[agent_name] = now
+        if role:
+            shard.agent_roles[agent_name] = role
+        
+        if current_state:
+            previous = shard.agent_states.get(agent_name)
+            if previous is None or previous[1] != current_state:
+                shard.add(("agent", agent_name, "state_transitions"))
+            shard.agent_states[agent_name] = (now, current_state)
+        
+        # 根据活动类型更新计数
+        field_name = AGENT_ACTIVITY_FIELDS.get(activity_type)
+        if field_name:
+            shard.add(("agent", agent_name, field_name))
+        if activity_type == "llm_call":
+            shard.add(("system", "", "total_llm_calls"))
+        
+        self._emit_event(EventType.AGENT_ACTION, {
+            "agent_name": agent_name,
+            "activity_type": activity_type,
+            "current_state": current_state
+        })
     
     def record_llm_call(self, experiment_name: str, agent_name: str = None, 
-                       tokens_used: int = 0, model_name: str = None):
-        """记录LLM调用"""
-        with self.lock:
-            # 记录实验级别的LLM调用
-            if experiment_name in self.experiments:
-                self.experiments[experiment_name].llm_calls += 1
-                if tokens_used > 0:
-                    self.experiments[experiment_name].total_tokens += tokens_used
-                    self.system_metrics.total_tokens += tokens_used
-            
-            # 记录智能体级别的LLM调用
-            if agent_name:
-                self.record_agent_activity(agent_name, "llm_call")
-            
-            self._emit_event(EventType.LLM_CALL, {
-                "experiment_name": experiment_name,
-                "agent_name": agent_name,
-                "tokens_used": tokens_used,
-                "model_name": model_name
-            })
+                       tokens_used: int = 0, model_name: str = None,
+                       prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0,
+                       latency: Optional[float] = None, cost: float = 0.0,
+                       template_name: str = None, estimated: bool = False):
+        """
+        记录LLM调用。
+        给出 prompt_tokens / completion_tokens 时按智能体、实验、模型和模板累计用量、费用与耗时分布；
+        tokens_used 为空时取两者之和。
+        """
+        tokens_used = tokens_used or prompt_tokens + completion_tokens
+        shard = self._shard()
+        add = shard.add
+        totals = (("prompt_tokens", prompt_tokens), ("completion_tokens", completion_tokens),
+                  ("cached_tokens", cached_tokens))
+        
+        # 记录实验级别和系统级别的LLM调用
+        add(("experiment", experiment_name, "llm_calls"))
+        add(("experiment", experiment_name, "total_tokens"), tokens_used)
+        add(("experiment", experiment_name, "cost"), cost)
+        add(("system", "", "total_tokens"), tokens_used)
+        add(("system", "", "total_cost"), cost)
+        for field_name, value in totals:
+            add(("experiment", experiment_name, field_name), value)
+            add(("system", "", field_name), value)
+        
+        # 记录智能体级别的LLM调用
+        if agent_name:
+            self.record_agent_activity(agent_name, "llm_call")
+            add(("agent", agent_name, "total_tokens"), tokens_used)
+            add(("agent", agent_name, "cost"), cost)
+        
+        if latency is not None:
+            shard.observe("llm_latency_seconds", latency)
+        if prompt_tokens or completion_tokens:
+            keys = (("agent", agent_name), ("experiment", experiment_name),
+                    ("model", model_name), ("template", template_name))
+            for dim, key in keys:
+                if not key:
+                    continue
+                scope = USAGE_SCOPE_PREFIX + dim
+                add((scope, key, "calls"))
+                add((scope, key, "estimated_calls"), int(estimated))
+                add((scope, key, "cost"), cost)
+                for field_name, value in totals:
+                    add((scope, key, field_name), value)
+                if latency is not None:
+                    shard.observe("llm_latency_seconds", latency, dim, key)
+                shard.observe("llm_prompt_tokens", prompt_tokens, dim, key)
+                shard.observe("llm_completion_tokens", completion_tokens, dim, key)
+        
+        self._emit_event(EventType.LLM_CALL, {
+            "experiment_name": experiment_name,
+            "agent_name": agent_name,
+            "tokens_used": tokens_used,
+            "model_name": model_name,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "latency": latency,
+            "cost": cost,
+            "template_name": template_name
+        })
     
     def record_error(self, experiment_name: str, error_type: str, 
                     error_message: str = None, agent_name: str = None):
         """记录错误"""
-        with self.lock:
-            # 记录实验级别错误
-            if experiment_name in self.experiments:
-                self.experiments[experiment_name].error_count += 1
-                if error_type not in self.experiments[experiment_name].error_types:
-                    self.experiments[experiment_name].error_types[error_type] = 0
-                self.experiments[experiment_name].error_types[error_type] += 1
-            
-            # 记录智能体级别错误
-            if agent_name:
-                self.record_agent_activity(agent_name, "error_handled")
-            
-            # 更新系统错误计数
-            self.system_metrics.total_errors += 1
-            
-            self._emit_event(EventType.ERROR_OCCURRED, {
-                "experiment_name": experiment_name,
-                "error_type": error_type,
-                "error_message": error_message,
-                "agent_name": agent_name
-            })
+        shard = self._shard()
+        # 记录实验级别错误
+        shard.add(("experiment", experiment_name, "error_count"))
+        shard.add(("error_type", experiment_name, error_type))
+        
+        # 记录智能体级别错误
+        if agent_name:
+            self.record_agent_activity(agent_name, "error_handled")
+        
+        # 更新系统错误计数
+        shard.add(("system", "", "total_errors"))
+        
+        self._emit_event(EventType.ERROR_OCCURRED, {
+            "experiment_name": experiment_name,
+            "error_type": error_type,
+            "error_message": error_message,
+            "agent_name": agent_name
+        })
     
     def record_code_generation(self, experiment_name: str, agent_name: str = None, 
                               success: bool = True, attempt_number: int = 1):
         """记录代码生成"""
-        with self.lock:
-            if experiment_name in self.experiments:
-                self.experiments[experiment_name].code_generation_attempts += 1
-            
-            self._emit_event(EventType.CODE_GENERATION, {
-                "experiment_name": experiment_name,
-                "agent_name": agent_name,
-                "success": success,
-                "attempt_number": attempt_number
-            })
+        self._shard().add(("experiment", experiment_name, "code_generation_attempts"))
+        
+        self._emit_event(EventType.CODE_GENERATION, {
+            "experiment_name": experiment_name,
+            "agent_name": agent_name,
+            "success": success,
+            "attempt_number": attempt_number
+        })
     
     def record_compilation(self, experiment_name: str, success: bool = True, 
-                          error_message: str = None):
-        """记录编译"""
-        with self.lock:
-            if experiment_name in self.experiments:
-                self.experiments[experiment_name].compilation_attempts += 1
-            
-            self._emit_event(EventType.COMPILATION, {
-                "experiment_name": experiment_name,
-                "success": success,
-                "error_message": error_message
-            })
+                          error_message: str = None, duration: Optional[float] = None):
+        """记录编译（给出 duration 时计入编译耗时分布）"""
+        shard = self._shard()
+        shard.add(("experiment", experiment_name, "compilation_attempts"))
+        if duration is not None:
+            shard.observe("compilation_seconds", duration)
+        
+        self._emit_event(EventType.COMPILATION, {
+            "experiment_name": experiment_name,
+            "success": success,
+            "error_message": error_message,
+            "duration": duration
+        })
     
     def record_simulation(self, experiment_name: str, success: bool = True, 
                          duration: float = 0.0, timeout: bool = False):
-        """记录仿真"""
-        with self.lock:
-            if experiment_name in self.experiments:
-                self.experiments[experiment_name].simulation_attempts += 1
-            
-            self._emit_event(EventType.SIMULATION, {
-                "experiment_name": experiment_name,
-                "success": success,
-                "duration": duration,
-                "timeout": timeout
-            })
+        """记录仿真（耗时计入仿真耗时分布）"""
+        shard = self._shard()
+        shard.add(("experiment", experiment_name, "simulation_attempts"))
+        shard.observe("simulation_seconds", duration)
+        
+        self._emit_event(EventType.SIMULATION, {
+            "experiment_name": experiment_name,
+            "success": success,
+            "duration": duration,
+            "timeout": timeout
+        })
     
     def record_state_transition(self, agent_name: str, from_state: str, 
                                to_state: str, trigger: str = None):
         """记录状态转换"""
-        with self.lock:
-            self.record_agent_activity(agent_name, "state_transition", current_state=to_state)
-            
-            self._emit_event(EventType.STATE_TRANSITION, {
-                "agent_name": agent_name,
-                "from_state": from_state,
-                "to_state": to_state,
-                "trigger": trigger
-            })
+        self.record_agent_activity(agent_name, "state_transition", current_state=to_state)
+        
+        self._emit_event(EventType.STATE_TRANSITION, {
+            "agent_name": agent_name,
+            "from_state": from_state,
+            "to_state": to_state,
+            "trigger": trigger
+        })
     
     def set_custom_metric(self, category: str, name: str, value: Any):
         """设置自定义指标"""
@@ -319,20 +592,123 @@ class MetricsCollector:
                 "timestamp": time.time()
             }
     
+    def set_gauge(self, category: str, name: str, value: float):
+        """设置仪表指标（记录当前值，如内存占用）"""
+        with self.lock:
+            self.custom_metrics[category][name] = {
+                "value": value,
+                "type": MetricType.GAUGE.value,
+                "timestamp": time.time()
+            }
+    
     def increment_custom_counter(self, category: str, name: str, increment: int = 1):
         """增加自定义计数器"""
+        self._shard().add(("custom", category, name), increment)
+    
+    def aggregate(self):
+        """
+        把各线程分片中尚未计入的增量合并到全局视图（计数和直方图都只合并上次汇总以来的增量）。
+        所属线程已结束的分片合并后移除，其中尚未计入的计数转入 _pending_counters。
+        """
         with self.lock:
-            if category not in self.custom_metrics:
-                self.custom_metrics[category] = {}
+            now = time.time()
+            if self._pending_counters:
+                self._pending_counters = {
+                    key: delta for key, delta in self._pending_counters.items()
+                    if not self._apply_counter(key, delta, now)
+                }
             
-            if name not in self.custom_metrics[category]:
-                self.custom_metrics[category][name] = {"value": 0, "timestamp": time.time()}
+            live_shards = []
+            for shard in self._shards:
+                # 先判断线程是否已结束：之后读取到的就是该分片的最终内容
+                retired = not shard.thread.is_alive()
+                self._merge_shard(shard, now)
+                if not retired:
+                    live_shards.append(shard)
+                    continue
+                for key, value in shard.counters.items():
+                    delta = value - shard.applied.get(key, 0)
+                    if delta:
+                        self._pending_counters[key] = self._pending_counters.get(key, 0) + delta
+            self._shards = live_shards
             
-            self.custom_metrics[category][name]["value"] += increment
-            self.custom_metrics[category][name]["timestamp"] = time.time()
+            # LLM 用量的分布取自合并后的直方图
+            histograms = self._histograms
+            for dim, usage in self.llm_usage.items():
+                for key, stats in usage.items():
+                    stats.latency = histograms.get(("llm_latency_seconds", dim, key), stats.latency)
+                    stats.prompt_tokens_hist = histograms.get(("llm_prompt_tokens", dim, key), stats.prompt_tokens_hist)
+                    stats.completion_tokens_hist = histograms.get(("llm_completion_tokens", dim, key), stats.completion_tokens_hist)
+    
+    def _merge_shard(self, shard: _MetricsShard, now: float):
+        """合并一个分片自上次汇总以来的增量（在锁内调用）"""
+        applied = shard.applied
+        for key, value in shard.counters.copy().items():
+            delta = value - applied.get(key, 0)
+            # 所属实验尚未开始的增量保留到下一次汇总
+            if delta and self._apply_counter(key, delta, now):
+                applied[key] = value
+        
+        for agent_name, last_activity in shard.agent_activity.copy().items():
+            metric = self._agent_metric(agent_name)
+            metric.last_activity = max(metric.last_activity, last_activity)
+        for agent_name, role in shard.agent_roles.copy().items():
+            metric = self._agent_metric(agent_name)
+            if metric.role == "unknown":
+                metric.role = role
+        for agent_name, (timestamp, state) in shard.agent_states.copy().items():
+            if timestamp >= self._state_times.get(agent_name, 0.0):
+                self._state_times[agent_name] = timestamp
+                self._agent_metric(agent_name).current_state = state
+        
+        # 只合并记录数变化过的直方图，且只合并新增的计数
+        for hist_key, histogram in shard.histograms.copy().items():
+            previous_count, previous, previous_sum = shard.applied_histograms.get(hist_key, (0, {}, 0.0))
+            if histogram.count == previous_count:
+                continue
+            counts = histogram.counts.copy()
+            total_sum = histogram.sum
+            merged = self._histograms.get(hist_key)
+            if merged is None:
+                merged = self._histograms[hist_key] = HdrHistogram(histogram.scale, histogram.significant_bits)
+            merged.merge_delta(counts, previous, total_sum - previous_sum, histogram.min, histogram.max)
+            shard.applied_histograms[hist_key] = (sum(counts.values()), counts, total_sum)
+    
+    def _agent_metric(self, agent_name: str) -> AgentMetrics:
+        metric = self.agents.get(agent_name)
+        if metric is None:
+            metric = self.agents[agent_name] = AgentMetrics(agent_name=agent_name, role="unknown")
+        return metric
+    
+    def _apply_counter(self, key: Tuple[str, str, str], delta: float, now: float) -> bool:
+        """把一个计数增量计入对应的指标对象；所属实验不存在时不计入并返回 False"""
+        scope, name, field_name = key
+        if scope == "experiment":
+            target = self.experiments.get(name)
+        elif scope == "error_type":
+            metric = self.experiments.get(name)
+            if metric is None:
+                return False
+            metric.error_types[field_name] = metric.error_types.get(field_name, 0) + delta
+            return True
+        elif scope == "agent":
+            target = self._agent_metric(name)
+        elif scope == "system":
+            target = self.system_metrics
+        elif scope == "custom":
+            entry = self.custom_metrics[name].setdefault(field_name, {"value": 0, "timestamp": now})
+            entry["value"] += delta
+            entry["timestamp"] = now
+            return True
+        else:
+            target = self.llm_usage[scope[len(USAGE_SCOPE_PREFIX):]].setdefault(name, LLMUsageStats())
+        if target is None:
+            return False
+        setattr(target, field_name, getattr(target, field_name) + delta)
+        return True
     
     def _emit_event(self, event_type: EventType, data: Dict[str, Any]):
-        """发出事件"""
+        """发出事件（写入事件流；有订阅者时交给分发线程）"""
         event = {
             "type": event_type.value,
             "timestamp": time.time(),
@@ -340,26 +716,94 @@ class MetricsCollector:
         }
         
         self.event_stream.append(event)
-        
-        # 通知订阅者
-        for subscriber in self.subscribers:
+        if self.subscribers:
+            self._event_queue.put(event)
+    
+    def _dispatch_events(self):
+        """分发线程：依次通知订阅者"""
+        while True:
+            event = self._event_queue.get()
             try:
-                subscriber(event)
-            except Exception as e:
-                self.logger.error(f"Error notifying subscriber: {e}")
+                if event is None:
+                    return
+                for subscriber in list(self.subscribers):
+                    try:
+                        subscriber(event)
+                    except Exception as e:
+                        self.logger.error(f"Error notifying subscriber: {e}")
+            finally:
+                self._event_queue.task_done()
     
     def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
-        """订阅事件"""
-        self.subscribers.append(callback)
+        """订阅事件（在分发线程中回调）"""
+        with self.lock:
+            self.subscribers.append(callback)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_events, name="metrics-events", daemon=True)
+                self._dispatcher.start()
     
     def unsubscribe(self, callback: Callable):
         """取消订阅"""
         if callback in self.subscribers:
             self.subscribers.remove(callback)
     
+    def flush_events(self):
+        """等待已发出的事件全部通知给订阅者"""
+        if self._dispatcher is not None:
+            self._event_queue.join()
+    
+    def start_reporting(self, exporters: Optional[List[Any]] = None, interval: float = 5.0):
+        """启动后台汇总线程：每 interval 秒合并各线程分片，并把快照交给导出器（export(snapshot) / close()）"""
+        with self.lock:
+            if self._reporter is not None:
+                self.logger.warning("Metrics reporting already started")
+                return
+            self.exporters = list(exporters or [])
+            self._reporter_stop.clear()
+            self._reporter = threading.Thread(
+                target=self._report_loop, args=(interval,), name="metrics-reporter", daemon=True
+            )
+            self._reporter.start()
+        self.export_snapshot()
+        self.logger.info(f"Metrics reporting started (interval: {interval}s, exporters: {len(self.exporters)})")
+    
+    def _report_loop(self, interval: float):
+        while not self._reporter_stop.wait(interval):
+            self.export_snapshot()
+    
+    def export_snapshot(self):
+        """汇总并把当前快照交给所有导出器"""
+        if not self.exporters:
+            self.aggregate()
+            return
+        snapshot = self.snapshot()
+        for exporter in self.exporters:
+            try:
+                exporter.export(snapshot)
+            except Exception as e:
+                self.logger.error(f"Metrics exporter {type(exporter).__name__} failed: {e}")
+    
+    def stop_reporting(self):
+        """停止后台汇总线程，导出最后一次快照并关闭导出器"""
+        reporter = self._reporter
+        if reporter is None:
+            return
+        self._reporter_stop.set()
+        reporter.join()
+        self._reporter = None
+        self.export_snapshot()
+        for exporter in self.exporters:
+            try:
+                exporter.close()
+            except Exception as e:
+                self.logger.error(f"Failed to close metrics exporter {type(exporter).__name__}: {e}")
+        self.exporters = []
+        self.flush_events()
+    
     def get_experiment_summary(self, experiment_name: str = None) -> Dict[str, Any]:
         """获取实验摘要"""
         with self.lock:
+            self.aggregate()
             if experiment_name:
                 if experiment_name in self.experiments:
                     return asdict(self.experiments[experiment_name])
@@ -378,6 +822,7 @@ class MetricsCollector:
     def get_agent_summary(self, agent_name: str = None) -> Dict[str, Any]:
         """获取智能体摘要"""
         with self.lock:
+            self.aggregate()
             if agent_name:
                 if agent_name in self.agents:
                     metric = self.agents[agent_name]
@@ -393,16 +838,40 @@ class MetricsCollector:
                 for name, metric in self.agents.items()
             }
     
+    def get_llm_usage_summary(self, dimension: str = None) -> Dict[str, Any]:
+        """获取LLM用量摘要（指定维度时只返回该维度：agent / experiment / model / template）"""
+        with self.lock:
+            self.aggregate()
+            if dimension:
+                return {key: stats.to_dict() for key, stats in self.llm_usage.get(dimension, {}).items()}
+            return {
+                dim: {key: stats.to_dict() for key, stats in usage.items()}
+                for dim, usage in self.llm_usage.items()
+            }
+    
+    def get_latency_summary(self) -> Dict[str, Any]:
+        """获取全局耗时分布（LLM 调用、编译、仿真）"""
+        with self.lock:
+            self.aggregate()
+            return {
+                name: self._histograms.get((metric, "", ""), HdrHistogram(HISTOGRAM_SCALES[metric])).to_dict()
+                for name, metric in (("llm_call", "llm_latency_seconds"),
+                                     ("compilation", "compilation_seconds"),
+                                     ("simulation", "simulation_seconds"))
+            }
+    
     def get_system_summary(self) -> Dict[str, Any]:
         """获取系统摘要"""
         with self.lock:
+            self.aggregate()
             summary = asdict(self.system_metrics)
             summary["custom_metrics"] = dict(self.custom_metrics)
             summary["active_experiments"] = len(self.experiments)
             summary["active_agents"] = len(self.agents)
+            summary["latency"] = self.get_latency_summary()
             
             # 计算最近事件统计
-            recent_events = [event for event in self.event_stream 
+            recent_events = [event for event in list(self.event_stream)
                            if time.time() - event["timestamp"] < 3600]  # 最近1小时
             
             event_counts = defaultdict(int)
@@ -417,9 +886,10 @@ class MetricsCollector:
     def get_real_time_stats(self) -> Dict[str, Any]:
         """获取实时统计"""
         with self.lock:
+            self.aggregate()
             # 最近5分钟的活动
             cutoff_time = time.time() - 300
-            recent_events = [event for event in self.event_stream 
+            recent_events = [event for event in list(self.event_stream)
                            if event["timestamp"] > cutoff_time]
             
             # 活跃的智能体
@@ -447,6 +917,29 @@ class MetricsCollector:
                 }
             }
     
+    def snapshot(self) -> Dict[str, Any]:
+        """导出器使用的指标快照：系统汇总、智能体、进行中的实验、LLM 用量、耗时分布和自定义指标"""
+        with self.lock:
+            self.aggregate()
+            system = asdict(self.system_metrics)
+            system["success_rate"] = self.system_metrics.success_rate
+            system["uptime"] = self.system_metrics.uptime
+            return {
+                "timestamp": time.time(),
+                "system": system,
+                "agents": {name: asdict(metric) for name, metric in self.agents.items()},
+                "experiments": {
+                    name: {**asdict(metric), "duration": metric.duration}
+                    for name, metric in self.experiments.items() if metric.end_time is None
+                },
+                "llm_usage": self.get_llm_usage_summary(),
+                "latency": self.get_latency_summary(),
+                "custom_metrics": {
+                    category: {name: entry.get("value") for name, entry in metrics.items()}
+                    for category, metrics in self.custom_metrics.items()
+                }
+            }
+    
     def export_metrics(self, format: str = "json") -> str:
         """导出指标数据"""
         with self.lock:
@@ -454,6 +947,7 @@ class MetricsCollector:
                 "system_metrics": self.get_system_summary(),
                 "experiments": self.get_experiment_summary(),
                 "agents": self.get_agent_summary(),
+                "llm_usage": self.get_llm_usage_summary(),
                 "events": list(self.event_stream)
             }
             
@@ -463,14 +957,22 @@ class MetricsCollector:
                 return str(data)
     
     def reset_metrics(self):
-        """重置所有指标"""
+        """重置所有指标（其他线程随后写入新的分片）"""
         with self.lock:
             self.experiments.clear()
             self.experiment_history.clear()
+            self._finished_count = 0
+            self._finished_duration = 0.0
             self.agents.clear()
+            self._state_times.clear()
             self.system_metrics = SystemMetrics()
             self.event_stream.clear()
             self.custom_metrics.clear()
+            self.llm_usage = {dim: {} for dim in USAGE_DIMENSIONS}
+            self._local = threading.local()
+            self._shards = []
+            self._histograms = {}
+            self._pending_counters = {}
             
             self.logger.info("All metrics reset")
 
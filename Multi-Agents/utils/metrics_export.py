@@ -0,0 +1,239 @@
+# utils/metrics_export.py - 指标导出器
+"""
+把 MetricsCollector.snapshot() 的快照导出到外部系统：
+- prometheus：Prometheus 文本格式文件（原子替换，可由 node_exporter 的 textfile collector 采集）
+- jsonl：每次导出追加一行 JSON 快照
+- http：本机 HTTP 端点，按 Accept 头返回 OpenMetrics 或 Prometheus 文本格式
+
+导出器由 MetricsCollector.start_reporting 的后台汇总线程周期调用 export(snapshot)，停止时调用 close()。
+"""
+
+import os
+import json
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+METRIC_PREFIX = "circuitmind"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+EXPORTER_NAMES = ("prometheus", "jsonl", "http")
+
+# 直方图以 summary 形式导出的分位
+SUMMARY_QUANTILES = (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99"))
+
+_logger = logging.getLogger(__name__)
+
+def _escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+class _MetricFamily:
+    """一个指标族（同名、同类型的一组样本）"""
+
+    def __init__(self, name: str, metric_type: str, help_text: str):
+        self.name = f"{METRIC_PREFIX}_{name}"
+        self.metric_type = metric_type
+        self.help_text = help_text
+        self.samples: List[Tuple[str, Dict[str, Any], Any]] = []
+
+    def add(self, labels: Dict[str, Any], value: Any, suffix: str = ""):
+        self.samples.append((suffix, labels, value))
+
+    def render(self, openmetrics: bool) -> List[str]:
+        # OpenMetrics 的计数器族名不带 _total，样本名带 _total
+        family = self.name
+        if openmetrics and self.metric_type == "counter" and family.endswith("_total"):
+            family = family[:-len("_total")]
+        lines = [f"# HELP {family} {self.help_text}", f"# TYPE {family} {self.metric_type}"]
+        for suffix, labels, value in self.samples:
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+def _add_summary(family: _MetricFamily, labels: Dict[str, Any], histogram: Dict[str, Any]):
+    """把直方图摘要写成 summary：分位数、_sum、_count"""
+    for quantile, key in SUMMARY_QUANTILES:
+        family.add({**labels, "quantile": quantile}, histogram[key])
+    family.add(labels, histogram["sum"], "_sum")
+    family.add(labels, histogram["count"], "_count")
+
+def render_prometheus(snapshot: Dict[str, Any], openmetrics: bool = False) -> str:
+    """把指标快照渲染为 Prometheus 文本格式（openmetrics 为 True 时为 OpenMetrics 格式）"""
+    families: List[_MetricFamily] = []
+
+    def family(name: str, metric_type: str, help_text: str) -> _MetricFamily:
+        metric_family = _MetricFamily(name, metric_type, help_text)
+        families.append(metric_family)
+        return metric_family
+
+    system = snapshot.get("system", {})
+    experiments = family("experiments_total", "counter", "Experiments started, by result")
+    experiments.add({"result": "success"}, system.get("successful_experiments", 0))
+    experiments.add({"result": "failure"}, system.get("failed_experiments", 0))
+    family("experiments_running", "gauge", "Experiments currently running").add({}, len(snapshot.get("experiments", {})))
+    family("experiment_duration_seconds_avg", "gauge", "Average duration of finished experiments").add(
+        {}, system.get("average_experiment_duration", 0.0))
+    family("errors_total", "counter", "Errors recorded").add({}, system.get("total_errors", 0))
+    family("uptime_seconds", "gauge", "Seconds since the metrics collector started").add({}, system.get("uptime", 0.0))
+
+    agents = snapshot.get("agents", {})
+    messages = family("agent_messages_total", "counter", "Messages sent and received by each agent")
+    agent_errors = family("agent_errors_handled_total", "counter", "Errors handled by each agent")
+    transitions = family("agent_state_transitions_total", "counter", "State transitions of each agent")
+    for name, agent in agents.items():
+        messages.add({"agent": name, "direction": "sent"}, agent.get("messages_sent", 0))
+        messages.add({"agent": name, "direction": "received"}, agent.get("messages_received", 0))
+        agent_errors.add({"agent": name}, agent.get("errors_handled", 0))
+        transitions.add({"agent": name}, agent.get("state_transitions", 0))
+
+    family("llm_calls_total", "counter", "LLM API calls").add({}, system.get("total_llm_calls", 0))
+    llm_tokens = family("llm_tokens_total", "counter", "LLM tokens by kind (prompt, completion, cached prompt)")
+    for kind in ("prompt", "completion", "cached"):
+        llm_tokens.add({"kind": kind}, system.get(f"{kind}_tokens", 0))
+    family("llm_cost_total", "counter", "LLM cost computed from the model price table").add({}, system.get("total_cost", 0.0))
+    latency = snapshot.get("latency", {})
+    if "llm_call" in latency:
+        _add_summary(family("llm_latency_seconds", "summary", "LLM call latency"), {}, latency["llm_call"])
+
+    # 按智能体和模型细分，各自使用单独的指标族，对同一族求和不会重复计数
+    # （实验和模板维度基数较高，只写入 JSON 快照）
+    for dimension in ("agent", "model"):
+        calls = family(f"llm_{dimension}_calls_total", "counter", f"LLM API calls by {dimension}")
+        tokens = family(f"llm_{dimension}_tokens_total", "counter", f"LLM tokens by {dimension} and kind")
+        cost = family(f"llm_{dimension}_cost_total", "counter", f"LLM cost by {dimension}")
+        latency_by = family(f"llm_{dimension}_latency_seconds", "summary", f"LLM call latency by {dimension}")
+        for key, usage in snapshot.get("llm_usage", {}).get(dimension, {}).items():
+            labels = {dimension: key}
+            calls.add(labels, usage["calls"])
+            for kind in ("prompt", "completion", "cached"):
+                tokens.add({**labels, "kind": kind}, usage[f"{kind}_tokens"])
+            cost.add(labels, usage["cost"])
+            _add_summary(latency_by, labels, usage["latency"])
+
+    for name, help_text in (("compilation", "iverilog compilation time"), ("simulation", "vvp simulation time")):
+        if name in latency:
+            _add_summary(family(f"{name}_seconds", "summary", help_text), {}, latency[name])
+
+    custom = family("custom_metric", "gauge", "Custom metrics and counters")
+    for category, values in snapshot.get("custom_metrics", {}).items():
+        for name, value in values.items():
+            if isinstance(value, (int, float)):
+                custom.add({"category": category, "name": name}, value)
+
+    lines: List[str] = []
+    for metric_family in families:
+        if metric_family.samples:
+            lines.extend(metric_family.render(openmetrics))
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+class MetricsExporter:
+    """导出器基类"""
+
+    def export(self, snapshot: Dict[str, Any]):
+        """导出一次快照"""
+        raise NotImplementedError
+
+    def close(self):
+        """释放资源（汇总线程停止时调用）"""
+        pass
+
+class PrometheusFileExporter(MetricsExporter):
+    """把快照写成 Prometheus 文本格式文件（先写临时文件再替换，读取方不会看到写了一半的内容）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, snapshot: Dict[str, Any]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(render_prometheus(snapshot))
+        os.replace(tmp_path, self.path)
+
+class JsonLinesExporter(MetricsExporter):
+    """每次导出向文件追加一行 JSON 快照"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, snapshot: Dict[str, Any]):
+        line = json.dumps(snapshot, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class OpenMetricsHTTPExporter(MetricsExporter):
+    """
+    本机 HTTP 端点（/metrics）：返回最近一次导出的快照，
+    Accept 头包含 application/openmetrics-text 时为 OpenMetrics 格式，否则为 Prometheus 文本格式。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9464):
+        self._snapshot: Dict[str, Any] = {}
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+                body = render_prometheus(exporter._snapshot, openmetrics).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                _logger.debug("metrics endpoint: " + format % args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.address = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        _logger.info(f"Metrics endpoint listening on http://{self.address[0]}:{self.address[1]}/metrics")
+
+    def export(self, snapshot: Dict[str, Any]):
+        self._snapshot = snapshot
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+def create_exporters(names: List[str], export_dir: str, http_port: int = 9464,
+                     http_host: str = "127.0.0.1") -> List[MetricsExporter]:
+    """按名称（prometheus / jsonl / http）创建导出器，文件写入 export_dir"""
+    exporters: List[MetricsExporter] = []
+    for name in names:
+        if name == "prometheus":
+            exporters.append(PrometheusFileExporter(os.path.join(export_dir, "metrics.prom")))
+        elif name == "jsonl":
+            exporters.append(JsonLinesExporter(os.path.join(export_dir, "metrics.jsonl")))
+        elif name == "http":
+            exporters.append(OpenMetricsHTTPExporter(http_host, http_port))
+        else:
+            raise ValueError(f"Unknown metrics exporter: {name}, expected one of {EXPORTER_NAMES}")
+    return exporters
@@ -4,10 +4,15 @@
 import time
 import random
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed
 from enum import Enum
 from typing import Dict, Any, Optional, Callable, List
 from dataclasses import dataclass, field
+from openai import APIStatusError, APIConnectionError, APITimeoutError
 from src.core.exceptions import AgentError, ErrorCategory
+from src.config import get_config_manager
 
 class RetryErrorType(Enum):
     """重试错误类型"""
@@ -18,6 +23,7 @@ class RetryErrorType(Enum):
     VALIDATION_ERROR = "validation_error"
     NETWORK_ERROR = "network_error"
     RESOURCE_ERROR = "resource_error"
+    RATE_LIMIT_ERROR = "rate_limit_error"
 
 class BackoffStrategy(Enum):
     """退避策略"""
@@ -47,11 +53,110 @@ class RetryAttempt:
     delay_before: float = 0.0
     success: bool = False
 
+# 可重试的 HTTP 状态码（其余 4xx 属于请求本身的问题，重试无效）
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """从异常携带的响应头中读取 Retry-After（秒）"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+class RetryBudget:
+    """
+    全局重试预算：每个新操作存入 ratio 个重试额度，每次重试（或对冲请求）取出 1 个，
+    另外每秒补充 min_per_sec 个以保证低流量时也能重试。服务整体故障时重试总量被限制，避免重试风暴。
+    """
+    
+    def __init__(self, ratio: float = 0.2, min_per_sec: float = 1.0, max_balance: float = 10.0):
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.max_balance = max_balance
+        self._balance = max_balance
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._balance = min(self.max_balance, self._balance + (now - self._updated) * self.min_per_sec)
+        self._updated = now
+    
+    def deposit(self):
+        """记录一次新操作"""
+        with self._lock:
+            self._refill()
+            self._balance = min(self.max_balance, self._balance + self.ratio)
+    
+    def try_withdraw(self) -> bool:
+        """申请一次重试额度"""
+        with self._lock:
+            self._refill()
+            if self._balance >= 1.0:
+                self._balance -= 1.0
+                return True
+            return False
+    
+    @property
+    def balance(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._balance
+
+class HedgeCancelled(Exception):
+    """对冲请求中落败的一方已被取消"""
+
+_hedge_local = threading.local()
+
+def hedge_cancelled() -> bool:
+    """
+    当前线程执行的对冲尝试是否已落败（另一方已先返回）。
+    流式读取等耗时操作应逐块检查，落败后关闭连接并抛出 HedgeCancelled，释放密钥租约且不再计入用量。
+    """
+    event = getattr(_hedge_local, "cancel_event", None)
+    return event is not None and event.is_set()
+
+class LatencyTracker:
+    """记录最近若干次成功调用的耗时，用于计算对冲请求的触发阈值"""
+    
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+    
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+    
+    def percentile(self, percent: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < max(min_samples, 1):
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(percent / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
 class RetryStrategy:
     """智能重试策略"""
     
-    def __init__(self):
+    def __init__(self, retry_budget_ratio: float = 0.2, retry_budget_min_per_sec: float = 1.0,
+                 hedge_percentile: float = 95.0, hedge_min_samples: int = 20):
         self.logger = logging.getLogger(__name__)
+        self.budget = RetryBudget(ratio=retry_budget_ratio, min_per_sec=retry_budget_min_per_sec)
+        
+        # 对冲请求：耗时超过该操作历史耗时的 hedge_percentile 分位时发出第二个请求
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
         
         # 默认策略配置
         self.strategies: Dict[RetryErrorType, RetryConfig] = {
@@ -95,24 +200,62 @@ class RetryStrategy:
                 backoff_strategy=BackoffStrategy.FIBONACCI,
                 base_delay=5.0,
                 max_delay=60.0
+            ),
+            RetryErrorType.RATE_LIMIT_ERROR: RetryConfig(
+                max_retries=5,
+                backoff_strategy=BackoffStrategy.EXPONENTIAL,
+                base_delay=2.0,
+                max_delay=60.0
             )
         }
         
         # 全局重试统计
-        self.global_stats = {
+        self.global_stats = self._new_stats()
+    
+    @staticmethod
+    def _new_stats() -> Dict[str, Any]:
+        return {
             "total_attempts": 0,
             "successful_retries": 0,
             "failed_retries": 0,
-            "total_delay_time": 0.0
+            "total_delay_time": 0.0,
+            "non_retryable": 0,
+            "budget_exhausted": 0,
+            "hedged_requests": 0,
+            "hedge_wins": 0
         }
     
+    def _count(self, name: str, value: float = 1):
+        with self._lock:
+            self.global_stats[name] += value
+    
+    def classify_error(self, error: Exception, default_type: RetryErrorType) -> Optional[RetryErrorType]:
+        """
+        根据异常确定重试类型；返回 None 表示不可重试（如 400/401/403/404 等请求错误）。
+        非 LLM API 异常沿用调用方给出的类型。
+        """
+        cause = error
+        while isinstance(cause, AgentError) and cause.__cause__ is not None:
+            cause = cause.__cause__
+        if isinstance(cause, APITimeoutError):
+            return RetryErrorType.TIMEOUT_ERROR
+        if isinstance(cause, APIConnectionError):
+            return RetryErrorType.NETWORK_ERROR
+        if isinstance(cause, APIStatusError):
+            if cause.status_code == 429:
+                return RetryErrorType.RATE_LIMIT_ERROR
+            if cause.status_code in RETRYABLE_STATUS_CODES or cause.status_code >= 500:
+                return RetryErrorType.LLM_API_ERROR
+            return None
+        return default_type
+    
     def should_retry(self, error_type: RetryErrorType, attempt_count: int, 
-                    retry_history: List[RetryAttempt] = None) -> bool:
-        """判断是否应该重试"""
+                    retry_history: List[RetryAttempt] = None, max_retries: Optional[int] = None) -> bool:
+        """判断是否应该重试（max_retries 覆盖该错误类型的默认重试次数）"""
         config = self.strategies.get(error_type, RetryConfig())
         
         # 基本重试次数检查
-        if attempt_count >= config.max_retries:
+        if attempt_count >= (config.max_retries if max_retries is None else max_retries):
             return False
         
         # 检查重试历史模式
@@ -166,65 +309,158 @@ class RetryStrategy:
         operation: Callable,
         error_type: RetryErrorType,
         operation_name: str = "operation",
-        context: Dict[str, Any] = None
+        context: Dict[str, Any] = None,
+        max_retries: Optional[int] = None,
+        hedge: bool = False
     ) -> Any:
-        """执行操作并重试"""
+        """
+        执行操作并重试。
+        异常按 classify_error 分类（不可重试的错误立即失败），重试受全局重试预算限制，
+        延迟取退避时间与 Retry-After 中的较大值。hedge 为 True 时启用对冲请求。
+        """
         retry_history: List[RetryAttempt] = []
         attempt_count = 0
+        self.budget.deposit()
         
         while True:
             try:
-                result = operation()
+                result = self._run_attempt(operation, operation_name, hedge)
                 
                 # 记录成功
                 if retry_history:
-                    self.global_stats["successful_retries"] += 1
+                    self._count("successful_retries")
                     self.logger.info(f"Operation {operation_name} succeeded after {attempt_count} retries")
                 
                 return result
                 
             except Exception as e:
                 attempt_count += 1
-                self.global_stats["total_attempts"] += 1
+                self._count("total_attempts")
+                effective_type = self.classify_error(e, error_type)
                 
                 # 创建重试记录
                 attempt = RetryAttempt(
                     attempt_number=attempt_count,
-                    error_type=error_type,
+                    error_type=effective_type or error_type,
                     error_message=str(e),
                     timestamp=time.time()
                 )
                 
                 # 判断是否应该重试
-                if not self.should_retry(error_type, attempt_count, retry_history):
-                    self.global_stats["failed_retries"] += 1
-                    self.logger.error(f"Operation {operation_name} failed after {attempt_count} attempts")
+                reason = None
+                if effective_type is None:
+                    self._count("non_retryable")
+                    reason = "non-retryable error"
+                elif not self.should_retry(effective_type, attempt_count, retry_history, max_retries):
+                    reason = f"{attempt_count} attempts"
+                elif not self.budget.try_withdraw():
+                    self._count("budget_exhausted")
+                    reason = "retry budget exhausted"
+                
+                if reason is not None:
+                    self._count("failed_retries")
+                    self.logger.error(f"Operation {operation_name} failed ({reason})")
                     raise AgentError(
                         f"Operation failed after {attempt_count} attempts: {str(e)}",
                         context={
                             "operation": operation_name,
-                            "error_type": error_type.value,
+                            "error_type": (effective_type or error_type).value,
+                            "reason": reason,
                             "retry_history": [a.__dict__ for a in retry_history],
                             **(context or {})
                         }
-                    )
+                    ) from e
                 
-                # 计算延迟
-                delay = self.get_delay(error_type, attempt_count - 1)
+                # 计算延迟（服务端给出 Retry-After 时至少等待该时间）
+                delay = max(self.get_delay(effective_type, attempt_count - 1), get_retry_after(e) or 0.0)
                 attempt.delay_before = delay
                 retry_history.append(attempt)
                 
                 # 记录重试信息
                 self.logger.warning(
-                    f"Operation {operation_name} failed (attempt {attempt_count}), "
+                    f"Operation {operation_name} failed (attempt {attempt_count}, {effective_type.value}), "
                     f"retrying in {delay:.2f}s: {str(e)}"
                 )
                 
                 # 等待
                 if delay > 0:
-                    self.global_stats["total_delay_time"] += delay
+                    self._count("total_delay_time", delay)
                     time.sleep(delay)
     
+    def _latency_tracker(self, operation_name: str) -> LatencyTracker:
+        with self._lock:
+            tracker = self._latencies.get(operation_name)
+            if tracker is None:
+                tracker = self._latencies[operation_name] = LatencyTracker()
+            return tracker
+    
+    def _run_attempt(self, operation: Callable, operation_name: str, hedge: bool) -> Any:
+        """执行一次尝试并记录耗时；耗时超过历史分位阈值时发出对冲请求"""
+        tracker = self._latency_tracker(operation_name)
+        
+        def timed_operation():
+            start = time.monotonic()
+            result = operation()
+            tracker.record(time.monotonic() - start)
+            return result
+        
+        hedge_after = tracker.percentile(self.hedge_percentile, self.hedge_min_samples) if hedge else None
+        if hedge_after is None:
+            return timed_operation()
+        return self._execute_hedged(timed_operation, hedge_after, operation_name)
+    
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+            return self._hedge_executor
+    
+    def _execute_hedged(self, operation: Callable, hedge_after: float, operation_name: str) -> Any:
+        """
+        先发出主请求，超过 hedge_after 秒未完成且预算允许时再发出一个，返回先成功的结果。
+        另一方随即被取消：尚未开始的不再执行，正在执行的通过 hedge_cancelled() 得知并自行中止。
+        """
+        executor = self._get_hedge_executor()
+        
+        def run(cancel_event: threading.Event):
+            _hedge_local.cancel_event = cancel_event
+            try:
+                return operation()
+            finally:
+                _hedge_local.cancel_event = None
+        
+        cancel_events = {}
+        primary_cancel = threading.Event()
+        primary = executor.submit(run, primary_cancel)
+        cancel_events[primary] = primary_cancel
+        done, _ = wait([primary], timeout=hedge_after)
+        if done or not self.budget.try_withdraw():
+            return primary.result()
+        
+        self._count("hedged_requests")
+        self.logger.info(f"Operation {operation_name} exceeded p{self.hedge_percentile:g} "
+                         f"latency ({hedge_after:.2f}s), sending hedged request")
+        backup_cancel = threading.Event()
+        backup = executor.submit(run, backup_cancel)
+        cancel_events[backup] = backup_cancel
+        
+        try:
+            last_error = None
+            for future in as_completed([primary, backup]):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if future is backup:
+                    self._count("hedge_wins")
+                return result
+            raise last_error
+        finally:
+            for future, cancel_event in cancel_events.items():
+                cancel_event.set()
+                future.cancel()
+    
     def update_strategy(self, error_type: RetryErrorType, config: RetryConfig):
         """更新重试策略"""
         self.strategies[error_type] = config
@@ -232,8 +468,15 @@ class RetryStrategy:
     
     def get_strategy_stats(self) -> Dict[str, Any]:
         """获取策略统计信息"""
+        with self._lock:
+            latency_thresholds = {
+                name: tracker.percentile(self.hedge_percentile)
+                for name, tracker in self._latencies.items()
+            }
         return {
-            "global_stats": self.global_stats,
+            "global_stats": dict(self.global_stats),
+            "retry_budget": round(self.budget.balance, 2),
+            "hedge_thresholds": latency_thresholds,
             "strategies": {
                 error_type.value: {
                     "max_retries": config.max_retries,
@@ -247,12 +490,8 @@ class RetryStrategy:
     
     def reset_stats(self):
         """重置统计信息"""
-        self.global_stats = {
-            "total_attempts": 0,
-            "successful_retries": 0,
-            "failed_retries": 0,
-            "total_delay_time": 0.0
-        }
+        with self._lock:
+            self.global_stats = self._new_stats()
 
 # 重试装饰器
 def retry_on_error(
@@ -269,7 +508,7 @@ def retry_on_error(
                 operation_name = func.__name__
             
             if strategy is None:
-                strategy = RetryStrategy()
+                strategy = get_retry_strategy()
             
             def operation():
                 return func(*args, **kwargs)
@@ -283,9 +522,20 @@ def retry_on_error(
         return wrapper
     return decorator
 
-# 全局重试策略实例
-_global_retry_strategy = RetryStrategy()
+# 全局重试策略实例（首次使用时按实验配置创建，重试预算在所有调用之间共享）
+_global_retry_strategy: Optional[RetryStrategy] = None
+_global_retry_strategy_lock = threading.Lock()
 
 def get_retry_strategy() -> RetryStrategy:
     """获取全局重试策略实例"""
-    return _global_retry_strategy
\ No newline at end of file
+    global _global_retry_strategy
+    with _global_retry_strategy_lock:
+        if _global_retry_strategy is None:
+            experiments = get_config_manager().config.experiments
+            _global_retry_strategy = RetryStrategy(
+                retry_budget_ratio=experiments.retry_budget_ratio,
+                retry_budget_min_per_sec=experiments.retry_budget_min_per_sec,
+                hedge_percentile=experiments.llm_hedge_percentile,
+                hedge_min_samples=experiments.llm_hedge_min_samples
+            )
+        return _global_retry_strategy
\ No newline at end of file
@@ -0,0 +1,233 @@
+# utils/session_store.py - 会话状态存储
+"""带生命周期管理的会话状态存储（LRU / TTL 上限，可选溢出到磁盘）"""
+
+import os
+import re
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+import logging
+
+from utils.metrics import get_metrics_collector
+from src.config import get_config_manager
+
+def _estimate_size(value: Any) -> int:
+    """粗略估算对象占用的字节数（字符串按长度计算，容器递归累加）"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(_estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+@dataclass
+class SessionEntry:
+    """单个会话的状态"""
+    session_id: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    closed: bool = False
+    size_bytes: int = 0
+
+    def is_expired(self, ttl: int) -> bool:
+        """检查会话是否超过 TTL 未被访问"""
+        return ttl > 0 and time.time() - self.last_used > ttl
+
+class SessionStateStore:
+    """
+    会话状态存储：open / close / evict 显式管理会话生命周期。
+    内存中最多保留 max_sessions 个会话（LRU），超过 session_ttl 未访问的会话被淘汰；
+    配置了 spill_dir 时，关闭或淘汰的会话写入磁盘，再次访问时按需加载。
+    """
+
+    def __init__(self, max_sessions: int = 32, session_ttl: int = 3600, spill_dir: Optional[str] = None):
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.spill_dir = spill_dir
+        self._sessions: "OrderedDict[str, SessionEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.logger = logging.getLogger(__name__)
+        self.metrics = get_metrics_collector()
+        self.stats = {"opened": 0, "closed": 0, "evicted": 0, "spilled": 0, "restored": 0}
+
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    # 生命周期
+    def open_session(self, session_id: str) -> SessionEntry:
+        """打开（或重新激活）会话"""
+        with self._lock:
+            entry = self._get_entry(session_id)
+            if entry is None:
+                entry = SessionEntry(session_id=session_id)
+                self._sessions[session_id] = entry
+                self.stats["opened"] += 1
+            entry.closed = False
+            self._touch(entry)
+            self._enforce_limits()
+            self._report_gauges()
+            return entry
+
+    def close_session(self, session_id: str):
+        """关闭会话：有 spill_dir 时写入磁盘并释放内存，否则直接丢弃"""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is None:
+                return
+            entry.closed = True
+            self.stats["closed"] += 1
+            self._spill(entry)
+            self._report_gauges()
+
+    def evict(self, session_id: str = None) -> int:
+        """
+        淘汰会话。指定 session_id 时从内存和磁盘中彻底删除该会话；
+        否则淘汰所有过期会话，并按 LRU 将内存中的会话数降到上限以内。返回淘汰的会话数。
+        """
+        with self._lock:
+            if session_id is not None:
+                removed = self._sessions.pop(session_id, None) is not None
+                spill_path = self._spill_path(session_id)
+                if spill_path and os.path.exists(spill_path):
+                    os.remove(spill_path)
+                    removed = True
+                if removed:
+                    self.stats["evicted"] += 1
+                self._report_gauges()
+                return int(removed)
+
+            evicted = self._enforce_limits()
+            self._report_gauges()
+            return evicted
+
+    # 读写
+    def get(self, session_id: str, key: str, default: Any = None) -> Any:
+        """读取会话中的值；会话已溢出到磁盘时自动加载"""
+        with self._lock:
+            entry = self._get_entry(session_id)
+            if entry is None:
+                return default
+            self._touch(entry)
+            return entry.data.get(key, default)
+
+    def set(self, session_id: str, key: str, value: Any):
+        """写入会话中的值；会话不存在时自动打开"""
+        with self._lock:
+            entry = self._get_entry(session_id) or self.open_session(session_id)
+            entry.data[key] = value
+            self._touch(entry)
+            entry.size_bytes = _estimate_size(entry.data)
+            self._report_gauges()
+
+    def update(self, session_id: str, key: str, values: Dict[str, Any]):
+        """合并字典类型的值（如智能体状态）"""
+        with self._lock:
+            current = dict(self.get(session_id, key, {}) or {})
+            current.update(values)
+            self.set(session_id, key, current)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储统计信息"""
+        with self._lock:
+            return {
+                "sessions_in_memory": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "bytes_in_memory": sum(entry.size_bytes for entry in self._sessions.values()),
+                **self.stats
+            }
+
+    # 内部方法
+    def _get_entry(self, session_id: str) -> Optional[SessionEntry]:
+        entry = self._sessions.get(session_id)
+        if entry is not None and entry.is_expired(self.session_ttl):
+            self._drop(entry)
+            entry = None
+        if entry is None:
+            entry = self._restore(session_id)
+        return entry
+
+    def _touch(self, entry: SessionEntry):
+        entry.last_used = time.time()
+        self._sessions.move_to_end(entry.session_id)
+
+    def _enforce_limits(self) -> int:
+        """淘汰过期会话，再按 LRU 淘汰超出上限的会话"""
+        evicted = 0
+        for entry in [e for e in self._sessions.values() if e.is_expired(self.session_ttl)]:
+            self._drop(entry)
+            evicted += 1
+        while len(self._sessions) > self.max_sessions:
+            _, entry = next(iter(self._sessions.items()))
+            self._drop(entry)
+            evicted += 1
+        return evicted
+
+    def _drop(self, entry: SessionEntry):
+        self._sessions.pop(entry.session_id, None)
+        self.stats["evicted"] += 1
+        self._spill(entry)
+        self.logger.debug(f"Evicted session {entry.session_id}")
+
+    def _spill_path(self, session_id: str) -> Optional[str]:
+        if not self.spill_dir:
+            return None
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', session_id) or "_"
+        return os.path.join(self.spill_dir, f"{safe_id}.json")
+
+    def _spill(self, entry: SessionEntry):
+        spill_path = self._spill_path(entry.session_id)
+        if not spill_path or not entry.data:
+            return
+        try:
+            with open(spill_path, "w", encoding="utf-8") as f:
+                json.dump({"session_id": entry.session_id, "created_at": entry.created_at,
+                           "closed": entry.closed, "data": entry.data}, f, ensure_ascii=False, default=str)
+            self.stats["spilled"] += 1
+        except Exception as e:
+            self.logger.error(f"Failed to spill session {entry.session_id} to {spill_path}: {e}")
+
+    def _restore(self, session_id: str) -> Optional[SessionEntry]:
+        spill_path = self._spill_path(session_id)
+        if not spill_path or not os.path.exists(spill_path):
+            return None
+        try:
+            with open(spill_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except Exception as e:
+            self.logger.error(f"Failed to restore session {session_id} from {spill_path}: {e}")
+            return None
+        entry = SessionEntry(session_id=session_id, data=payload.get("data", {}),
+                             created_at=payload.get("created_at", time.time()), closed=payload.get("closed", False))
+        entry.size_bytes = _estimate_size(entry.data)
+        self._sessions[session_id] = entry
+        self.stats["restored"] += 1
+        self._enforce_limits()
+        return entry if session_id in self._sessions else None
+
+    def _report_gauges(self):
+        stats = self.get_stats()
+        for name in ("sessions_in_memory", "bytes_in_memory", "evicted", "spilled"):
+            self.metrics.set_gauge("session_store", name, stats[name])
+
+# 全局会话存储实例（首次使用时按实验配置创建）
+_session_store: Optional[SessionStateStore] = None
+_session_store_lock = threading.Lock()
+
+def get_session_store() -> SessionStateStore:
+    """获取全局会话状态存储"""
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            experiments = get_config_manager().config.experiments
+            _session_store = SessionStateStore(
+                max_sessions=experiments.session_max_count,
+                session_ttl=experiments.session_ttl,
+                spill_dir=experiments.session_spill_dir
+            )
+        return _session_store
@@ -1,28 +1,80 @@
 # utils/utils.py
 
 import re
+from functools import lru_cache
 
 ##############################################################################
 # 工具函数：提取 Verilog 代码块、提取模块名
 ##############################################################################
 
+# 预编译的模式，所有智能体共用（LLM 响应可能很长，每条消息只扫描一次）
+_VERILOG_BLOCK_RE = re.compile(r"```verilog\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+_CODE_FENCE_RE = re.compile(r'^\s*```\s*verilog\s*|^\s*```\s*|^\s*```|```\s*$', re.MULTILINE)
+_MODULE_NAME_RE = re.compile(r'\bmodule\s+(\w+)')
+_MODULE_DEFINITION_RE = re.compile(r"module\s+\w+\s*\([^;]*\);", re.DOTALL)
+_SPECIAL_TOKEN_RE = re.compile(r'<\|.*?\|>')
+
 def extract_code_blocks(text: str) -> list:
     """
     从文本中提取所有 Verilog 代码块内容（```verilog ... ```）。
     """
-    pattern = re.compile(r"```verilog\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
-    return pattern.findall(text)
+    return _VERILOG_BLOCK_RE.findall(text)
 
-def extract_module_name(verilog_code: str) -> str:
+def extract_last_code_block(text: str) -> str:
+    """
+    提取最后一个 Verilog 代码块的内容（去掉首尾空白），没有代码块时返回空字符串。
+    """
+    last = None
+    for last in _VERILOG_BLOCK_RE.finditer(text):
+        pass
+    return last.group(1).strip() if last else ""
+
+def strip_code_fences(code: str) -> str:
+    """
+    去掉代码中残留的 ``` / ```verilog 标记。
+    """
+    if "```" not in code:
+        return code.strip()
+    return _CODE_FENCE_RE.sub('', code).strip()
+
+def extract_json_payload(text: str) -> str:
+    """
+    截取第一个 { 到最后一个 } 之间的 JSON 文本（线性扫描），没有时返回去掉空白的原文。
+    """
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        return text.strip()
+    return text[start:end + 1]
+
+def extract_module_name(verilog_code: str, default: str = "design") -> str:
     """
     从 Verilog 代码中提取第一个 module 名。
-    未找到则返回 "design"。
+    未找到则返回 default（默认为 "design"）。
     """
-    match = re.search(r'\bmodule\s+(\w+)', verilog_code)
+    match = _MODULE_NAME_RE.search(verilog_code)
     if match:
         return match.group(1)
-    return "design"
+    return default
+
+def extract_module_definition(text: str) -> str:
+    """
+    提取第一个模块定义头（module xxx (...);），未找到则返回空字符串。
+    """
+    match = _MODULE_DEFINITION_RE.search(text)
+    return match.group(0) if match else ""
+
 def clean_code_block(code_block):
-    # 使用正则表达式匹配 <| xxx |> 模式，并替换为空字符串
-    cleaned_code = re.sub(r'<\|.*?\|>', '', code_block)
-    return cleaned_code
\ No newline at end of file
+    # 去掉 <| xxx |> 形式的特殊标记
+    if "<|" not in code_block:
+        return code_block
+    return _SPECIAL_TOKEN_RE.sub('', code_block)
+
+@lru_cache(maxsize=None)
+def read_text_file(file_path: str) -> str:
+    """
+    读取文本文件并缓存内容（如 dff.v，由所有智能体实例共享）。
+    文件不存在时抛出 FileNotFoundError（不缓存）。
+    """
+    with open(file_path, 'r') as f:
+        return f.read()
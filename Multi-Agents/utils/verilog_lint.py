@@ -0,0 +1,278 @@
+# utils/verilog_lint.py - 结构化 Verilog 静态检查
+"""
+基于轻量词法分析的结构化 Verilog 规则检查，在 LLM 审查和仿真之前毫秒级拒绝违反规则的代码：
+- 行为级描述（always / initial / task / function 及其中的 if、case、for 等）
+- 时延（#1、assign #2 ...）
+- 基本门和 d_flip_flop 以外、且未在代码中定义的模块实例
+- 需要 D 触发器时没有实例化 d_flip_flop
+- 缺少设计需求中的顶层模块
+
+检查结果可转换为 Reviewer 发给 CoderAgent 的反馈格式，也可渲染进提示模板。
+"""
+
+import re
+import bisect
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+
+# 规则名
+RULE_BEHAVIORAL = "behavioral_block"
+RULE_DELAY = "delay"
+RULE_INSTANCE = "non_primitive_instance"
+RULE_MISSING_DFF = "missing_d_flip_flop"
+RULE_TOP_MODULE = "missing_top_module"
+
+GATE_PRIMITIVES = frozenset({
+    "and", "or", "not", "nand", "nor", "xor", "xnor",
+    "buf", "bufif0", "bufif1", "notif0", "notif1"
+})
+DFF_MODULE = "d_flip_flop"
+
+PROCEDURAL_BLOCKS = frozenset({
+    "always", "always_ff", "always_comb", "always_latch", "initial", "task", "function"
+})
+BEHAVIORAL_STATEMENTS = frozenset({
+    "if", "case", "casex", "casez", "for", "while", "repeat", "forever", "fork"
+})
+BLOCK_OPEN = frozenset({"begin", "fork", "case", "casex", "casez"})
+BLOCK_CLOSE = frozenset({"end", "join", "join_any", "join_none", "endcase"})
+
+# 模块级语句的起始关键字：遇到它们说明上一个过程块已结束
+MODULE_ITEM_KEYWORDS = frozenset({
+    "assign", "wire", "reg", "tri", "input", "output", "inout", "integer", "genvar",
+    "parameter", "localparam", "generate", "endgenerate", "module", "endmodule",
+    "endtask", "endfunction", "supply0", "supply1", "specify", "defparam"
+}) | PROCEDURAL_BLOCKS | GATE_PRIMITIVES
+
+KEYWORDS = MODULE_ITEM_KEYWORDS | BEHAVIORAL_STATEMENTS | BLOCK_OPEN | BLOCK_CLOSE | frozenset({
+    "else", "posedge", "negedge", "or", "signed", "unsigned", "default", "macromodule"
+})
+
+_TOKEN_RE = re.compile(r"""
+      (?P<comment>//[^\n]*|/\*.*?\*/)
+    | (?P<string>"(?:\\.|[^"\\\n])*")
+    | (?P<directive>`\w+)
+    | (?P<number>\d*\s*'[sS]?[bodhBODH]\s*[0-9a-fA-FxXzZ?_]+|\d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    | (?P<ident>[a-zA-Z_][\w$]*|\\\S+)
+    | (?P<op><=|>=|==|!=|&&|\|\||<<|>>|\*\*|\S)
+""", re.VERBOSE | re.DOTALL)
+
+_MODULE_HEADER_RE = re.compile(r"module\s+(\w+)\s*\(")
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+    line: int
+
+def tokenize(code: str) -> List[Token]:
+    """切分为带行号的词法单元（去掉注释和空白）"""
+    line_starts = [0] + [m.end() for m in re.finditer(r"\n", code)]
+    tokens = []
+    for match in _TOKEN_RE.finditer(code):
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        line = bisect.bisect_right(line_starts, match.start())
+        tokens.append(Token(kind, match.group(), line))
+    return tokens
+
+def expected_module_name(design_requirements: str) -> Optional[str]:
+    """设计需求中给出的模块名（与 Reviewer 格式检查使用的模块定义一致）"""
+    match = _MODULE_HEADER_RE.search(design_requirements or "")
+    return match.group(1) if match else None
+
+@dataclass
+class LintIssue:
+    """一条规则违反"""
+    rule: str
+    line: int
+    message: str
+    suggestion: str
+
+    def __str__(self) -> str:
+        location = f"Line {self.line}: " if self.line > 0 else ""
+        return f"{location}[{self.rule}] {self.message}"
+
+@dataclass
+class LintReport:
+    """一段代码的检查结果"""
+    issues: List[LintIssue] = field(default_factory=list)
+    defined_modules: List[str] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return not self.issues
+
+    def format(self) -> str:
+        """逐行列出违反的规则（用于提示模板和日志）"""
+        return "\n".join(str(issue) for issue in self.issues)
+
+    def to_feedback(self) -> Dict[str, Any]:
+        """转换为 Reviewer 结构审查结果的格式（CoderAgent 读取 feedback / suggestion / line）"""
+        if self.passed:
+            return {"needs_revision": False, "error_code": "NoSpecificIssue", "feedback": "", "suggestion": "", "line": -1}
+        suggestions = []
+        for issue in self.issues:
+            if issue.suggestion not in suggestions:
+                suggestions.append(issue.suggestion)
+        return {
+            "needs_revision": True,
+            "error_code": "StaticCheckFailed",
+            "feedback": "Static structural check failed:\n" + self.format(),
+            "suggestion": " ".join(suggestions),
+            "line": self.issues[0].line,
+            "issues": [asdict(issue) for issue in self.issues]
+        }
+
+def lint_verilog(code: str, needs_flip_flop: bool = False, top_module: Optional[str] = None) -> LintReport:
+    """
+    检查结构化 Verilog 规则。
+    always @(posedge clk) 中只把 D 触发器输出非阻塞赋值给 output reg 的写法是 Reviewer 允许的，不视为违反。
+    """
+    tokens = tokenize(code)
+    report = LintReport()
+    defined = _defined_modules(tokens)
+    report.defined_modules = sorted(defined)
+
+    instantiated: Set[str] = set()
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.kind == "ident" and token.text in PROCEDURAL_BLOCKS:
+            i = _check_procedural_block(tokens, i, report)
+            continue
+        if token.text == "#":
+            _check_delay(tokens, i, report)
+        elif token.kind == "ident" and token.text not in KEYWORDS and _is_instantiation(tokens, i):
+            instantiated.add(token.text)
+            if token.text not in GATE_PRIMITIVES and token.text != DFF_MODULE and token.text not in defined:
+                report.issues.append(LintIssue(
+                    RULE_INSTANCE, token.line,
+                    f"Instance of undefined module `{token.text}`; only gate primitives and `{DFF_MODULE}` may be instantiated.",
+                    "Replace custom gate modules with primitive gates, e.g. `and u1 (out, a, b);`, or include the module definition in the same code block."
+                ))
+        i += 1
+
+    if needs_flip_flop and DFF_MODULE not in instantiated:
+        report.issues.append(LintIssue(
+            RULE_MISSING_DFF, -1,
+            f"The design needs storage but no `{DFF_MODULE}` is instantiated.",
+            f"Build every register from the provided `{DFF_MODULE}` module instead of behavioral or custom flip-flops."
+        ))
+    if top_module and top_module not in defined:
+        report.issues.append(LintIssue(
+            RULE_TOP_MODULE, -1,
+            f"Module `{top_module}` from the design requirements is not defined.",
+            f"Name the top-level module `{top_module}` with the ports given in the design requirements."
+        ))
+
+    report.issues.sort(key=lambda issue: (issue.line < 0, issue.line))
+    return report
+
+def _defined_modules(tokens: List[Token]) -> Set[str]:
+    return {
+        tokens[i + 1].text
+        for i in range(len(tokens) - 1)
+        if tokens[i].text in ("module", "macromodule") and tokens[i + 1].kind == "ident"
+    }
+
+def _check_procedural_block(tokens: List[Token], start: int, report: LintReport) -> int:
+    """检查一个过程块，返回块结束后的位置"""
+    keyword = tokens[start]
+    end = _procedural_block_end(tokens, start)
+    if keyword.text == "always" and _is_allowed_always(tokens[start:end]):
+        return end
+
+    statements = []
+    for token in tokens[start + 1:end]:
+        if token.kind == "ident" and token.text in BEHAVIORAL_STATEMENTS and token.text not in statements:
+            statements.append(token.text)
+    detail = f" containing {', '.join(f'`{s}`' for s in statements)}" if statements else ""
+    report.issues.append(LintIssue(
+        RULE_BEHAVIORAL, keyword.line,
+        f"Behavioral `{keyword.text}` block{detail}; only structural code is allowed.",
+        "Rewrite the logic with primitive gates (`and`, `or`, `not`, `nand`, `nor`, `xor`, `xnor`) and `d_flip_flop` instances."
+    ))
+    for j in range(start + 1, end):
+        if tokens[j].text == "#":
+            _check_delay(tokens, j, report)
+    return end
+
+def _procedural_block_end(tokens: List[Token], start: int) -> int:
+    """过程块的结束位置：块嵌套深度回到 0 后遇到下一个模块级语句"""
+    closing = {"task": "endtask", "function": "endfunction"}.get(tokens[start].text)
+    depth = 0
+    i = start + 1
+    while i < len(tokens):
+        text = tokens[i].text
+        if closing:
+            if text == closing:
+                return i + 1
+        elif text in BLOCK_OPEN:
+            depth += 1
+        elif text in BLOCK_CLOSE:
+            depth -= 1
+        elif depth <= 0 and tokens[i].kind == "ident" and text in MODULE_ITEM_KEYWORDS and text != "or":
+            return i
+        i += 1
+    return i
+
+def _is_allowed_always(block: List[Token]) -> bool:
+    """always @(posedge clk) [begin] q <= d; ... [end]，赋值右边只能是单个信号"""
+    texts = [t.text for t in block]
+    if texts[1:4] != ["@", "(", "posedge"] or len(texts) < 7 or texts[5] != ")":
+        return False
+    body = texts[6:]
+    if body and body[0] == "begin":
+        if body[-1] != "end":
+            return False
+        body = body[1:-1]
+    if not body:
+        return False
+    statements = " ".join(body).split(";")
+    if statements[-1].strip():
+        return False
+    simple = re.compile(r"^[\w$]+(?: \[ [^;]* \])? <= [\w$]+(?: \[ [\w$: ]+ \])?$")
+    return all(simple.match(statement.strip()) for statement in statements[:-1])
+
+def _check_delay(tokens: List[Token], i: int, report: LintReport):
+    """
+    # 在门实例、assign、线网声明和过程语句中是时延；跟在模块名后面（module m #(...) / m #(...) u (...)）是参数。
+    """
+    prev = tokens[i - 1] if i > 0 else None
+    if prev is not None and prev.kind == "ident" and prev.text not in KEYWORDS:
+        return
+    report.issues.append(LintIssue(
+        RULE_DELAY, tokens[i].line,
+        "Delay specification `#` is not allowed.",
+        "Remove all `#` delays from gate instances, assignments and statements."
+    ))
+
+def _is_instantiation(tokens: List[Token], i: int) -> bool:
+    """模块实例：<类型> [#(...)] <实例名> [[范围]] ("""
+    j = i + 1
+    if j < len(tokens) and tokens[j].text == "#":
+        j += 1
+        if j < len(tokens) and tokens[j].text == "(":
+            j = _skip_group(tokens, j, "(", ")")
+        else:
+            j += 1
+    if j >= len(tokens) or tokens[j].kind != "ident" or tokens[j].text in KEYWORDS:
+        return False
+    j += 1
+    if j < len(tokens) and tokens[j].text == "[":
+        j = _skip_group(tokens, j, "[", "]")
+    return j < len(tokens) and tokens[j].text == "("
+
+def _skip_group(tokens: List[Token], j: int, open_text: str, close_text: str) -> int:
+    """跳过配对的括号，返回其后的位置"""
+    depth = 0
+    while j < len(tokens):
+        if tokens[j].text == open_text:
+            depth += 1
+        elif tokens[j].text == close_text:
+            depth -= 1
+            if depth == 0:
+                return j + 1
+        j += 1
+    return j
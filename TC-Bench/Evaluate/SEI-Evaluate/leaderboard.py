@@ -0,0 +1,200 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Shared leaderboard loader / SEI helpers for the SEI-Evaluate scripts.
+# All leaderboard CSVs are concatenated once into a single frame indexed by
+# (Subfolder, RANK); challenge and difficulty group are categorical columns, so
+# SEI, group aggregates and percentiles are plain groupby operations.
+
+# Mapping between Subfolder (task ID) and leaderboard CSV filename
+SUBFOLDER_TO_FILE = {
+    '1_not_gate': 'NOT Gate.csv',
+    '2_second_tick': 'Second Tick.csv',
+    '3_xor_gate': 'XOR Gate.csv',
+    '4_or3_gate': 'Bigger OR Gate.csv',
+    '5_and3_gate': 'Bigger AND Gate.csv',
+    '6_xnor_gate': 'XNOR Gate.csv',
+    '7_double_trouble': 'Double Trouble.csv',
+    '8_odd_signal': 'ODD Number of Signals.csv',
+    '9_counting_signals': 'Counting Signals.csv',
+    '10_half_adder': 'Half Adder.csv',
+    '11_full_adder': 'Full Adder.csv',
+    '12_odd_change': 'Odd Ticks.csv',
+    '13_inverter_1bit': 'Bit Inverter.csv',
+    '14_or_8bit': 'Byte OR.csv',
+    '15_not_8bit': 'Byte NOT.csv',
+    '16_adder_8bit': 'Adding Bytes.csv',
+    '17_mux_8bit': 'Input Selector.csv',
+    '18_opposite_number': 'Signed Negator.csv',
+    '19_elegant_storage': 'Saving Gracefully.csv',
+    '20_store_byte': 'Saving Bytes.csv',
+    '21_decoder_1bit': '1 Bit Decoder.csv',
+    '22_decoder_3bit': '3 Bit Decoder.csv',
+    '23_logic_engine': 'Logic Engine.csv',
+    '24_box': 'Little Box.csv',
+    '25_counter': 'Counter.csv',
+    '26_arithmetic_engine': 'Arithmetic Engine.csv',
+    '27_instruction_decoder': 'Instruction Decoder.csv',
+    '28_conditional_checker': 'Conditions.csv'
+}
+FILE_TO_SUBFOLDER = {filename: subfolder for subfolder, filename in SUBFOLDER_TO_FILE.items()}
+
+# Group information
+GROUPS = {
+    "Easy": [
+        "13_inverter_1bit", "14_or_8bit", "15_not_8bit", "1_not_gate",
+        "21_decoder_1bit", "2_second_tick", "3_xor_gate", "4_or3_gate",
+        "5_and3_gate", "6_xnor_gate"
+    ],
+    "Medium": [
+        "10_half_adder", "16_adder_8bit", "18_opposite_number",
+        "27_instruction_decoder", "8_odd_signal", "11_full_adder",
+        "17_mux_8bit", "22_decoder_3bit", "7_double_trouble",
+        "9_counting_signals"
+    ],
+    "Hard": [
+        "12_odd_change", "19_elegant_storage", "20_store_byte",
+        "23_logic_engine", "24_box", "25_counter",
+        "26_arithmetic_engine", "28_conditional_checker"
+    ]
+}
+SUBFOLDER_TO_GROUP = {subfolder: group for group, subfolders in GROUPS.items() for subfolder in subfolders}
+
+SUBFOLDER_DTYPE = pd.CategoricalDtype(list(SUBFOLDER_TO_FILE))
+GROUP_DTYPE = pd.CategoricalDtype(list(GROUPS), ordered=True)
+
+# Performance levels (from lowest to highest) and the RANK that defines each threshold
+LEVELS = ['Poor (1000)', 'Average (750)', 'Good (500)', 'Excellent (250)']
+LEVEL_RANKS = [1000, 750, 500, 250]
+DEFAULT_THRESHOLDS = [0.0, 0.05, 0.15, 0.25]
+
+
+def _with_categories(df):
+    """Adds categorical Subfolder / Group columns derived from Source_File and computes SEI = 1 / TOTAL if needed."""
+    df['Subfolder'] = df['Source_File'].map(FILE_TO_SUBFOLDER).astype(SUBFOLDER_DTYPE)
+    df['Group'] = df['Subfolder'].map(SUBFOLDER_TO_GROUP).astype(GROUP_DTYPE)
+    df['Source_File'] = df['Source_File'].astype('category')
+    if 'SEI' not in df.columns:
+        df['SEI'] = 1 / df['TOTAL']
+    unknown = df.loc[df['Subfolder'].isna(), 'Source_File'].unique()
+    for source_file in unknown:
+        print(f"Warning: No Subfolder mapping for leaderboard file {source_file}")
+    return df.set_index(['Subfolder', 'RANK'], drop=False).sort_index()
+
+
+def load_leaderboards(folder_path, include_less=False, max_rank=None):
+    """
+    Reads every leaderboard CSV in folder_path (RANK,USER,TOTAL,GATE,DELAY,TICK) into one frame.
+    '-less.csv' variants are skipped unless include_less is set. Returns a frame indexed by
+    (Subfolder, RANK) with Source_File, categorical Subfolder / Group columns and SEI.
+    """
+    frames = []
+    for filename in sorted(os.listdir(folder_path)):
+        if not filename.endswith(".csv") or (filename.endswith("-less.csv") and not include_less):
+            continue
+        try:
+            df = pd.read_csv(os.path.join(folder_path, filename))
+        except Exception as e:
+            print(f"Error reading file {filename}: {e}")
+            continue
+        if "RANK" not in df.columns or "TOTAL" not in df.columns:
+            print(f"Error: File {filename} is missing required columns 'RANK' or 'TOTAL'")
+            continue
+        if max_rank is not None:
+            df = df[df["RANK"] <= max_rank]
+        df.insert(0, 'Source_File', filename)
+        frames.append(df)
+
+    if not frames:
+        print(f"Error: No leaderboard CSV files found in {folder_path}")
+        return _with_categories(pd.DataFrame(columns=['Source_File', 'RANK', 'TOTAL']))
+    return _with_categories(pd.concat(frames, ignore_index=True))
+
+
+def load_combined_csv(file_path):
+    """Reads an already combined leaderboard CSV (Source_File, RANK, SEI, ...) into the same frame layout."""
+    return _with_categories(pd.read_csv(file_path))
+
+
+def geometric_mean(values, floor):
+    """Geometric mean with values below `floor` (e.g. zero SEI) clamped to `floor`."""
+    return float(np.exp(np.mean(np.log(np.maximum(np.asarray(values, dtype=float), floor)))))
+
+
+def sei_at_ranks(leaderboard, ranks):
+    """
+    Long frame of the first SEI entry per (Source_File, RANK) for the requested ranks.
+    Keyed by file rather than Subfolder so files without a Subfolder mapping are not merged together.
+    """
+    subset = leaderboard[leaderboard['RANK'].isin(ranks)]
+    return subset[~subset.duplicated(['Source_File', 'RANK'], keep='first')]
+
+
+def group_geometric_means(leaderboard, ranks, floor=1e-4):
+    """
+    Geometric mean of SEI per RANK over all leaderboard files ('All_Files') and per difficulty group.
+    Returns a frame indexed by RANK with columns All_Files, Easy, Medium, Hard (NaN where no data).
+    """
+    subset = sei_at_ranks(leaderboard, ranks).reset_index(drop=True)
+    subset['log_sei'] = np.log(np.maximum(subset['SEI'].astype(float), floor))
+
+    overall = subset.groupby('RANK')['log_sei'].mean().rename('All_Files')
+    by_group = subset.groupby(['RANK', 'Group'], observed=False)['log_sei'].mean().unstack('Group')
+    result = pd.concat([overall, by_group], axis=1).reindex(pd.Index(ranks, name='RANK'))
+    return np.exp(result)
+
+
+def rank_thresholds(leaderboard, subfolders=None):
+    """
+    Problem-specific SEI thresholds [Poor(1000), Average(750), Good(500), Excellent(250)] per Subfolder.
+    A missing RANK 250 counts as 0.0 and every other missing RANK inherits the next better threshold;
+    if all SEI entries of a problem are equal the thresholds are [0.0, sei, sei, sei].
+    """
+    subset = sei_at_ranks(leaderboard, LEVEL_RANKS).reset_index(drop=True)
+    subset = subset[subset['Subfolder'].notna()] # Thresholds only exist for mapped problems
+    wide = subset.pivot(index='Subfolder', columns='RANK', values='SEI')
+    wide = wide.reindex(columns=LEVEL_RANKS[::-1]) # 250, 500, 750, 1000
+    wide[250] = wide[250].fillna(0.0)
+    wide = wide.ffill(axis=1)[LEVEL_RANKS]
+
+    per_problem = leaderboard.reset_index(drop=True).groupby('Subfolder', observed=True)['SEI']
+    all_equal = per_problem.nunique() == 1
+    first_sei = per_problem.first()
+    wide = wide.reindex(first_sei.index)
+    if all_equal.any():
+        equal_sei = first_sei[all_equal].to_numpy()
+        wide.loc[all_equal, :] = np.column_stack([np.zeros_like(equal_sei), equal_sei, equal_sei, equal_sei])
+
+    if subfolders is not None:
+        missing = [subfolder for subfolder in subfolders if subfolder not in wide.index]
+        for subfolder in missing:
+            print(f"Error: leaderboard data for {subfolder} ({SUBFOLDER_TO_FILE.get(subfolder)}) not found")
+        wide = wide.reindex(list(subfolders))
+        wide.loc[wide.isna().all(axis=1), :] = DEFAULT_THRESHOLDS
+    wide.columns.name = None
+    return wide
+
+
+def classify_levels(sei, thresholds):
+    """
+    Performance level for every cell of `sei` (index Subfolder, one column per model),
+    given thresholds from rank_thresholds(). Returns a frame of LEVELS labels.
+    """
+    th = thresholds.reindex(sei.index)
+    conditions = [sei.ge(th[rank], axis=0) for rank in (250, 500, 750)]
+    labels = np.select(conditions, [LEVELS[3], LEVELS[2], LEVELS[1]], default=LEVELS[0])
+    return pd.DataFrame(labels, index=sei.index, columns=sei.columns)
+
+
+def human_percentiles(leaderboard, sei):
+    """
+    Percentage of leaderboard (human) entries per problem with a strictly lower SEI than the model,
+    for every cell of `sei` (index Subfolder, one column per model). NaN if the problem has no leaderboard.
+    """
+    result = pd.DataFrame(np.nan, index=sei.index, columns=sei.columns)
+    for subfolder, human_sei in leaderboard.reset_index(drop=True).groupby('Subfolder', observed=True)['SEI']:
+        if subfolder in result.index:
+            sorted_sei = np.sort(human_sei.to_numpy(dtype=float))
+            result.loc[subfolder] = 100.0 * np.searchsorted(sorted_sei, sei.loc[subfolder].to_numpy(dtype=float), side='left') / len(sorted_sei)
+    return result
@@ -1,8 +1,41 @@
 import os
 import re
+import glob
+import hashlib
 import argparse # Import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from prettytable import PrettyTable
 
+# Verilog 关键字 / 内建门原语：归一化时保留原样，其余标识符按首次出现顺序重命名
+VERILOG_KEYWORDS = frozenset("""
+    always and assign automatic begin buf bufif0 bufif1 case casex casez cmos deassign default defparam
+    disable edge else end endcase endfunction endgenerate endmodule endprimitive endspecify endtable endtask
+    event for force forever fork function generate genvar highz0 highz1 if ifnone initial inout input integer
+    join large localparam macromodule medium module nand negedge nmos nor not notif0 notif1 or output parameter
+    pmos posedge primitive pull0 pull1 pulldown pullup rcmos real realtime reg release repeat rnmos rpmos rtran
+    rtranif0 rtranif1 scalared signed small specify specparam strong0 strong1 supply0 supply1 table task time
+    tran tranif0 tranif1 tri tri0 tri1 triand trior trireg unsigned vectored wait wand weak0 weak1 while wire
+    wor xnor xor logic
+""".split())
+
+# 词法扫描：注释、字符串、数字、标识符、系统任务、编译指令、其他单字符
+TOKEN_PATTERN = re.compile(r"""
+      (?P<line_comment>//.*)
+    | (?P<block_comment>/\*)
+    | (?P<string>"(?:\\.|[^"\\])*")
+    | (?P<number>(?:\d[\d_]*)?'[sS]?[bBoOdDhH]\s*[0-9a-fA-FxXzZ_?]+|\d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    | (?P<system>\$[A-Za-z0-9_$]+)
+    | (?P<directive>`[A-Za-z_][A-Za-z0-9_]*)
+    | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*|\\\S+)
+    | (?P<space>\s+)
+    | (?P<other>.)
+""", re.VERBOSE)
+
+# SPICE 网表实例行: X<name> <nets...> <device_type>
+SPICE_INSTANCE_PATTERN = re.compile(r'^X(\S+)\s+(.+)\s+(\S+)$', re.IGNORECASE)
+WL_ROUNDS = 3 # Weisfeiler-Lehman 迭代轮数
+
 def get_all_v_files(root_dir):
     """遍历目录，获取所有.v文件的路径"""
     v_files = []
@@ -16,40 +49,170 @@ def get_all_v_files(root_dir):
                 v_files.append(os.path.join(subdir, file))
     return v_files
 
-def read_file_content(file_path):
-    """读取文件内容，使用宽松的编码处理方式"""
+
+class StrippedHasher:
+    """按块增量计算 sha256，结果等价于对 content.strip() 整体求哈希（不保存文件内容）"""
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self._started = False
+        self._pending_ws = ""
+        self.empty = True
+
+    def update(self, text):
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return
+            self._started = True
+        stripped = text.rstrip()
+        if stripped:
+            self._hash.update((self._pending_ws + stripped).encode('utf-8'))
+            self._pending_ws = text[len(stripped):]
+            self.empty = False
+        else:
+            self._pending_ws += text
+
+    def hexdigest(self):
+        return None if self.empty else self._hash.hexdigest()
+
+
+class NormalizedHasher:
+    """去除注释和空白、标识符规范化（按首次出现顺序重命名为 id0, id1, ...）后的 token 流哈希"""
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self._identifiers = {}
+        self._in_block_comment = False
+        self.empty = True
+
+    def _emit(self, token):
+        self._hash.update(token.encode('utf-8') + b' ')
+        self.empty = False
+
+    def update_line(self, line):
+        pos = 0
+        while pos < len(line):
+            if self._in_block_comment:
+                end = line.find('*/', pos)
+                if end < 0:
+                    return
+                self._in_block_comment = False
+                pos = end + 2
+                continue
+
+            match = TOKEN_PATTERN.match(line, pos)
+            kind, token = match.lastgroup, match.group()
+            pos = match.end()
+
+            if kind == 'line_comment':
+                return
+            if kind == 'block_comment':
+                self._in_block_comment = True
+            elif kind == 'space':
+                continue
+            elif kind == 'ident' and token not in VERILOG_KEYWORDS:
+                self._emit(self._identifiers.setdefault(token, f"id{len(self._identifiers)}"))
+            elif kind == 'number':
+                self._emit(re.sub(r'\s+|_', '', token).lower())
+            else:
+                self._emit(token)
+
+    def hexdigest(self):
+        return None if self.empty else self._hash.hexdigest()
+
+
+def hash_verilog_file(file_path):
+    """流式读取文件，同时计算精确哈希与归一化哈希；文件为空或读取失败返回 (None, None)"""
+    exact, normalized = StrippedHasher(), NormalizedHasher()
     try:
         with open(file_path, 'r', encoding='utf-8', errors='ignore') as f: # Use errors='ignore' for more robustness
-            return f.read().strip()
+            for line in f:
+                exact.update(line)
+                normalized.update_line(line)
     except Exception as e:
         print(f"Warning: Could not read file {file_path}: {e}")
-        return None # Return None on error
+        return None, None
+    return exact.hexdigest(), normalized.hexdigest()
+
+
+def find_netlist_for(v_file):
+    """查找 evaluate.sh 为该尝试生成的 SPICE 网表 (<MODULE>_<basename>.sp)"""
+    attempt_dir = os.path.dirname(v_file)
+    stem = os.path.splitext(os.path.basename(v_file))[0]
+    candidates = glob.glob(os.path.join(glob.escape(attempt_dir), f"*_{glob.escape(stem)}.sp"))
+    if not candidates:
+        candidates = glob.glob(os.path.join(glob.escape(attempt_dir), "*.sp"))
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def hash_netlist_structure(sp_file):
+    """
+    对综合后网表做结构哈希：实例按器件类型标注、网络按连接关系标注，
+    经过 Weisfeiler-Lehman 迭代后对实例标签多重集求哈希，与实例名、网络名无关。
+    """
+    instances = [] # [(device_type, [nets...])]
+    try:
+        with open(sp_file, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                line = line.split('*')[0].strip()
+                match = SPICE_INSTANCE_PATTERN.match(line) if line.startswith(('X', 'x')) else None
+                if match:
+                    _, connections, device_type = match.groups()
+                    instances.append((device_type, connections.split()))
+    except Exception as e:
+        print(f"Warning: Could not read netlist {sp_file}: {e}")
+        return None
+    if not instances:
+        return None
+
+    def digest(*parts):
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+    inst_labels = [device_type for device_type, _ in instances]
+    for _ in range(WL_ROUNDS):
+        net_neighbours = defaultdict(list)
+        for label, (_, nets) in zip(inst_labels, instances):
+            for pin, net in enumerate(nets):
+                net_neighbours[net].append(f"{label}:{pin}")
+        net_labels = {net: digest(*sorted(neighbours)) for net, neighbours in net_neighbours.items()}
+        inst_labels = [digest(label, *(net_labels[net] for net in nets))
+                       for label, (_, nets) in zip(inst_labels, instances)]
 
-def compare_files(file_paths):
-    """比较文件内容，并返回不同内容的数量"""
-    contents = {}
+    return digest(*sorted(inst_labels))
+
+
+def compare_files(file_paths, structural=False):
+    """
+    比较文件内容，返回统计字典：
+    files (有效文件数), exact / normalized / structural (不同内容数量),
+    structural_files (找到网表的文件数)。只保留哈希，不保留文件内容。
+    """
+    exact_hashes, normalized_hashes, structural_hashes = set(), set(), set()
     valid_files_read = 0
+    structural_files = 0
     for file_path in file_paths:
-        content = read_file_content(file_path)
+        exact_hash, normalized_hash = hash_verilog_file(file_path)
         # Only process if content was read successfully and is not empty
-        if content: # Check if content is not None and not empty string
-            valid_files_read += 1
-            if content not in contents:
-                contents[content] = []
-            contents[content].append(file_path)
-
-    # Optional: Add a check for minimum valid files if needed
-    # if valid_files_read < 2: # Example threshold
-    #     print(f"Warning: Less than 2 valid Verilog files found in the set starting with {file_paths[0] if file_paths else 'N/A'}")
-
-    # The subtraction of 2 seems arbitrary without context.
-    # Consider removing it or documenting *why* 2 is subtracted.
-    # If it's to exclude reference/template files, maybe filter by filename pattern instead?
-    # Returning raw diversity count for now. Adjust if the -2 logic is confirmed necessary.
-    diversity_count = len(contents)
-    # print(f"Debug: Found {diversity_count} unique contents from {valid_files_read} valid files.") # Debug print
-    # return max(0, diversity_count - 2) # Original logic (use if needed)
-    return diversity_count # Returning raw count
+        if exact_hash is None:
+            continue
+        valid_files_read += 1
+        exact_hashes.add(exact_hash)
+        normalized_hashes.add(normalized_hash)
+        if structural:
+            sp_file = find_netlist_for(file_path)
+            structure_hash = hash_netlist_structure(sp_file) if sp_file else None
+            if structure_hash is not None:
+                structural_files += 1
+                structural_hashes.add(structure_hash)
+
+    return {
+        "files": valid_files_read,
+        "exact": len(exact_hashes),
+        "normalized": len(normalized_hashes),
+        "structural": len(structural_hashes),
+        "structural_files": structural_files,
+    }
 
 
 def extract_number_from_folder_name(folder_name):
@@ -60,66 +223,66 @@ def extract_number_from_folder_name(folder_name):
     # Return a large number for non-numeric prefixes to sort them last/consistently
     return float('inf')
 
-def analyze_subfolders(base_dir):
-    """分析base_dir下的每个子文件夹，输出不同内容数量"""
+def analyze_challenge(subfolder_path, structural=False):
+    """分析单个挑战文件夹（供进程池调用）；没有 .v 文件时返回 None"""
+    # This will find .v files in attempt folders like 'base_dir/challenge/attempt/*.v'
+    v_files = get_all_v_files(subfolder_path)
+    if not v_files:
+        return None
+    return compare_files(sorted(v_files), structural)
+
+def analyze_subfolders(base_dir, structural=False, workers=None):
+    """分析base_dir下的每个子文件夹（并行），输出精确 / 归一化 / 结构重复数量"""
     table = PrettyTable()
-    table.field_names = ["子文件夹 (Challenge)", "不同 Verilog 文件内容数量"]
+    table.field_names = ["子文件夹 (Challenge)", "文件数", "不同 Verilog 文件内容数量", "精确重复", "归一化重复", "结构重复"]
+    table.align = "r"
     table.align["子文件夹 (Challenge)"] = "l"
-    table.align["不同 Verilog 文件内容数量"] = "r"
-
-
-    folder_data = []
 
     if not os.path.isdir(base_dir):
          print(f"Error: Input directory '{base_dir}' not found or is not a directory.")
          return None # Return None to indicate error
 
-    # 遍历base_dir下的每个子文件夹 (challenges)
-    for subfolder_name in sorted(os.listdir(base_dir)): # Sort challenge names for consistent order
-        subfolder_path = os.path.join(base_dir, subfolder_name)
-
-        # 只处理文件夹
-        if os.path.isdir(subfolder_path):
-            # 获取该子文件夹下所有（递归）的 .v 文件
-            # This will find .v files in attempt folders like 'base_dir/challenge/attempt/*.v'
-            v_files = get_all_v_files(subfolder_path)
-
-            # 如果该子文件夹没有 .v 文件，则跳过
-            if not v_files:
-                # print(f"Info: No .v files found in challenge folder: {subfolder_name}")
-                # Optionally add row with 0 count:
-                # folder_data.append([subfolder_name, 0])
-                continue
+    # 遍历base_dir下的每个子文件夹 (challenges)，只处理文件夹
+    subfolders = [name for name in sorted(os.listdir(base_dir)) if os.path.isdir(os.path.join(base_dir, name))]
+    paths = [os.path.join(base_dir, name) for name in subfolders]
 
-            # 计算该子文件夹内的不同内容数量
-            num_different_contents = compare_files(v_files)
+    if workers == 1 or len(paths) <= 1:
+        stats = [analyze_challenge(path, structural) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            stats = list(executor.map(analyze_challenge, paths, [structural] * len(paths)))
 
-            # 将结果添加到数据列表中
-            folder_data.append([subfolder_name, num_different_contents])
+    # 如果该子文件夹没有 .v 文件，则跳过
+    folder_data = [(name, s) for name, s in zip(subfolders, stats) if s is not None]
 
     # 按照文件夹名称中的数字部分从小到大排序
     folder_data.sort(key=lambda x: extract_number_from_folder_name(x[0]))
 
     # 将排序后的数据添加到表格中
-    for row in folder_data:
-        table.add_row(row)
+    for name, s in folder_data:
+        structural_dup = s["structural_files"] - s["structural"] if s["structural_files"] else "-"
+        table.add_row([name, s["files"], s["exact"], s["files"] - s["exact"], s["files"] - s["normalized"], structural_dup])
 
     return table
 
 if __name__ == "__main__":
     # Setup argument parser
-    parser = argparse.ArgumentParser(description="Verilog Diversity Test: Counts unique .v file contents per challenge subfolder.")
+    parser = argparse.ArgumentParser(description="Verilog Diversity Test: Counts exact, normalized and structural duplicate .v files per challenge subfolder.")
     parser.add_argument("--input-dir", required=True,
                         help="Path to the base directory containing challenge subfolders (e.g., model results directory).")
+    parser.add_argument("--structural", action="store_true",
+                        help="Also hash the synthesized SPICE netlist (*.sp) next to each .v file, if present.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes for challenge folders (default: CPU count, 1 = sequential).")
     args = parser.parse_args()
 
     # 分析子文件夹，并打印输出
     print(f"Analyzing Verilog diversity in subfolders of: {args.input_dir}")
-    table = analyze_subfolders(args.input_dir)
+    table = analyze_subfolders(args.input_dir, args.structural, args.workers)
 
     # 打印表格 if analysis was successful
     if table:
         print("\nDiversity Results:")
         print(table)
     else:
-        print("Analysis could not be completed due to errors.")
\ No newline at end of file
+        print("Analysis could not be completed due to errors.")
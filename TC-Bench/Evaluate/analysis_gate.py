@@ -2,6 +2,8 @@ import pandas as pd
 import argparse # Import argparse
 import os
 
+import results_store
+
 def extract_number(subfolder):
     """Extracts the numeric prefix from a subfolder name for sorting"""
     if pd.isna(subfolder):
@@ -14,10 +16,12 @@ def extract_number(subfolder):
         # Return infinity for non-numeric prefixes or errors
         return float('inf')
 
-def main(input_csv_path, output_csv_path):
+def main(input_csv_path, output_csv_path, results_db=None, model_name=None):
     """
     Reads raw experimental results, calculates a combined metric, finds the
     best non-zero result for each challenge, sorts, and saves to a new CSV.
+    If results_db is given, the per-attempt rows are also stored there under
+    model_name so merge/compare scripts can query them without re-reading CSVs.
     """
     print(f"Analyzing results from: {input_csv_path}")
 
@@ -55,6 +59,19 @@ def main(input_csv_path, output_csv_path):
     # Using forward fill (ffill) - more efficient than original loop
     df['Subfolder'] = df['Subfolder'].ffill()
 
+    # --- Append to the results store (read once, reused by merge_gates / model_res_compare_gates) ---
+    if results_db:
+        if not model_name:
+            # Default label matches the '<model>-raw.csv' naming used by evaluate.sh
+            model_name = os.path.basename(input_csv_path).replace("-raw.csv", "")
+        try:
+            conn = results_store.open_store(results_db)
+            stored = results_store.replace_model_attempts(conn, model_name, df.dropna(subset=['Subfolder']))
+            conn.close()
+            print(f"Stored {stored} attempts for model '{model_name}' in results store: {results_db}")
+        except Exception as e:
+            print(f"Warning: Could not update results store {results_db}: {e}")
+
     # Filter out rows where Subfolder is still NaN (header rows, separators) or total is inf
     # Note: NaN total has been filled with inf, so checking for inf covers both cases
     df_filtered = df.dropna(subset=['Subfolder'])
@@ -135,6 +152,8 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Analyzes raw simulation results CSV to find the best result per challenge based on 'Total logic gates' + 'Total delay'.")
     parser.add_argument("--input-csv", required=True, help="Path to the raw results CSV file (output of extract-v2.py).")
     parser.add_argument("--output-csv", required=True, help="Path to save the summarized 'best results' CSV file (e.g., model-less.csv).")
+    parser.add_argument("--results-db", default=None, help="Optional SQLite results store to append the attempts to (see results_store.py).")
+    parser.add_argument("--model", default=None, help="Model name used in the results store (default: input file name without '-raw.csv').")
     args = parser.parse_args()
 
-    main(args.input_csv, args.output_csv)
+    main(args.input_csv, args.output_csv, args.results_db, args.model)
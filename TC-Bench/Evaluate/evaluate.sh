@@ -39,10 +39,13 @@ cp "$BASE_JSON" "$XOR_INPUT_JSON" # Copy the base JSON file to the model output
 XOR_OUTPUT_JSON="$MODEL_OUTPUT_DIR/device_types_simple-$MODEL_NAME.json"
 TEMP_XOR_RESULTS="$MODEL_OUTPUT_DIR/.xor_gate_temp_results.txt"
 MAIN_LOG_FILE="$MODEL_OUTPUT_DIR/$MODEL_NAME-run.log"
+RESULTS_JSONL="$MODEL_OUTPUT_DIR/$MODEL_NAME-results.jsonl"
 DIVERSITY_LOG_FILE="$MODEL_OUTPUT_DIR/$MODEL_NAME-diversity.log"
 RAW_CSV_FILE="$MODEL_OUTPUT_DIR/$MODEL_NAME-raw.csv"
 LESS_CSV_FILE="$MODEL_OUTPUT_DIR/$MODEL_NAME-less.csv"
 PASS_RATIO_CSV="$PASS_RATIO_DIR/${MODEL_NAME}_Pass_Results.csv"
+# SQLite results store shared by all models (written by analysis_gate.py, read by merge/compare)
+RESULTS_DB="$OUTPUT_BASE_DIR/results.db"
 PASS_RATIO_PLOT_P1="$PASS_RATIO_DIR/${MODEL_NAME}_pass1.png"
 PASS_RATIO_PLOT_P5="$PASS_RATIO_DIR/${MODEL_NAME}_pass5.png"
 PASS_RATIO_LOG="$PASS_RATIO_DIR/${MODEL_NAME}_PassRatio_calc.log"
@@ -124,6 +127,9 @@ fi
 
 # 3. Run batch simulations for other challenges
 echo -e "\nRunning batch simulations for challenges..."
+# run.sh appends one structured record per attempt to this file
+: > "$RESULTS_JSONL"
+export RESULTS_JSONL
 # Call the batch script located in $SCRIPT_DIR
 execute_command "$SCRIPT_DIR/$BATCH_RUN_SCRIPT" \
     "$MODEL_SRC_DIR" \
@@ -132,13 +138,14 @@ execute_command "$SCRIPT_DIR/$BATCH_RUN_SCRIPT" \
 
 # --- Subsequent Steps (4-9) ---
 echo -e "\nAnalyzing Verilog code diversity..."
-execute_command python3 "$SCRIPT_DIR/Verilog_Diversity_Test.py" --input-dir "$MODEL_SRC_DIR" | tee "$DIVERSITY_LOG_FILE"
+execute_command python3 "$SCRIPT_DIR/Verilog_Diversity_Test.py" --input-dir "$MODEL_SRC_DIR" --structural | tee "$DIVERSITY_LOG_FILE"
 
 echo -e "\nExtracting results from log file..."
-execute_command python3 "$SCRIPT_DIR/extract.py" --log-file "$MAIN_LOG_FILE" --output-csv "$RAW_CSV_FILE"
+execute_command python3 "$SCRIPT_DIR/extract.py" --results-jsonl "$RESULTS_JSONL" --log-file "$MAIN_LOG_FILE" --output-csv "$RAW_CSV_FILE"
 
 echo -e "\nAnalyzing raw results to find best per challenge..."
-execute_command python3 "$SCRIPT_DIR/analysis_gate.py" --input-csv "$RAW_CSV_FILE" --output-csv "$LESS_CSV_FILE"
+execute_command python3 "$SCRIPT_DIR/analysis_gate.py" --input-csv "$RAW_CSV_FILE" --output-csv "$LESS_CSV_FILE" \
+    --results-db "$RESULTS_DB" --model "$MODEL_NAME"
 
 echo -e "\nCalculating pass ratios..."
 execute_command python3 "$SCRIPT_DIR/pass_ratio.py" \
@@ -153,10 +160,10 @@ execute_command python3 "$SCRIPT_DIR/pass_ratio.py" \
 echo -e "\nMerging results from all models (if other models exist)..."
 INPUT_DIR_FOR_MERGE="$OUTPUT_BASE_DIR/ModelTest"
 # It might be more user-friendly to check if $INPUT_DIR_FOR_MERGE contains more than one *-less.csv file before executing
-execute_command python3 "$SCRIPT_DIR/merge_gates.py" --input-dir "$INPUT_DIR_FOR_MERGE" --output-csv "$MERGED_CSV_FILE"
+execute_command python3 "$SCRIPT_DIR/merge_gates.py" --input-dir "$INPUT_DIR_FOR_MERGE" --output-csv "$MERGED_CSV_FILE" --results-db "$RESULTS_DB"
 
 echo -e "\nGenerating comparison plot (if other models exist)..."
 INPUT_DIR_FOR_PLOT="$OUTPUT_BASE_DIR/ModelTest"
-execute_command python3 "$SCRIPT_DIR/model_res_compare_gates.py" --input-dir "$INPUT_DIR_FOR_PLOT" --output-png "$COMPARE_PLOT_PNG"
+execute_command python3 "$SCRIPT_DIR/model_res_compare_gates.py" --input-dir "$INPUT_DIR_FOR_PLOT" --output-png "$COMPARE_PLOT_PNG" --results-db "$RESULTS_DB"
 
 echo -e "\nEvaluation script finished for model: $MODEL_NAME"
@@ -3,6 +3,8 @@ import csv
 import argparse # Import argparse
 import os
 
+from result_sink import iter_records
+
 def extract_delay_path_gates(output):
     """Extract Longest delay, Longest path, Total logic gates, and Total delay from script output."""
     # Make patterns slightly more robust to whitespace variations
@@ -32,168 +34,201 @@ def extract_delay_path_gates(output):
         "Total delay": total_delay_match.group(1) if total_delay_match else None,
     }
 
-def process_outputs(log_contents):
-    """Process multiple outputs from a log file and extract required information."""
-    # Split based on the "Executing" line pattern
-    executions = re.split(r"--> Executing '.*?' in '(.*?)'", log_contents)
-    results = []
-    failed_simulations = [] # Store paths/info of failed simulations
-
-    # The split results in: [text_before_first_exec, path1, output1, path2, output2, ...]
-    if len(executions) < 3:
+EXECUTING_PATTERN = re.compile(r"--> Executing '.*?' in '(.*?)'")
+FIELDNAMES = ["Subfolder", "Child Folder", "Longest delay (ns)", "Longest path", "Total logic gates", "Total delay"]
+
+
+def split_attempt_path(full_path):
+    """Split '.../challenge_name/attempt_name' into (challenge, attempt)."""
+    path_parts = full_path.replace("\\", "/").strip('/').split('/')
+    if len(path_parts) >= 2:
+        return path_parts[-2], path_parts[-1]
+    print(f"Warning: Could not determine challenge/attempt from path: {full_path}")
+    return "Unknown", os.path.basename(full_path) # Best guess
+
+
+def detect_log_failure(output):
+    """Legacy failure detection on the free-form output of one attempt. Returns a reason or None."""
+    if "Running simulation..." not in output: # Basic check if simulation even started
+        return "Simulation start message not found."
+    if "Test failed:" in output: # General failure message
+        fail_reason_match = re.search(r"Test failed:(.*)", output)
+        return fail_reason_match.group(1).strip() if fail_reason_match else "No success message found or specific reason missing."
+    if "ERROR:" in output and "Execution of" in output and "failed" in output: # Check for run-v2.sh error messages
+        fail_reason_match = re.search(r"ERROR:.*failed \((.*)\)", output)
+        return fail_reason_match.group(1).strip() if fail_reason_match else "Script execution failed (run-v2.sh error)."
+    # Add other failure patterns here if needed...
+    return None
+
+
+def iter_log_blocks(log_file):
+    """Stream a run.sh log line by line, yielding (attempt path, output) per '--> Executing' block.
+    Only the current block is kept in memory."""
+    found_block = False
+    current_path, block_lines = None, []
+
+    with open(log_file, "r", encoding='utf-8', errors='ignore') as file:
+        for line in file:
+            match = EXECUTING_PATTERN.search(line)
+            if match:
+                if current_path is not None:
+                    yield current_path, "".join(block_lines)
+                found_block = True
+                current_path = match.group(1).strip()
+                block_lines = [line[match.end():]]
+            elif current_path is not None:
+                block_lines.append(line)
+        if current_path is not None:
+            yield current_path, "".join(block_lines)
+
+    if not found_block:
         print("Warning: Could not find any '--> Executing' blocks in the log content.")
-        return results, failed_simulations
 
-    current_challenge_folder = None
 
-    # Iterate through path/output pairs
-    for i in range(1, len(executions), 2):
-        full_path = executions[i].strip()
-        output = executions[i+1].strip() if (i+1) < len(executions) else ""
-
-        # Extract challenge folder and attempt folder names from the path
-        # Assumes path structure like ".../challenge_name/attempt_name"
-        path_parts = full_path.replace("\\", "/").strip('/').split('/')
-        if len(path_parts) >= 2:
-            attempt_folder = path_parts[-1]
-            challenge_folder = path_parts[-2]
+def iter_log_attempts(log_file, failed_simulations):
+    """Yield one (challenge, attempt, metrics) per '--> Executing' block of a run.sh log."""
+    for current_path, output in iter_log_blocks(log_file):
+        reason = detect_log_failure(output)
+        if reason:
+            failed_simulations.append({"path": current_path, "reason": reason})
+        challenge_folder, attempt_folder = split_attempt_path(current_path)
+        yield challenge_folder, attempt_folder, extract_delay_path_gates(output)
+
+
+def read_log_outcomes(log_file, paths):
+    """Failure reason and metrics from the run log for the given attempt paths (absolute). Other blocks are skipped."""
+    outcomes = {}
+    for current_path, output in iter_log_blocks(log_file):
+        path = os.path.abspath(current_path)
+        if path in paths:
+            outcomes[path] = (detect_log_failure(output), extract_delay_path_gates(output))
+    return outcomes
+
+
+def iter_jsonl_attempts(jsonl_file, failed_simulations, log_file=None):
+    """Stream structured per-attempt records written by run.sh (see result_sink.py).
+    Attempts without a status file (stage 'unknown', e.g. folders set up with an older run.sh)
+    take their metrics and failure reason from the run log when one is given."""
+    legacy_paths = {os.path.abspath(record.get("path", "")) for record in iter_records(jsonl_file)
+                    if record.get("stage") == "unknown"}
+    log_outcomes = {}
+    if legacy_paths:
+        if log_file and os.path.isfile(log_file):
+            print(f"{len(legacy_paths)} attempt(s) have no status file; reading them from {log_file}")
+            log_outcomes = read_log_outcomes(log_file, legacy_paths)
         else:
-            print(f"Warning: Could not determine challenge/attempt from path: {full_path}")
-            attempt_folder = os.path.basename(full_path) # Best guess
-            challenge_folder = "Unknown" # Best guess
-
-        # Check for simulation failure messages
-        # Use elif to avoid adding to failed list multiple times for one block
-        is_failure = False
-        if "Running simulation..." not in output and "Executing" in log_contents: # Basic check if simulation even started
-             # Avoid flagging the very first split part if it lacks "Executing"
-             if i > 0 : # Check if it's not the text before the first execution block
-                 failed_simulations.append({ "path": full_path, "reason": "Simulation start message not found."})
-                 is_failure = True
-        elif "Test failed:" in output: # General failure message
-            # Try to capture the specific reason if available
-            fail_reason_match = re.search(r"Test failed:(.*)", output)
-            reason = fail_reason_match.group(1).strip() if fail_reason_match else "No success message found or specific reason missing."
-            failed_simulations.append({ "path": full_path, "reason": reason})
-            is_failure = True
-        elif "ERROR:" in output and "Execution of" in output and "failed" in output: # Check for run-v2.sh error messages
-             fail_reason_match = re.search(r"ERROR:.*failed \((.*)\)", output)
-             reason = fail_reason_match.group(1).strip() if fail_reason_match else "Script execution failed (run-v2.sh error)."
-             failed_simulations.append({ "path": full_path, "reason": reason})
-             is_failure = True
-        # Add other failure patterns here if needed...
-
-
-        # Add a separator row when the challenge folder changes
-        if challenge_folder != current_challenge_folder:
-            # Only add separator if it's not the very first entry
-            if current_challenge_folder is not None:
-                 results.append({}) # Add an empty dict for a blank row in CSV
-            results.append({"Subfolder": challenge_folder, "Child Folder": "", "Longest delay (ns)": "",
-                            "Longest path": "", "Total logic gates": "", "Total delay": ""})
-            current_challenge_folder = challenge_folder
-
-        extracted_data = extract_delay_path_gates(output)
-
-        # Combine path info with extracted metrics
-        row_data = {
-            "Subfolder": "", # Keep this blank for data rows
-            "Child Folder": attempt_folder,
-            "Longest delay (ns)": extracted_data["Longest delay (ns)"],
-            "Longest path": extracted_data["Longest path"],
-            "Total logic gates": extracted_data["Total logic gates"],
-            "Total delay": extracted_data["Total delay"],
-            # Optionally add a 'Status' column
-            # "Status": "Failed" if is_failure else "Success" # Mark failures explicitly
+            print(f"Warning: {len(legacy_paths)} attempt(s) have no status file and no run log was given; "
+                  f"their metrics are missing. Re-run setup_challenge_scripts.sh or pass --log-file.")
+
+    for record in iter_records(jsonl_file):
+        status, reason = record.get("status"), record.get("reason")
+        metrics = {
+            "Longest delay (ns)": record.get("longest_delay_ns"),
+            "Longest path": record.get("longest_path"),
+            "Total logic gates": record.get("total_gates"),
+            "Total delay": record.get("total_delay"),
         }
-        results.append(row_data)
-
-    return results, failed_simulations
+        outcome = log_outcomes.get(os.path.abspath(record.get("path", ""))) if record.get("stage") == "unknown" else None
+        if outcome is not None:
+            log_reason, metrics = outcome
+            if log_reason:
+                status, reason = "fail", log_reason
+        if status != "pass":
+            failed_simulations.append({"path": record.get("path", ""), "reason": reason or "Unknown failure."})
+        yield record.get("challenge", "Unknown"), record.get("attempt", ""), metrics
+
+
+def format_row(row_dict):
+    """Convert None to empty strings and make Child Folder an integer where possible."""
+    new_row = {col: row_dict.get(col) for col in FIELDNAMES}
+    for col in FIELDNAMES:
+        if new_row[col] is None:
+            new_row[col] = ''
+    try:
+        new_row['Child Folder'] = int(new_row['Child Folder'])
+    except (ValueError, TypeError):
+        pass # Keep original value (e.g. header row's empty string)
+    return new_row
 
-def save_to_csv(data, csv_filename):
-    """Save extracted data to a CSV file, converting None to empty strings."""
-    os.makedirs(os.path.dirname(csv_filename), exist_ok=True)
-    fieldnames = ["Subfolder", "Child Folder", "Longest delay (ns)", "Longest path", "Total logic gates", "Total delay"]
 
+def write_csv_stream(attempts, csv_filename):
+    """Write attempts to CSV as they arrive, with a header row per challenge and a blank separator row
+    between challenges. The file is only created once the first attempt is seen. Returns the number of attempts written."""
+    csvfile, writer = None, None
+    current_challenge_folder = None
+    count = 0
     try:
-        # Preprocess data: Convert None to '' for specific columns before writing
-        processed_data = []
-        cols_to_process_for_none = ["Longest delay (ns)", "Total logic gates", "Total delay"] # Columns where None might appear and should be ''
-        for row_dict in data:
-            new_row = row_dict.copy() # Work on a copy
-            for col in fieldnames: # Ensure all fields exist even if empty
-                if col not in new_row:
-                     new_row[col] = '' # Or None, depending on desired output for completely missing columns
-
-            for col in cols_to_process_for_none:
-                if col in new_row and new_row[col] is None:
-                    new_row[col] = '' # Replace None with empty string
-
-            # Child Folder should be integer if present
-            if 'Child Folder' in new_row and new_row['Child Folder'] is not None:
-                 try:
-                     # Attempt conversion, keep original if error (e.g., it's already a header row's empty string)
-                     new_row['Child Folder'] = int(new_row['Child Folder'])
-                 except (ValueError, TypeError):
-                     pass # Keep original value if conversion fails
-
-            processed_data.append(new_row)
-
-        with open(csv_filename, mode='w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
-            writer.writeheader()
-            # Write the processed data
-            writer.writerows(processed_data)
-        print(f"Data successfully saved to {csv_filename}")
-    except IOError as e:
-        print(f"Error writing to CSV file {csv_filename}: {e}")
-    except Exception as e:
-         print(f"An unexpected error occurred during CSV writing: {e}")
+        for challenge_folder, attempt_folder, metrics in attempts:
+            if writer is None:
+                os.makedirs(os.path.dirname(csv_filename) or ".", exist_ok=True)
+                csvfile = open(csv_filename, mode='w', newline='', encoding='utf-8')
+                writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES, extrasaction='ignore')
+                writer.writeheader()
+
+            # Add a separator row when the challenge folder changes
+            if challenge_folder != current_challenge_folder:
+                if current_challenge_folder is not None:
+                    writer.writerow(format_row({})) # Blank row between challenges
+                writer.writerow(format_row({"Subfolder": challenge_folder}))
+                current_challenge_folder = challenge_folder
+
+            row_data = dict(metrics)
+            row_data["Subfolder"] = "" # Keep this blank for data rows
+            row_data["Child Folder"] = attempt_folder
+            writer.writerow(format_row(row_data))
+            count += 1
+    finally:
+        if csvfile is not None:
+            csvfile.close()
+    return count
 
 
 # Main function
 if __name__ == "__main__":
     # Setup argument parser
-    parser = argparse.ArgumentParser(description="Extracts simulation results from a log file generated by run-v2.sh.")
-    parser.add_argument("--log-file", required=True, help="Path to the input log file containing simulation outputs.")
+    parser = argparse.ArgumentParser(description="Extracts simulation results from the structured result JSONL (preferred) or a run.sh log file.")
+    parser.add_argument("--results-jsonl", default=None, help="Path to the per-attempt result JSONL written by run.sh (RESULTS_JSONL).")
+    parser.add_argument("--log-file", default=None, help="Path to the run.sh log file (used when no usable JSONL is given).")
     parser.add_argument("--output-csv", required=True, help="Path to save the extracted results in CSV format.")
     args = parser.parse_args()
 
-    log_file = args.log_file
     csv_file = args.output_csv
-
-    print(f"Processing log file: {log_file}")
+    failed_simulations = [] # Store paths/info of failed simulations
 
     try:
-        # Read with robust encoding handling
-        with open(log_file, "r", encoding='utf-8', errors='ignore') as file:
-            log_contents = file.read()
-
-        if not log_contents:
-            print(f"Warning: Log file '{log_file}' is empty.")
-            results, failed_simulations = [], []
+        if args.results_jsonl and os.path.isfile(args.results_jsonl) and os.path.getsize(args.results_jsonl) > 0:
+            print(f"Processing result records: {args.results_jsonl}")
+            attempts = iter_jsonl_attempts(args.results_jsonl, failed_simulations, args.log_file)
+        elif args.log_file:
+            if args.results_jsonl:
+                print(f"Warning: Result JSONL '{args.results_jsonl}' missing or empty. Falling back to log parsing.")
+            print(f"Processing log file: {args.log_file}")
+            attempts = iter_log_attempts(args.log_file, failed_simulations)
         else:
-            results, failed_simulations = process_outputs(log_contents)
+            parser.error("one of --results-jsonl or --log-file is required")
 
-        # Save results to CSV
-        if results:
-            save_to_csv(results, csv_file)
+        written = write_csv_stream(attempts, csv_file)
+        if written:
+            print(f"Data successfully saved to {csv_file} ({written} attempts)")
         else:
-            print("No results were extracted from the log file.")
+            print("No results were extracted.")
 
         # Print paths of failed simulations
         if failed_simulations:
             print("\n--- Failed Simulations Detected ---")
-            # Use a set to show unique paths if the same path failed multiple ways
-            unique_failed_paths = {failure['path'] for failure in failed_simulations}
-            for path in sorted(list(unique_failed_paths)):
-                 reasons = [f['reason'] for f in failed_simulations if f['path'] == path]
-                 print(f"Path: {path}\n  Reason(s): {'; '.join(reasons)}")
+            # Group reasons per path (the same path may fail multiple ways)
+            reasons_by_path = {}
+            for failure in failed_simulations:
+                reasons_by_path.setdefault(failure['path'], []).append(failure['reason'])
+            for path in sorted(reasons_by_path):
+                print(f"Path: {path}\n  Reason(s): {'; '.join(reasons_by_path[path])}")
             print("---------------------------------")
         else:
-            print("\nNo simulation failures detected in the log.")
+            print("\nNo simulation failures detected.")
 
-    except FileNotFoundError:
-        print(f"Error: Input log file '{log_file}' not found.")
+    except FileNotFoundError as e:
+        print(f"Error: Input file not found: {e.filename}")
+    except IOError as e:
+        print(f"Error writing to CSV file {csv_file}: {e}")
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
\ No newline at end of file
+        print(f"An unexpected error occurred: {e}")
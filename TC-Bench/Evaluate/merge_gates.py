@@ -4,6 +4,8 @@ import glob
 import argparse # Import argparse
 from datetime import datetime
 
+import results_store
+
 # Challenge mapping (kept inside function for now, could be loaded from external JSON/CSV)
 CHALLENGE_MAPPING = {
     "1_not_gate": "NOT Gate", "2_second_tick": "Second Tick", "3_xor_gate": "XOR Gate",
@@ -29,14 +31,10 @@ def extract_number(subfolder):
         return int(num_part)
     except: return float('inf')
 
-def merge_experiment_results(input_dir, output_csv_path):
+def load_gates_from_csv(input_dir):
     """
-    Merges 'Total logic gates' from multiple '*-less.csv' files found in input_dir
-    into a single CSV file, mapping challenge names and sorting.
-
-    Args:
-        input_dir (str): Directory containing the '*-less.csv' files.
-        output_csv_path (str): Path to save the merged output CSV file.
+    Reads 'Total logic gates' from every '*-less.csv' found in input_dir and aligns them
+    on 'Subfolder' in a single concat (instead of one outer merge per file).
     """
     print(f"Searching for '*-less.csv' files in: {input_dir}")
     search_pattern = os.path.join(input_dir, '**', '*-less.csv') # Recursive search
@@ -44,13 +42,13 @@ def merge_experiment_results(input_dir, output_csv_path):
 
     if not csv_files:
         print(f"Error: No '*-less.csv' files found in '{input_dir}' or its subdirectories.")
-        return
+        return None
 
     print(f"Found {len(csv_files)} files to merge:")
     for f in csv_files:
         print(f"  - {f}")
 
-    dataframes = []
+    columns = []
 
     for csv_file in csv_files:
         # Extract model/file label from filename
@@ -58,7 +56,7 @@ def merge_experiment_results(input_dir, output_csv_path):
         print(f"  Processing: {file_label} from {csv_file}")
 
         try:
-            df = pd.read_csv(csv_file)
+            df = pd.read_csv(csv_file, usecols=lambda col: col in ('Subfolder', 'Total logic gates'))
         except Exception as e:
             print(f"Warning: Could not read or process {csv_file}. Skipping. Error: {e}")
             continue
@@ -69,20 +67,74 @@ def merge_experiment_results(input_dir, output_csv_path):
             print(f"Warning: {csv_file} missing required columns ('Subfolder', 'Total logic gates'). Skipped.")
             continue
 
-        # Keep only necessary columns and rename gates column
-        df_select = df[useful_columns].copy() # Use copy
-        df_select.rename(columns={'Total logic gates': f'{file_label}_gates'}, inplace=True)
-        dataframes.append(df_select)
+        gates = df.drop_duplicates('Subfolder').set_index('Subfolder')['Total logic gates']
+        columns.append(gates.rename(f'{file_label}_gates'))
 
-    if not dataframes:
+    if not columns:
         print("Error: No valid data could be extracted from any input CSV files. Merge aborted.")
-        return
+        return None
+
+    return pd.concat(columns, axis=1, join='outer').rename_axis('Subfolder').reset_index()
+
+
+def load_gates_from_store(results_db):
+    """Reads the best 'Total logic gates' per model and challenge from the results store in one query."""
+    print(f"Reading best results from results store: {results_db}")
+    try:
+        conn = results_store.open_store(results_db)
+        merged_df = results_store.gates_by_challenge(conn)
+        conn.close()
+    except Exception as e:
+        print(f"Error reading results store {results_db}: {e}")
+        return None
 
-    # Merge all dataframes based on 'Subfolder'
-    # Start with the first dataframe, then iteratively merge others
-    merged_df = dataframes[0]
-    for df_to_merge in dataframes[1:]:
-        merged_df = pd.merge(merged_df, df_to_merge, on='Subfolder', how='outer')
+    if len(merged_df.columns) <= 1:
+        print(f"Error: Results store '{results_db}' contains no results.")
+        return None
+    print(f"Found {len(merged_df.columns) - 1} models in results store.")
+    return merged_df
+
+
+def add_models_missing_from_store(merged_df, input_dir):
+    """
+    Adds the models that only exist as '*-less.csv' files (evaluated before the results store
+    existed) to the gates read from the store. Models present in the store keep the store values.
+    """
+    if not glob.glob(os.path.join(input_dir, '**', '*-less.csv'), recursive=True):
+        return merged_df
+    csv_df = load_gates_from_csv(input_dir)
+    if csv_df is None:
+        return merged_df
+    if merged_df is None:
+        return csv_df
+
+    missing = [col for col in csv_df.columns if col != 'Subfolder' and col not in merged_df.columns]
+    if not missing:
+        return merged_df
+    print(f"Adding {len(missing)} models found only in '*-less.csv' files: {', '.join(col[:-len('_gates')] for col in missing)}")
+    return merged_df.merge(csv_df[['Subfolder'] + missing], on='Subfolder', how='outer')
+
+
+def merge_experiment_results(input_dir, output_csv_path, results_db=None):
+    """
+    Merges 'Total logic gates' from multiple models into a single CSV file,
+    mapping challenge names and sorting.
+
+    Args:
+        input_dir (str): Directory containing the '*-less.csv' files (used when no results store is given).
+        output_csv_path (str): Path to save the merged output CSV file.
+        results_db (str): Optional SQLite results store (see results_store.py). Models missing from
+            the store are still read from their '*-less.csv' files.
+    """
+    if results_db and os.path.isfile(results_db):
+        merged_df = add_models_missing_from_store(load_gates_from_store(results_db), input_dir)
+    else:
+        if results_db:
+            print(f"Warning: Results store '{results_db}' not found. Falling back to '*-less.csv' files.")
+        merged_df = load_gates_from_csv(input_dir)
+
+    if merged_df is None:
+        return
 
     # --- Sorting ---
     # Add sorting key and sort by challenge number
@@ -112,6 +164,7 @@ if __name__ == "__main__":
     parser.add_argument("--input-dir", required=True,
                         help="Directory containing the '*-less.csv' files (one per model/run). Can search recursively.")
     parser.add_argument("--output-csv", required=True, help="Path to save the merged output CSV file.")
+    parser.add_argument("--results-db", default=None, help="Optional SQLite results store (see results_store.py); models missing from it are read from the CSV files.")
     args = parser.parse_args()
 
-    merge_experiment_results(args.input_dir, args.output_csv)
\ No newline at end of file
+    merge_experiment_results(args.input_dir, args.output_csv, args.results_db)
\ No newline at end of file
@@ -5,6 +5,8 @@ import glob
 import argparse # Import argparse
 from datetime import datetime
 
+import results_store
+
 def extract_number(subfolder):
     """Extracts the numeric prefix from a subfolder name for sorting."""
     if pd.isna(subfolder): return float('inf')
@@ -13,15 +15,8 @@ def extract_number(subfolder):
         return int(num_part)
     except: return float('inf')
 
-def plot_experiment_results(input_dir, output_png_path):
-    """
-    Reads multiple *-less.csv files from an input directory, plots 'Total logic gates'
-    for each model against challenge names (sorted numerically) on a single scatter plot.
-
-    Args:
-        input_dir (str): Directory containing the '*-less.csv' files for different models.
-        output_png_path (str): Path to save the output PNG plot.
-    """
+def load_model_results_from_csv(input_dir):
+    """Reads every '*-less.csv' in input_dir into a list of {'name', 'data'} entries."""
     print(f"Searching for '*-less.csv' files in: {input_dir}")
     # Use recursive=True if files might be nested deeper (e.g., input_dir/model_name/model-less.csv)
     # Adjust pattern if needed. Assuming structure: input_dir/model_name-less.csv
@@ -30,14 +25,12 @@ def plot_experiment_results(input_dir, output_png_path):
 
     if not csv_files:
         print(f"Error: No '*-less.csv' files found in '{input_dir}' or its subdirectories.")
-        return
+        return []
 
     print(f"Found {len(csv_files)} files to compare:")
     for f in csv_files:
         print(f"  - {f}")
 
-    plt.figure(figsize=(15, 7)) # Adjusted figure size for potentially many levels
-
     all_data = []  # Store data for plotting
 
     for csv_file in csv_files:
@@ -71,11 +64,64 @@ def plot_experiment_results(input_dir, output_png_path):
         else:
             print(f"Warning: No valid data found in {csv_file} after cleaning.")
 
+    return all_data
+
+
+def load_model_results_from_store(results_db):
+    """Reads the best result per model and challenge from the results store in one query."""
+    print(f"Reading best results from results store: {results_db}")
+    try:
+        conn = results_store.open_store(results_db)
+        best = results_store.best_results(conn)
+        conn.close()
+    except Exception as e:
+        print(f"Error reading results store {results_db}: {e}")
+        return []
+
+    best['level_number'] = best['Subfolder'].apply(extract_number)
+    best = best.sort_values(['Model', 'level_number'])
+    return [{'name': model_name, 'data': df_model} for model_name, df_model in best.groupby('Model', sort=True)]
+
+
+def add_models_missing_from_store(all_data, input_dir):
+    """
+    Adds the models that only exist as '*-less.csv' files (evaluated before the results store
+    existed) to the results read from the store. Models present in the store keep the store values.
+    """
+    if not glob.glob(os.path.join(input_dir, '**', '*-less.csv'), recursive=True):
+        return all_data
+    store_models = {entry['name'] for entry in all_data}
+    missing = [entry for entry in load_model_results_from_csv(input_dir) if entry['name'] not in store_models]
+    if missing:
+        print(f"Adding {len(missing)} models found only in '*-less.csv' files: {', '.join(entry['name'] for entry in missing)}")
+    return all_data + missing
+
+
+def plot_experiment_results(input_dir, output_png_path, results_db=None):
+    """
+    Plots 'Total logic gates' for each model against challenge names (sorted numerically)
+    on a single scatter plot. Data comes from the results store if given, otherwise from
+    the '*-less.csv' files in input_dir.
+
+    Args:
+        input_dir (str): Directory containing the '*-less.csv' files for different models.
+        output_png_path (str): Path to save the output PNG plot.
+        results_db (str): Optional SQLite results store (see results_store.py). Models missing from
+            the store are still read from their '*-less.csv' files.
+    """
+    if results_db and os.path.isfile(results_db):
+        all_data = add_models_missing_from_store(load_model_results_from_store(results_db), input_dir)
+    else:
+        if results_db:
+            print(f"Warning: Results store '{results_db}' not found. Falling back to '*-less.csv' files.")
+        all_data = load_model_results_from_csv(input_dir)
+
     if not all_data:
         print("Error: No valid data could be extracted from any input CSV file. Plot cannot be generated.")
-        plt.close() # Close the empty figure
         return
 
+    plt.figure(figsize=(15, 7)) # Adjusted figure size for potentially many levels
+
     # --- Plotting ---
     # Collect all unique, sorted challenge names for the x-axis
     all_challenges = pd.concat([d['data']['Subfolder'] for d in all_data]).unique()
@@ -123,6 +169,7 @@ if __name__ == "__main__":
     parser.add_argument("--input-dir", required=True,
                         help="Directory containing the '*-less.csv' files (one per model/run). Can search recursively.")
     parser.add_argument("--output-png", required=True, help="Path to save the output comparison plot PNG file.")
+    parser.add_argument("--results-db", default=None, help="Optional SQLite results store (see results_store.py); models missing from it are read from the CSV files.")
     args = parser.parse_args()
 
-    plot_experiment_results(args.input_dir, args.output_png)
\ No newline at end of file
+    plot_experiment_results(args.input_dir, args.output_png, args.results_db)
\ No newline at end of file
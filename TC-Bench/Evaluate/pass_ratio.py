@@ -1,25 +1,10 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 from prettytable import PrettyTable
-import math
+import numpy as np
 import argparse
 import os
 
-# Function to calculate binomial coefficient safely
-def binomial_coefficient(n, k):
-    if k < 0 or k > n:
-        return 0
-    try:
-        # math.comb is preferred and available in Python 3.8+
-        return math.comb(int(n), int(k))
-    except AttributeError:
-        # Fallback for older Python versions (less efficient)
-        return math.factorial(int(n)) // (math.factorial(int(k)) * math.factorial(int(n - k)))
-    except ValueError: # Handle potential non-integer inputs if necessary
-         print(f"Warning: Non-integer input to binomial_coefficient: n={n}, k={k}")
-         return 0
-
-
 def extract_number(subfolder):
     """Extracts the numeric prefix from a subfolder name for sorting."""
     if pd.isna(subfolder): return float('inf')
@@ -29,62 +14,87 @@ def extract_number(subfolder):
     except: return float('inf')
 
 
-def calculate_pass_k(total_trials, successful_trials, k):
-    """Calculates pass@k using the formula 1 - C(failed, k) / C(total, k)."""
-    total_trials = int(total_trials)
-    successful_trials = int(successful_trials)
-    k = int(k)
+def pass_at_k(total_trials, successful_trials, ks):
+    """
+    Vectorized pass@k for arrays of (n, c) pairs and a list of k values.
 
-    if total_trials <= 0 or k <= 0:
-        return 0.0 # Cannot pass if no trials or k is non-positive
+    Uses the numerically stable product form
+        pass@k = 1 - prod_{i=n-c+1}^{n} (1 - k / i)
+    evaluated as a difference of cumulative log sums, so no big-integer binomials are formed.
+    `total_trials` and `successful_trials` broadcast against each other; the result has shape
+    broadcast(n, c).shape + (len(ks),). pass@k is 0 when k > n or n <= 0, and 1 when n - c < k.
+    """
+    n = np.asarray(total_trials, dtype=np.int64)
+    c = np.asarray(successful_trials, dtype=np.int64)
+    n, c = np.broadcast_arrays(n, c)
+    ks = np.asarray(ks, dtype=np.int64).reshape(-1)
+
+    failed = np.clip(n - c, 0, None)
+    max_n = int(n.max()) if n.size else 0
+
+    # log_cum[j, i] = sum_{m=1}^{i} log(1 - k_j / m), only accumulating terms with m > k_j
+    # (terms with m <= k_j are never used: in that case n - c < k and pass@k is 1).
+    i = np.arange(1, max_n + 1, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(i[None, :] > ks[:, None], np.log1p(-ks[:, None] / i[None, :]), 0.0)
+    log_cum = np.concatenate([np.zeros((len(ks), 1)), np.cumsum(terms, axis=1)], axis=1)
+
+    n_idx = np.clip(n, 0, max_n)[..., None]
+    f_idx = np.clip(failed, 0, max_n)[..., None]
+    k_idx = np.arange(len(ks))
+    log_ratio = log_cum[k_idx, n_idx] - log_cum[k_idx, f_idx]
+    result = 1.0 - np.exp(log_ratio)
+
+    result = np.where(failed[..., None] < ks, 1.0, result)
+    result = np.where((n[..., None] <= 0) | (ks <= 0) | (ks > n[..., None]), 0.0, result)
+    # Clamp result between 0 and 1 due to potential float inaccuracies
+    return np.clip(result, 0.0, 1.0)
 
-    failed_trials = total_trials - successful_trials
-    if failed_trials < 0: failed_trials = 0 # Ensure non-negative
 
-    # Denominator: C(total, k)
-    c_total_k = binomial_coefficient(total_trials, k)
-    if c_total_k == 0:
-        # This happens if k > total_trials. If there are enough successful trials (>=k), pass rate is 1.
-        # Otherwise, it's 0. More simply, if you can't pick k total, you can't pick k failures.
-        # If k > total_trials, it's impossible to *not* pass if you have >=k successes (vacuously true?).
-        # Let's define pass@k = 0 if k > total_trials for simplicity, unless successful_trials >= k?
-        # The standard definition implies you need at least k trials.
-        # print(f"Debug: C({total_trials}, {k}) = 0")
-        return 0.0 # Pass@k is typically 0 if k > n
+def bootstrap_pass_at_k(total_trials, successful_trials, ks, n_bootstrap=1000, confidence=0.95, seed=None):
+    """
+    Bootstrap confidence intervals for pass@k.
 
-    # Numerator: C(failed, k)
-    c_failed_k = binomial_coefficient(failed_trials, k)
+    Resampling the n trials of a challenge with replacement is equivalent to drawing the number of
+    successes from Binomial(n, c/n), so all resamples are drawn in one vectorized call.
+    Returns (lower, upper) with shape broadcast(n, c).shape + (len(ks),) for the per-challenge values,
+    and (mean_lower, mean_upper) with shape (len(ks),) for the mean over all given challenges.
+    """
+    n = np.asarray(total_trials, dtype=np.int64)
+    c = np.asarray(successful_trials, dtype=np.int64)
+    n, c = np.broadcast_arrays(n, c)
+    rng = np.random.default_rng(seed)
 
-    # Calculate pass@k: 1 - (Numerator / Denominator)
-    pass_k_ratio = 1.0 - (c_failed_k / c_total_k)
+    p_hat = np.divide(np.clip(c, 0, n), n, out=np.zeros(n.shape, dtype=np.float64), where=n > 0)
+    resampled_c = rng.binomial(n, p_hat, size=(n_bootstrap,) + n.shape)
+    samples = pass_at_k(n, resampled_c, ks) # (B, ..., K)
 
-    # Clamp result between 0 and 1 due to potential float inaccuracies
-    return max(0.0, min(1.0, pass_k_ratio))
+    alpha = (1.0 - confidence) / 2.0
+    lower, upper = np.quantile(samples, [alpha, 1.0 - alpha], axis=0)
 
+    flat = samples.reshape(n_bootstrap, -1, samples.shape[-1]).mean(axis=1) # (B, K)
+    mean_lower, mean_upper = np.quantile(flat, [alpha, 1.0 - alpha], axis=0)
+    return lower, upper, mean_lower, mean_upper
 
-def main(input_csv_path, output_csv_path, plot_pass1_path, plot_pass5_path, total_trials_per_challenge):
-    """
-    Calculates pass@1 and pass@5 from raw results, saves results and plots.
-    """
-    print(f"Calculating pass ratio from: {input_csv_path}")
-    print(f"Assuming {total_trials_per_challenge} total trials per challenge.")
 
+def load_success_counts(input_csv_path, run_name):
+    """Reads one raw results CSV and returns a DataFrame of (Run, Challenge, Successful Trials)."""
     try:
         data = pd.read_csv(input_csv_path)
     except FileNotFoundError:
         print(f"Error: Input CSV file not found: {input_csv_path}")
-        return
+        return None
     except pd.errors.EmptyDataError:
          print(f"Error: Input CSV file is empty: {input_csv_path}")
-         return
+         return None
     except Exception as e:
         print(f"Error reading CSV file {input_csv_path}: {e}")
-        return
+        return None
 
     # Ensure required columns exist
     if not all(col in data.columns for col in ['Subfolder', 'Total logic gates']):
          print(f"Error: Input CSV missing required columns ('Subfolder', 'Total logic gates'). Found: {list(data.columns)}")
-         return
+         return None
 
     # --- Data Preparation ---
     # Forward fill the 'Subfolder' to associate attempts with challenges
@@ -95,52 +105,77 @@ def main(input_csv_path, output_csv_path, plot_pass1_path, plot_pass5_path, tota
     # This assumes the header rows have empty Child Folder. Adjust if needed.
     data = data[data['Child Folder'].notna() & (data['Child Folder'] != '')]
 
+    # Successful trials: 'Total logic gates' is a valid number
+    success = pd.to_numeric(data['Total logic gates'], errors='coerce').notna()
+    counts = success.groupby(data['Subfolder'], sort=False).sum().astype(int)
+    return pd.DataFrame({
+        'Run': run_name,
+        'Challenge': counts.index,
+        'Successful Trials': counts.to_numpy(),
+    })
 
-    # --- Calculation ---
-    # Group by challenge (Subfolder)
-    # Use observed=True in newer pandas if Subfolder is categorical
-    grouped_data = data.groupby('Subfolder')
-
-    results = []
-    for experiment_name, group in grouped_data:
-        # Count successful trials (where 'Total logic gates' is a valid number)
-        # Convert to numeric first, coercing errors
-        valid_gates = pd.to_numeric(group['Total logic gates'], errors='coerce')
-        successful_trials = valid_gates.notna().sum()
-
-        # Calculate pass@k
-        pass_at_1 = calculate_pass_k(total_trials_per_challenge, successful_trials, 1)
-        pass_at_5 = calculate_pass_k(total_trials_per_challenge, successful_trials, 5)
-
-        results.append({
-            'Challenge': experiment_name,
-            'Total Trials': total_trials_per_challenge,
-            'Successful Trials': successful_trials,
-            'pass@1': pass_at_1,
-            'pass@5': pass_at_5
-        })
-
-    if not results:
+
+def run_name_from_path(input_csv_path):
+    """Derives a run label from a raw CSV path (e.g. '.../qwen-raw.csv' -> 'qwen')."""
+    name = os.path.splitext(os.path.basename(input_csv_path))[0]
+    return name[:-len('-raw')] if name.endswith('-raw') else name
+
+
+def main(input_csv_paths, output_csv_path, plot_pass1_path, plot_pass5_path, total_trials_per_challenge,
+         k_values=(1, 5), n_bootstrap=0, confidence=0.95, seed=None):
+    """
+    Calculates pass@k for one or more raw result CSVs (models / runs) in a single vectorized pass,
+    optionally with bootstrap confidence intervals, then saves results and the pass@1 / pass@5 plots.
+    """
+    if isinstance(input_csv_paths, str):
+        input_csv_paths = [input_csv_paths]
+    # pass@1 and pass@5 are always computed since they are plotted
+    k_values = sorted(set(int(k) for k in k_values) | {1, 5})
+    metric_names = [f'pass@{k}' for k in k_values]
+
+    print(f"Calculating pass ratio from: {', '.join(input_csv_paths)}")
+    print(f"Assuming {total_trials_per_challenge} total trials per challenge.")
+
+    frames = []
+    for input_csv_path in input_csv_paths:
+        counts = load_success_counts(input_csv_path, run_name_from_path(input_csv_path))
+        if counts is not None and not counts.empty:
+            frames.append(counts)
+
+    if not frames:
         print("Error: No results could be calculated. Check input data and grouping.")
         return
 
-    # Convert results to DataFrame for sorting and saving
-    results_df = pd.DataFrame(results)
+    # --- Calculation ---
+    results_df = pd.concat(frames, ignore_index=True)
+    results_df.insert(2, 'Total Trials', int(total_trials_per_challenge))
+    total = results_df['Total Trials'].to_numpy()
+    success = results_df['Successful Trials'].to_numpy()
+
+    pass_values = pass_at_k(total, success, k_values) # (rows, K)
+    for j, metric in enumerate(metric_names):
+        results_df[metric] = pass_values[:, j]
+
+    if n_bootstrap > 0:
+        print(f"Bootstrapping {n_bootstrap} resamples for {confidence:.0%} confidence intervals...")
+        lower, upper, _, _ = bootstrap_pass_at_k(total, success, k_values, n_bootstrap, confidence, seed)
+        for j, metric in enumerate(metric_names):
+            results_df[f'{metric} CI low'] = lower[:, j]
+            results_df[f'{metric} CI high'] = upper[:, j]
+
+    multi_run = results_df['Run'].nunique() > 1
+    if not multi_run:
+        results_df = results_df.drop(columns=['Run'])
 
     # --- Sorting ---
     # Add sorting key based on numeric prefix and sort
-    results_df['sort_key'] = results_df['Challenge'].apply(extract_number)
-    sorted_results_df = results_df.sort_values('sort_key').drop(columns=['sort_key'])
+    results_df['sort_key'] = results_df['Challenge'].map(extract_number)
+    sort_columns = (['Run'] if multi_run else []) + ['sort_key']
+    sorted_results_df = results_df.sort_values(sort_columns, kind='stable').drop(columns=['sort_key'])
 
     # --- Saving Results CSV ---
     os.makedirs(os.path.dirname(output_csv_path), exist_ok=True)
     try:
-        # Ensure count columns are standard integers before saving
-        # These columns should not have NaNs in the final results_df
-        if not sorted_results_df.empty:
-            sorted_results_df['Total Trials'] = sorted_results_df['Total Trials'].astype(int)
-            sorted_results_df['Successful Trials'] = sorted_results_df['Successful Trials'].astype(int)
-
         # Save with float formatting for pass rates
         sorted_results_df.to_csv(output_csv_path, index=False, float_format='%.4f')
         print(f"Pass ratio results saved to: {output_csv_path}")
@@ -149,9 +184,32 @@ def main(input_csv_path, output_csv_path, plot_pass1_path, plot_pass5_path, tota
     except Exception as e:
          print(f"An error occurred during processing or saving {output_csv_path}: {e}")
 
-
+    # --- Per-run means ---
+    if multi_run or n_bootstrap > 0:
+        print("\n--- Mean pass@k per Run ---")
+        summary = PrettyTable()
+        summary.field_names = ["Run"] + metric_names
+        summary.align = "r"
+        summary.align["Run"] = "l"
+        run_labels = sorted_results_df['Run'] if multi_run else pd.Series('all', index=sorted_results_df.index)
+        for run_name, run_rows in sorted_results_df.groupby(run_labels, sort=False).groups.items():
+            rows = sorted_results_df.loc[run_rows]
+            cells = [f"{v:.4f}" for v in rows[metric_names].mean().to_numpy()]
+            if n_bootstrap > 0:
+                _, _, mean_low, mean_high = bootstrap_pass_at_k(
+                    rows['Total Trials'].to_numpy(), rows['Successful Trials'].to_numpy(),
+                    k_values, n_bootstrap, confidence, seed)
+                cells = [f"{cell} [{lo:.4f}, {hi:.4f}]" for cell, lo, hi in zip(cells, mean_low, mean_high)]
+            summary.add_row([run_name] + cells)
+        print(summary)
 
     # --- Generating Plots ---
+    # With several runs the bars show the mean over runs for each challenge
+    plot_df = sorted_results_df
+    if multi_run:
+        plot_df = sorted_results_df.groupby('Challenge', sort=False)[metric_names].mean().reset_index()
+        plot_df = plot_df.iloc[plot_df['Challenge'].map(extract_number).argsort(kind='stable')]
+
     plot_metrics = {
         'pass@1': plot_pass1_path,
         'pass@5': plot_pass5_path
@@ -164,7 +222,7 @@ def main(input_csv_path, output_csv_path, plot_pass1_path, plot_pass5_path, tota
 
         os.makedirs(os.path.dirname(plot_path), exist_ok=True)
         plt.figure(figsize=(15, 7)) # Wider figure
-        plt.bar(sorted_results_df['Challenge'], sorted_results_df[metric], alpha=0.8, width=0.8) # Adjust width
+        plt.bar(plot_df['Challenge'], plot_df[metric], alpha=0.8, width=0.8) # Adjust width
         plt.title(f'{metric.upper()} Performance by Challenge (Sorted)')
         plt.xlabel('Challenge')
         plt.ylabel(metric.upper())
@@ -184,34 +242,33 @@ def main(input_csv_path, output_csv_path, plot_pass1_path, plot_pass5_path, tota
     # --- PrettyTable Output ---
     print("\n--- Pass Ratio Summary ---")
     table = PrettyTable()
-    table.field_names = ["Challenge", "Total Trials", "Successful", "pass@1", "pass@5"]
-    table.align = "l" # Align left
-    table.align["Total Trials"] = "r"
-    table.align["Successful"] = "r"
-    table.align["pass@1"] = "r"
-    table.align["pass@5"] = "r"
-
-
-    for _, row in sorted_results_df.iterrows():
-        table.add_row([
-            row['Challenge'],
-            row['Total Trials'],
-            row['Successful Trials'],
-            f"{row['pass@1']:.4f}", # Format floats
-            f"{row['pass@5']:.4f}"
-        ])
+    leading = (["Run"] if multi_run else []) + ["Challenge", "Total Trials", "Successful"]
+    table.field_names = leading + metric_names
+    table.align = "r"
+    for field in leading[:-2]:
+        table.align[field] = "l" # Align names left
+
+    # Build rows column-wise instead of iterating DataFrame rows
+    columns = [sorted_results_df[col].tolist() for col in (["Run"] if multi_run else []) + ["Challenge", "Total Trials", "Successful Trials"]]
+    columns += [[f"{v:.4f}" for v in sorted_results_df[metric].to_numpy()] for metric in metric_names]
+    table.add_rows([list(row) for row in zip(*columns)])
 
     print(table)
     print("------------------------")
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Calculates pass@1 and pass@5 based on raw simulation results.")
-    parser.add_argument("--input-csv", required=True, help="Path to the raw results CSV file (output of extract-v2.py).")
+    parser = argparse.ArgumentParser(description="Calculates pass@k (vectorized, optional bootstrap CIs) based on raw simulation results.")
+    parser.add_argument("--input-csv", required=True, nargs='+', help="Path(s) to raw results CSV file(s) (output of extract.py). Several files are treated as separate models/runs.")
     parser.add_argument("--output-results-csv", required=True, help="Path to save the calculated pass ratio results CSV.")
     parser.add_argument("--output-plot-pass1", required=True, help="Path to save the pass@1 performance plot PNG.")
     parser.add_argument("--output-plot-pass5", required=True, help="Path to save the pass@5 performance plot PNG.")
     parser.add_argument("--total-trials", type=int, default=20, help="Assumed total number of trials per challenge (default: 20).")
+    parser.add_argument("--k", type=int, nargs='+', default=[1, 5], help="k values to compute pass@k for (default: 1 5; 1 and 5 are always included).")
+    parser.add_argument("--bootstrap", type=int, default=0, help="Number of bootstrap resamples for confidence intervals (default: 0, disabled).")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level for bootstrap intervals (default: 0.95).")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for bootstrap resampling.")
     args = parser.parse_args()
 
-    main(args.input_csv, args.output_results_csv, args.output_plot_pass1, args.output_plot_pass5, args.total_trials)
\ No newline at end of file
+    main(args.input_csv, args.output_results_csv, args.output_plot_pass1, args.output_plot_pass5, args.total_trials,
+         k_values=args.k, n_bootstrap=args.bootstrap, confidence=args.confidence, seed=args.seed)
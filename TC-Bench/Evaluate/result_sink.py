@@ -0,0 +1,130 @@
+import os
+import json
+import argparse
+import time
+
+# Structured per-attempt result sink.
+# run.sh appends one JSON line per attempt (see `append` below); extract.py
+# streams the file back instead of scraping the free-form run log.
+
+FAILURE_REASONS = {
+    # (stage, exit code of that stage) -> human readable reason
+    ("validation", 2): "Simulation timed out.",
+    ("validation", 1): "Validation failed (compile error or testbench mismatch).",
+    ("evaluation", 1): "Performance evaluation failed (synthesis or gate/delay analysis).",
+}
+
+
+def read_status_file(status_path):
+    """Read the key=value status file written by the attempt's run.sh."""
+    status = {}
+    if not os.path.isfile(status_path):
+        return status
+    with open(status_path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            key, sep, value = line.strip().partition("=")
+            if sep:
+                status[key] = value
+    return status
+
+
+def read_metrics_file(metrics_path):
+    """Read the metrics JSON written by Gates-delay-calulate.py (--metrics_json)."""
+    if not os.path.isfile(metrics_path):
+        return {}
+    try:
+        with open(metrics_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"Warning: Could not read metrics file {metrics_path}: {e}")
+        return {}
+
+
+def _to_float(value):
+    try:
+        return round(float(value), 3)
+    except (TypeError, ValueError):
+        return None
+
+
+def build_record(attempt_dir, exit_code, started_at, finished_at):
+    """Assemble one attempt record from the files left behind in the attempt directory."""
+    attempt_dir = os.path.abspath(attempt_dir)
+    status = read_status_file(os.path.join(attempt_dir, ".attempt_status"))
+
+    stage = status.get("stage")
+    if stage is None:
+        # No status file: the attempt's run.sh predates the status file (challenge folders not re-set up
+        # with setup_challenge_scripts.sh) or aborted before validation. extract.py reads the metrics and
+        # failure reason of such attempts from the run log instead.
+        stage = "unknown"
+    passed = exit_code == 0 and stage in ("done", "unknown")
+    # Only a completed evaluation produced this attempt's metrics; anything else may be stale
+    metrics = read_metrics_file(os.path.join(attempt_dir, ".attempt_metrics.json")) if stage == "done" else {}
+
+    reason = None
+    if stage == "validation":
+        # validate.sh exits 2 on simulation timeout, 1 on any other failure
+        reason = FAILURE_REASONS[("validation", 2 if status.get("validate_status") == "2" else 1)]
+    elif stage == "evaluation":
+        reason = FAILURE_REASONS[("evaluation", 1)]
+    elif stage == "unknown" and not passed:
+        reason = f"Attempt script failed before writing a status file (Exit code: {exit_code})."
+    elif not passed:
+        reason = f"Attempt script failed during {stage} (Exit code: {exit_code})."
+
+    return {
+        "challenge": os.path.basename(os.path.dirname(attempt_dir)),
+        "attempt": os.path.basename(attempt_dir),
+        "path": attempt_dir,
+        "status": "pass" if passed else "fail",
+        "stage": stage,
+        "reason": reason,
+        "exit_code": exit_code,
+        "longest_delay_ns": metrics.get("longest_delay_ns"),
+        "longest_path": metrics.get("longest_path"),
+        "total_gates": metrics.get("total_gates"),
+        "total_delay": metrics.get("total_delay"),
+        "validate_seconds": _to_float(status.get("validate_seconds")),
+        "evaluate_seconds": _to_float(status.get("evaluate_seconds")),
+        "wall_seconds": _to_float(finished_at - started_at),
+        "started_at": started_at,
+        "finished_at": finished_at,
+    }
+
+
+def append_record(jsonl_path, record):
+    """Append a single record as one line. Each write is a single small append, so concurrent writers do not interleave."""
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with open(jsonl_path, "a", encoding="utf-8") as f:
+        f.write(line)
+        f.flush()
+
+
+def iter_records(jsonl_path):
+    """Stream records from a result JSONL file, skipping malformed (e.g. truncated) lines."""
+    with open(jsonl_path, "r", encoding="utf-8", errors="ignore") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Warning: Skipping malformed record at {jsonl_path}:{line_no}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append a structured per-attempt result record (called by run.sh).")
+    parser.add_argument("--jsonl", required=True, help="Path to the result JSONL file to append to.")
+    parser.add_argument("--attempt-dir", required=True, help="Attempt directory that was just executed.")
+    parser.add_argument("--exit-code", type=int, required=True, help="Exit code of the attempt's run.sh.")
+    parser.add_argument("--start", type=float, required=True, help="Start time (epoch seconds).")
+    parser.add_argument("--end", type=float, default=None, help="End time (epoch seconds, defaults to now).")
+    args = parser.parse_args()
+
+    end_time = args.end if args.end is not None else time.time()
+    try:
+        append_record(args.jsonl, build_record(args.attempt_dir, args.exit_code, args.start, end_time))
+    except OSError as e:
+        print(f"Error writing result record to {args.jsonl}: {e}")
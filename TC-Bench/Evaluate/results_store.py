@@ -0,0 +1,149 @@
+import os
+import glob
+import sqlite3
+import argparse
+import pandas as pd
+
+# SQLite results store shared by analysis_gate.py (writer) and merge_gates.py /
+# model_res_compare_gates.py (readers). One row per attempt and model; the best
+# attempt per (model, challenge) is an indexed view instead of a re-parse of every *-less.csv.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    model            TEXT    NOT NULL,
+    challenge        TEXT    NOT NULL,
+    attempt          TEXT    NOT NULL,
+    seq              INTEGER NOT NULL, -- row order in the raw CSV, used as tie-breaker like idxmin()
+    longest_delay_ns REAL,
+    longest_path     TEXT,
+    total_gates      INTEGER,
+    total_delay      INTEGER,
+    PRIMARY KEY (model, challenge, attempt)
+);
+CREATE INDEX IF NOT EXISTS idx_attempts_challenge ON attempts (challenge, model);
+
+-- Best non-zero (gates + delay) attempt per model and challenge, same rule as analysis_gate.py
+CREATE VIEW IF NOT EXISTS best_results AS
+SELECT model, challenge, attempt, longest_delay_ns, longest_path, total_gates, total_delay, total
+FROM (
+    SELECT *, total_gates + total_delay AS total,
+           ROW_NUMBER() OVER (PARTITION BY model, challenge
+                              ORDER BY total_gates + total_delay, seq) AS rn
+    FROM attempts
+    WHERE total_gates IS NOT NULL AND total_delay IS NOT NULL
+      AND total_gates + total_delay > 0
+)
+WHERE rn = 1;
+"""
+
+# Store column -> column name used in the raw / less CSV files
+CSV_COLUMNS = {
+    "challenge": "Subfolder",
+    "attempt": "Child Folder",
+    "longest_delay_ns": "Longest delay (ns)",
+    "longest_path": "Longest path",
+    "total_gates": "Total logic gates",
+    "total_delay": "Total delay",
+}
+
+
+def open_store(db_path):
+    """Opens (and creates if needed) the results store."""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _attempt_label(value):
+    """Attempt folder names are numeric in practice but read back as floats (0.0) next to blank header rows."""
+    try:
+        return str(int(float(value)))
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _nullable(value, cast):
+    if pd.isna(value):
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def replace_model_attempts(conn, model, df):
+    """
+    Replaces all attempts of `model` with the rows of a raw results DataFrame.
+    `df` uses the raw CSV column names and must already have 'Subfolder' forward-filled;
+    challenge header / separator rows (empty 'Child Folder') are skipped.
+    """
+    attempts = df[df['Child Folder'].notna() & (df['Child Folder'].astype(str) != '')]
+    gates = pd.to_numeric(attempts['Total logic gates'], errors='coerce')
+    delay = pd.to_numeric(attempts['Total delay'], errors='coerce')
+    longest = pd.to_numeric(attempts['Longest delay (ns)'], errors='coerce') if 'Longest delay (ns)' in attempts.columns else pd.Series(index=attempts.index, dtype='float64')
+    paths = attempts['Longest path'] if 'Longest path' in attempts.columns else pd.Series(index=attempts.index, dtype='object')
+
+    rows = [
+        (model, str(challenge), _attempt_label(attempt), seq,
+         _nullable(ld, float), _nullable(path, str), _nullable(g, int), _nullable(d, int))
+        for seq, (challenge, attempt, ld, path, g, d) in enumerate(
+            zip(attempts['Subfolder'], attempts['Child Folder'], longest, paths, gates, delay))
+    ]
+    with conn:
+        conn.execute("DELETE FROM attempts WHERE model = ?", (model,))
+        conn.executemany("INSERT OR REPLACE INTO attempts VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+
+def ingest_raw_csv(conn, model, raw_csv_path):
+    """Reads one *-raw.csv (output of extract.py) and stores it under `model`."""
+    df = pd.read_csv(raw_csv_path)
+    df['Subfolder'] = df['Subfolder'].ffill()
+    return replace_model_attempts(conn, model, df.dropna(subset=['Subfolder']))
+
+
+def list_models(conn):
+    return [row[0] for row in conn.execute("SELECT DISTINCT model FROM attempts ORDER BY model")]
+
+
+def best_results(conn, models=None):
+    """Best attempt per (model, challenge) as a DataFrame with a 'Model' column plus the less-CSV columns."""
+    query = "SELECT * FROM best_results"
+    params = ()
+    if models:
+        query += f" WHERE model IN ({','.join('?' * len(models))})"
+        params = tuple(models)
+    df = pd.read_sql_query(query, conn, params=params)
+    return df.rename(columns={"model": "Model", **CSV_COLUMNS})
+
+
+def gates_by_challenge(conn, models=None):
+    """Wide table: one row per challenge ('Subfolder'), one '<model>_gates' column per model."""
+    best = best_results(conn, models)
+    if best.empty:
+        return pd.DataFrame(columns=['Subfolder'])
+    wide = best.pivot(index='Subfolder', columns='Model', values='Total logic gates').astype('Int64')
+    wide.columns = [f'{model}_gates' for model in wide.columns]
+    return wide.reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Imports existing '*-raw.csv' result files into the SQLite results store.")
+    parser.add_argument("--db", required=True, help="Path to the results store (e.g. Results/Pass-Results/results.db).")
+    parser.add_argument("--import-dir", required=True, help="Directory searched recursively for '*-raw.csv' files (model name = file name without '-raw.csv').")
+    args = parser.parse_args()
+
+    conn = open_store(args.db)
+    raw_files = sorted(glob.glob(os.path.join(args.import_dir, '**', '*-raw.csv'), recursive=True))
+    if not raw_files:
+        print(f"Error: No '*-raw.csv' files found in '{args.import_dir}' or its subdirectories.")
+    for raw_file in raw_files:
+        model_name = os.path.basename(raw_file)[:-len('-raw.csv')]
+        try:
+            count = ingest_raw_csv(conn, model_name, raw_file)
+            print(f"  Imported {count} attempts for model '{model_name}' from {raw_file}")
+        except Exception as e:
+            print(f"Warning: Could not import {raw_file}. Skipping. Error: {e}")
+    conn.close()
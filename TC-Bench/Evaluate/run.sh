@@ -1,5 +1,8 @@
 #!/bin/bash
 
+# Directory of this script (used to locate result_sink.py)
+SCRIPT_DIR=$( cd -- "$( dirname -- "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )
+
 # --- Functions ---
 
 # Function to check if a folder contains any non-empty .v files
@@ -29,7 +32,7 @@ execute_script() {
     # echo "    Script full path: $script_path"
 
     local start_time end_time duration status
-    start_time=$(date +%s)
+    start_time=$(date +%s.%N)
 
     # Execute in a subshell to isolate cd
     (
@@ -37,8 +40,18 @@ execute_script() {
         bash "$script_name"
     )
     status=$? # Capture exit status of the subshell/script
-    end_time=$(date +%s)
-    duration=$((end_time - start_time))
+    end_time=$(date +%s.%N)
+    duration=$(awk "BEGIN {printf \"%d\", $end_time - $start_time}")
+
+    # Append a structured record for this attempt (consumed by extract.py)
+    if [[ -n "$RESULTS_JSONL" ]]; then
+        python3 "$SCRIPT_DIR/result_sink.py" \
+            --jsonl "$RESULTS_JSONL" \
+            --attempt-dir "$folder_path" \
+            --exit-code "$status" \
+            --start "$start_time" \
+            --end "$end_time"
+    fi
 
     if [[ $status -ne 0 ]]; then
         # More prominent error message
@@ -121,8 +121,11 @@ else
 fi
 
 PYTHON_SCRIPT2="$METRIC_SCRIPT_DIR_ABS/Gates-delay-calulate.py"
+# Structured metrics for the result sink (read by the outer run.sh, see result_sink.py)
+METRICS_JSON="${ATTEMPT_DIR}/.attempt_metrics.json"
+rm -f "$METRICS_JSON"
 if [ -f "$PYTHON_SCRIPT2" ]; then
-    python3 "$PYTHON_SCRIPT2" --sp_file "$SPICE_FILE_ABS" --device_type_file "$DEVICE_JSON_PATH" 
+    python3 "$PYTHON_SCRIPT2" --sp_file "$SPICE_FILE_ABS" --device_type_file "$DEVICE_JSON_PATH" --metrics_json "$METRICS_JSON"
     PY2_EXIT_CODE=$?
     if [ $PY2_EXIT_CODE -ne 0 ]; then 
         echo "Error (evaluate.sh): $PYTHON_SCRIPT2 failed (Code: $PY2_EXIT_CODE)."; 
@@ -18,27 +18,44 @@ EVALUATE_SCRIPT="../evaluate.sh"
 if [ ! -f "$VALIDATE_SCRIPT" ]; then echo "Error: validate.sh not found in parent directory."; exit 1; fi
 if [ ! -f "$EVALUATE_SCRIPT" ]; then echo "Error: evaluate.sh not found in parent directory."; exit 1; fi
 
+# Stage status file for the result sink (key=value lines, read by the outer run.sh)
+# Clear the previous run's status and metrics so a failed re-run never reports stale gates
+STATUS_FILE="${ATTEMPT_DIR}/.attempt_status"
+METRICS_FILE="${ATTEMPT_DIR}/.attempt_metrics.json"
+rm -f "$STATUS_FILE" "$METRICS_FILE"
+
 # Run Validation, pass the Verilog file path
 echo "Attempt $(basename $ATTEMPT_DIR): Running Validation..."
+VALIDATE_START=$(date +%s.%N)
 bash "$VALIDATE_SCRIPT" "$VERILOG_FILE" # Use bash
 VALIDATE_STATUS=$?
+VALIDATE_END=$(date +%s.%N)
+echo "validate_status=$VALIDATE_STATUS" >> "$STATUS_FILE"
+echo "validate_seconds=$(awk "BEGIN {print $VALIDATE_END - $VALIDATE_START}")" >> "$STATUS_FILE"
 
 # Use robust check for non-zero exit status
 if [ "$VALIDATE_STATUS" != "0" ]; then
     echo "Attempt $(basename $ATTEMPT_DIR): Validation failed (Exit code: $VALIDATE_STATUS)."
+    echo "stage=validation" >> "$STATUS_FILE"
     exit 1
 fi
 
 # Run Performance Evaluation, pass the Verilog file path
 echo "Attempt $(basename $ATTEMPT_DIR): Running Performance Evaluation..."
+EVALUATE_START=$(date +%s.%N)
 bash "$EVALUATE_SCRIPT" "$VERILOG_FILE" # Use bash
 EVALUATE_STATUS=$?
+EVALUATE_END=$(date +%s.%N)
+echo "evaluate_status=$EVALUATE_STATUS" >> "$STATUS_FILE"
+echo "evaluate_seconds=$(awk "BEGIN {print $EVALUATE_END - $EVALUATE_START}")" >> "$STATUS_FILE"
 
 # Use robust check for non-zero exit status
 if [ "$EVALUATE_STATUS" != "0" ]; then
      echo "Attempt $(basename $ATTEMPT_DIR): Performance evaluation failed (Exit code: $EVALUATE_STATUS)."
+     echo "stage=evaluation" >> "$STATUS_FILE"
      exit 1
 fi
 
+echo "stage=done" >> "$STATUS_FILE"
 echo "Attempt $(basename $ATTEMPT_DIR): Processing completed successfully."
 exit 0
\ No newline at end of file
@@ -232,7 +232,7 @@ def visualize_graph(nodes, graph, longest_path, external_ports, output_file):
 
     dot.render(output_file, view=False)
 
-def main(sp_file, device_types_path):
+def main(sp_file, device_types_path, metrics_json=None):
     # 加载设备类型信息
     try:
         with open(device_types_path, "r") as json_file:
@@ -280,6 +280,17 @@ def main(sp_file, device_types_path):
         cumulative_delay = max_delay.get(node, 0)
         print(f"{node}: {cumulative_delay} ns (增加 {incremental_delay} ns)")
     print(f"Total delay: {cumulative_delay}")
+
+    # 结构化结果写入 (供 run.sh / extract.py 使用, 避免解析 stdout)
+    if metrics_json:
+        metrics = {
+            "longest_delay_ns": max_delay.get('OUT', 0),
+            "longest_path": " -> ".join(longest_path),
+            "total_gates": logic_gate_count,
+            "total_delay": cumulative_delay,
+        }
+        with open(metrics_json, "w", encoding="utf-8") as f:
+            json.dump(metrics, f)
     # 可视化
     output = sp_file.split("/")[-1].split(".sp")[0]
     visualize_graph(nodes, graph, longest_path, external_ports, output + '-delay')
@@ -296,7 +307,12 @@ if __name__ == "__main__":
         required=True, 
         help="The corresponding device type JSON file."
     )
+    parser.add_argument(
+        "--metrics_json",
+        default=None,
+        help="Optional path to write the gate/delay metrics as JSON (consumed by the result sink)."
+    )
     args = parser.parse_args()
 
     # 调用主函数并传递参数
-    main(args.sp_file, args.device_type_file)
\ No newline at end of file
+    main(args.sp_file, args.device_type_file, args.metrics_json)
\ No newline at end of file